@@ -0,0 +1,67 @@
+"""
+Latency benchmark: per-request httpx client vs the shared keep-alive pool
+
+Usage (from the fastapi/ directory):
+    python -m benchmarks.bench_http_pool --requests 500 --concurrency 10
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import time
+from typing import List
+
+import httpx
+
+from benchmarks.mock_hetzner import MockHetznerServer, create_mock_app
+
+def summarize(label: str, samples: List[float]):
+    quantiles = statistics.quantiles(samples, n=100)
+    print(
+        f"{label:<22} n={len(samples):<6} "
+        f"p50={quantiles[49] * 1000:7.2f}ms  p99={quantiles[98] * 1000:7.2f}ms  "
+        f"mean={statistics.mean(samples) * 1000:7.2f}ms"
+    )
+
+async def run(requests: int, concurrency: int, make_client, shared: bool) -> List[float]:
+    from services.hetzner_client import HetznerClient
+
+    samples: List[float] = []
+    semaphore = asyncio.Semaphore(concurrency)
+    shared_client = make_client() if shared else None
+
+    async def one(server_id: int):
+        async with semaphore:
+            start = time.perf_counter()
+            if shared:
+                await HetznerClient(shared_client).get_server(server_id)
+            else:
+                # Previous behaviour: a fresh client (and connection) per call
+                async with make_client() as client:
+                    await HetznerClient(client).get_server(server_id)
+            samples.append(time.perf_counter() - start)
+
+    await asyncio.gather(*(one(i % 100 + 1) for i in range(requests)))
+    if shared_client is not None:
+        await shared_client.aclose()
+    return samples
+
+async def main(args):
+    async with MockHetznerServer(create_mock_app(latency_ms=args.latency), port=args.port) as mock:
+        os.environ["HETZNER_API_URL"] = mock.base_url
+        from services.hetzner_client import create_http_client
+
+        before = await run(args.requests, args.concurrency, lambda: httpx.AsyncClient(timeout=30.0), shared=False)
+        after = await run(args.requests, args.concurrency, create_http_client, shared=True)
+
+    summarize("per-request client", before)
+    summarize("shared pooled client", after)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--latency", type=float, default=0.0, help="Artificial mock latency in ms")
+    parser.add_argument("--port", type=int, default=8765)
+    asyncio.run(main(parser.parse_args()))
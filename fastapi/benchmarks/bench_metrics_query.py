@@ -0,0 +1,161 @@
+"""
+Metrics query benchmark: vectorized grouping vs a per-row Python loop, and
+streamed column loading vs ORM objects
+
+Compute: synthetic samples (servers x metric types over 24h) grouped the
+way the query endpoint does, at each --sizes entry; the pure-Python
+baseline (dict of lists, sorted percentiles) runs up to --python-max
+samples. Load: --db-samples rows in a temporary SQLite file (or
+DATABASE_URL), read back through the streaming cursor and as ORM objects.
+
+Usage (from the fastapi/ directory):
+    python -m benchmarks.bench_metrics_query --sizes 1000000 10000000
+    python -m benchmarks.bench_metrics_query --db-samples 1000000
+"""
+
+import argparse
+import asyncio
+import math
+import os
+import tempfile
+import time
+from collections import defaultdict
+
+import numpy as np
+
+DAY = 86400
+METRIC_TYPES = ["cpu", "disk_iops", "disk_bandwidth", "network_in", "network_out"]
+
+SCENARIOS = {
+    "fleet p95 by metric": (["metric"], ["avg", "p95"], None),
+    "per server avg/max/p95": (["server", "metric"], ["avg", "max", "p95"], None),
+    "5m buckets p50/p99": (["metric", "time"], ["p50", "p99"], 300),
+    "per server rate": (["server", "metric"], ["rate"], None),
+}
+
+def make_samples(size: int, servers: int):
+    from services.metrics_query import SampleSet
+    rng = np.random.default_rng(42)
+    return SampleSet(
+        sid=rng.integers(1, servers + 1, size),
+        mtype=rng.integers(0, len(METRIC_TYPES), size),
+        ts=np.sort(rng.integers(0, DAY, size)),
+        vs=rng.random(size) * 100,
+        labels=METRIC_TYPES
+    )
+
+def python_baseline(samples, group_by, aggregations, interval):
+    """What a loop over ORM rows would do: group into lists, sort each for percentiles"""
+    groups = defaultdict(list)
+    for sid, mtype, ts, value in zip(samples.sid.tolist(), samples.mtype.tolist(), samples.ts.tolist(), samples.vs.tolist()):
+        key = (
+            sid if "server" in group_by else None,
+            mtype if "metric" in group_by else None,
+            ts // interval if "time" in group_by else None
+        )
+        groups[key].append((sid, mtype, ts, value))
+    out = {}
+    for key, points in groups.items():
+        values = sorted(point[3] for point in points)
+        row = {}
+        for name in aggregations:
+            if name == "avg":
+                row[name] = sum(values) / len(values)
+            elif name == "max":
+                row[name] = values[-1]
+            elif name.startswith("p"):
+                position = (len(values) - 1) * int(name[1:]) / 100
+                lower = math.floor(position)
+                upper = min(lower + 1, len(values) - 1)
+                row[name] = values[lower] + (values[upper] - values[lower]) * (position - lower)
+            elif name == "rate":
+                series = defaultdict(list)
+                for sid, mtype, ts, value in points:
+                    series[sid, mtype].append(value)
+                increase = sum(b - a if b >= a else b for values_ in series.values() for a, b in zip(values_, values_[1:]))
+                span = max(point[2] for point in points) - min(point[2] for point in points)
+                row[name] = increase / span if span else None
+        out[key] = row
+    return out
+
+def bench_compute(args):
+    from services.metrics_query import group_samples
+
+    for size in args.sizes:
+        samples = make_samples(size, args.servers)
+        print(f"\n{size:,} samples, {args.servers} servers x {len(METRIC_TYPES)} metric types")
+        for name, (group_by, aggregations, interval) in SCENARIOS.items():
+            start = time.perf_counter()
+            result = group_samples(samples, group_by, aggregations, interval)
+            vectorized = time.perf_counter() - start
+            groups = len(next(iter(result["values"].values())))
+            line = f"  {name:<24} groups={groups:<7} numpy={vectorized * 1000:9.1f}ms"
+            if size <= args.python_max:
+                start = time.perf_counter()
+                python_baseline(samples, group_by, aggregations, interval or 1)
+                looped = time.perf_counter() - start
+                line += f"  python={looped * 1000:9.1f}ms  x{looped / vectorized:5.1f}"
+            print(line)
+
+async def bench_load(args):
+    from datetime import datetime, timedelta
+    from sqlalchemy import insert, select
+    from models.database_models import Server, ServerMetric
+    from services.database import db_manager, get_async_session, resources
+    from services.metrics_query import metrics_query
+
+    await resources.startup()
+    try:
+        await asyncio.to_thread(db_manager.create_tables)
+        async with get_async_session() as session:
+            await session.execute(insert(Server), [
+                {"user_id": 1, "name": f"bench-{i}", "server_type": "cx11", "image": "ubuntu-22.04",
+                 "datacenter": "fsn1-dc14", "status": "running"}
+                for i in range(args.servers)
+            ])
+        end = datetime.utcnow().replace(microsecond=0)
+        start = end - timedelta(days=1)
+        rng = np.random.default_rng(7)
+        step = DAY / args.db_samples
+        for offset in range(0, args.db_samples, 100000):
+            count = min(100000, args.db_samples - offset)
+            rows = [
+                {"server_id": int(sid), "metric_type": METRIC_TYPES[int(mtype)], "value": float(value),
+                 "recorded_at": start + timedelta(seconds=int((offset + i) * step))}
+                for i, (sid, mtype, value) in enumerate(zip(
+                    rng.integers(1, args.servers + 1, count), rng.integers(0, len(METRIC_TYPES), count), rng.random(count) * 100
+                ))
+            ]
+            async with get_async_session() as session:
+                await session.execute(insert(ServerMetric.__table__), rows)
+        print(f"\nload {args.db_samples:,} rows ({db_manager.engine.dialect.name})")
+
+        begin = time.perf_counter()
+        samples = await metrics_query.load(start, end)
+        streamed = time.perf_counter() - begin
+        print(f"  streaming cursor -> numpy  rows={len(samples):<9,} {streamed:7.2f}s")
+
+        begin = time.perf_counter()
+        async with get_async_session() as session:
+            rows = (await session.scalars(
+                select(ServerMetric).where(ServerMetric.recorded_at >= start, ServerMetric.recorded_at < end)
+            )).all()
+        orm = time.perf_counter() - begin
+        print(f"  ORM objects                rows={len(rows):<9,} {orm:7.2f}s  x{orm / streamed:4.1f}")
+    finally:
+        await resources.shutdown()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000_000, 10_000_000])
+    parser.add_argument("--servers", type=int, default=1000)
+    parser.add_argument("--python-max", type=int, default=1_000_000)
+    parser.add_argument("--db-samples", type=int, default=0, help="also benchmark loading this many rows from the database")
+    args = parser.parse_args()
+    if not os.getenv("DATABASE_URL"):
+        os.environ["DATABASE_URL"] = f"sqlite:///{tempfile.mkdtemp()}/bench.db"
+    os.environ.setdefault("INTERNAL_API_KEY", "bench")
+    os.environ.setdefault("HETZNER_API_TOKEN", "bench")
+    bench_compute(args)
+    if args.db_samples:
+        asyncio.run(bench_load(args))
@@ -0,0 +1,39 @@
+"""
+Pagination benchmark: sequential paging vs bounded concurrent fan-out
+
+Usage (from the fastapi/ directory):
+    python -m benchmarks.bench_pagination --images 5000 --latency 20
+"""
+
+import argparse
+import asyncio
+import os
+import time
+
+from benchmarks.mock_hetzner import MockHetznerServer, create_mock_app
+
+async def fetch_all(concurrency: int) -> tuple:
+    from services.hetzner_client import HetznerClient, create_http_client
+
+    async with create_http_client() as http_client:
+        client = HetznerClient(http_client)
+        start = time.perf_counter()
+        count = 0
+        async for page in client.iter_pages("/images", "images", concurrency=concurrency):
+            count += len(page)
+        return count, time.perf_counter() - start
+
+async def main(args):
+    app = create_mock_app(image_count=args.images, latency_ms=args.latency)
+    async with MockHetznerServer(app, port=args.port) as mock:
+        os.environ["HETZNER_API_URL"] = mock.base_url
+        for concurrency in (1, 2, 4, 8, 16):
+            count, elapsed = await fetch_all(concurrency)
+            print(f"concurrency={concurrency:<3} items={count:<7} elapsed={elapsed * 1000:8.1f}ms")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", type=int, default=5000)
+    parser.add_argument("--latency", type=float, default=20.0, help="Artificial mock latency in ms")
+    parser.add_argument("--port", type=int, default=8765)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,77 @@
+"""
+Fault-injection scenarios for HetznerClient retries and circuit breaking
+
+Runs the client against the local mock with injected failures and reports
+success rate, upstream request volume and latency for each scenario.
+
+Usage (from the fastapi/ directory):
+    python -m benchmarks.bench_resilience --requests 200
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import time
+
+from benchmarks.mock_hetzner import MockHetznerServer, create_mock_app
+
+async def scenario(mock: MockHetznerServer, label: str, requests: int, method: str = "GET", **faults):
+    from services.hetzner_client import HetznerClient, create_http_client, circuit_breakers
+    from utils.exceptions import BaseAPIException
+
+    mock.set_faults(**{"error_rate": 0.0, "status": 503, "retry_after": None, "hang_rate": 0.0, "hang_ms": 0, **faults})
+    mock.reset_counters()
+    circuit_breakers._breakers.clear()
+
+    ok, failed, latencies, errors = 0, 0, [], {}
+    async with create_http_client() as http_client:
+        client = HetznerClient(http_client)
+        client.coalesce_gets = False
+        for i in range(requests):
+            start = time.perf_counter()
+            try:
+                if method == "GET":
+                    await client.get_server(i % 50 + 1)
+                else:
+                    await client.create_server({"name": f"bench-{i}", "server_type": "cx11", "image": "ubuntu-22.04"})
+                ok += 1
+            except BaseAPIException as e:
+                failed += 1
+                errors[e.error_code or e.status_code] = errors.get(e.error_code or e.status_code, 0) + 1
+            latencies.append(time.perf_counter() - start)
+
+    print(
+        f"{label:<34} ok={ok:<4} failed={failed:<4} upstream={mock.counters['requests']:<5} "
+        f"p50={statistics.median(latencies) * 1000:7.1f}ms max={max(latencies) * 1000:7.1f}ms errors={errors}"
+    )
+    return circuit_breakers.get_stats()
+
+async def main(args):
+    os.environ.setdefault("REDIS_URL", "")
+    os.environ["HETZNER_RATE_LIMIT_PER_SECOND"] = "1000"
+    os.environ["HETZNER_RATE_LIMIT_BURST"] = "1000"
+    os.environ["HETZNER_RETRY_BASE_DELAY"] = "0.01"
+    os.environ["HETZNER_RETRY_MAX_DELAY"] = "0.2"
+    os.environ["CIRCUIT_BREAKER_RESET_TIMEOUT"] = "0.5"
+    os.environ["HETZNER_TIMEOUT"] = "0.3"
+
+    async with MockHetznerServer(create_mock_app(), port=args.port) as mock:
+        os.environ["HETZNER_API_URL"] = mock.base_url
+        n = args.requests
+
+        os.environ["HETZNER_RETRY_ATTEMPTS"] = "1"
+        await scenario(mock, "GET 20% 503, no retries", n, error_rate=0.2)
+        os.environ["HETZNER_RETRY_ATTEMPTS"] = "3"
+        await scenario(mock, "GET 20% 503, retries", n, error_rate=0.2)
+        await scenario(mock, "GET 20% hang (timeout), retries", n, hang_rate=0.2, hang_ms=1000)
+        await scenario(mock, "GET 10% 429 Retry-After=0", n, error_rate=0.1, status=429, retry_after=0)
+        await scenario(mock, "POST 20% 503 (not retried)", n, method="POST", error_rate=0.2)
+        breakers = await scenario(mock, "GET outage 100% 503 (breaker)", n, error_rate=1.0)
+        print(f"{'':<34} breakers={breakers}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--port", type=int, default=8765)
+    asyncio.run(main(parser.parse_args()))
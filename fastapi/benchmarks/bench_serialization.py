@@ -0,0 +1,56 @@
+"""
+Serialization benchmark: FastAPI's default JSON path vs orjson vs MessagePack
+
+Encodes a {"success", "data", "meta"} payload of N Hetzner-shaped servers the
+way each response path does and reports encode time and body size.
+
+Usage (from the fastapi/ directory):
+    python -m benchmarks.bench_serialization --servers 5000 --rounds 20
+"""
+
+import argparse
+import statistics
+import time
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+from benchmarks.mock_hetzner import make_server
+from utils.serialization import encode_json, encode_msgpack
+
+def default_path(payload) -> bytes:
+    # What a route returning a dict costs: jsonable_encoder, then stdlib json
+    return JSONResponse(jsonable_encoder(payload)).body
+
+ENCODERS = {
+    "jsonable_encoder+json": default_path,
+    "orjson": encode_json,
+    "msgpack": encode_msgpack,
+}
+
+def main(args):
+    payload = {
+        "success": True,
+        "data": [make_server(server_id) for server_id in range(1, args.servers + 1)],
+        "meta": {"pagination": {"total_entries": args.servers}}
+    }
+    baseline = None
+    for name, encode in ENCODERS.items():
+        encode(payload)
+        timings = []
+        for _ in range(args.rounds):
+            start = time.perf_counter()
+            body = encode(payload)
+            timings.append((time.perf_counter() - start) * 1000)
+        p50 = statistics.median(timings)
+        baseline = baseline or p50
+        print(
+            f"{name:<22} p50={p50:8.2f}ms  max={max(timings):8.2f}ms  "
+            f"bytes={len(body):>9,}  speedup={baseline / p50:5.1f}x"
+        )
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--servers", type=int, default=5000)
+    parser.add_argument("--rounds", type=int, default=20)
+    main(parser.parse_args())
@@ -0,0 +1,252 @@
+"""
+Local mock of the Hetzner Cloud API used by the benchmark scripts
+Serves deterministic fixtures with optional artificial latency and
+injectable faults (error responses, 429s with Retry-After, hangs)
+"""
+
+import asyncio
+import math
+import os
+import random
+import time
+from datetime import datetime
+from typing import Dict, Any, List
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+def make_server(server_id: int) -> Dict[str, Any]:
+    """Build a server object shaped like the Hetzner API response"""
+    return {
+        "id": server_id,
+        "name": f"server-{server_id}",
+        "status": "running" if server_id % 4 else "off",
+        "created": "2024-01-01T00:00:00+00:00",
+        "public_net": {
+            "ipv4": {"ip": f"10.{(server_id >> 16) & 255}.{(server_id >> 8) & 255}.{server_id & 255}"},
+            "ipv6": {"ip": "2001:db8::/64"}
+        },
+        "server_type": {"id": 1, "name": "cx11", "cores": 1, "memory": 2.0, "disk": 20},
+        "datacenter": {"id": 1, "name": "fsn1-dc14", "location": {"name": "fsn1"}},
+        "image": {"id": 1, "name": "ubuntu-22.04", "os_flavor": "ubuntu"},
+        "protection": {"delete": False, "rebuild": False},
+        "labels": {"env": "bench"}
+    }
+
+def make_image(image_id: int) -> Dict[str, Any]:
+    return {
+        "id": image_id,
+        "name": f"image-{image_id}",
+        "description": f"Image {image_id}",
+        "type": "system" if image_id % 10 else "snapshot",
+        "status": "available",
+        "architecture": "x86",
+        "os_flavor": "ubuntu",
+        "os_version": "22.04",
+        "labels": {}
+    }
+
+def filter_items(items: List[Dict[str, Any]], request: Request) -> List[Dict[str, Any]]:
+    """Subset of Hetzner list filters: name, status, type and equality label selectors"""
+    params = request.query_params
+    if params.get("name"):
+        items = [item for item in items if item.get("name") == params["name"]]
+    for key in ("status", "type"):
+        values = params.getlist(key)
+        if values:
+            items = [item for item in items if item.get(key) in values]
+    for term in filter(None, (params.get("label_selector") or "").split(",")):
+        label, _, value = term.partition("=")
+        items = [item for item in items if label in item.get("labels", {}) and (not value or item["labels"][label] == value)]
+    return items
+
+def paginate(items: List[Dict[str, Any]], key: str, request: Request) -> Dict[str, Any]:
+    """Apply Hetzner-style page/per_page pagination"""
+    page = int(request.query_params.get("page", 1))
+    per_page = min(int(request.query_params.get("per_page", 25)), 50)
+    total = len(items)
+    last_page = max(1, (total + per_page - 1) // per_page)
+    start = (page - 1) * per_page
+    return {
+        key: items[start:start + per_page],
+        "meta": {
+            "pagination": {
+                "page": page,
+                "per_page": per_page,
+                "previous_page": page - 1 if page > 1 else None,
+                "next_page": page + 1 if page < last_page else None,
+                "last_page": last_page,
+                "total_entries": total
+            }
+        }
+    }
+
+def create_mock_app(
+    server_count: int = 100,
+    image_count: int = 100,
+    latency_ms: float = 0.0,
+    action_duration: float = 2.0
+) -> FastAPI:
+    """Create the mock Hetzner application"""
+    app = FastAPI()
+    servers = [make_server(i) for i in range(1, server_count + 1)]
+    images = [make_image(i) for i in range(1, image_count + 1)]
+    # Actions progress linearly from 0 to 100 over action_duration seconds
+    actions: Dict[int, Dict[str, Any]] = {}
+
+    def start_action(command: str, server_id: int) -> Dict[str, Any]:
+        action_id = len(actions) + 1
+        actions[action_id] = {"id": action_id, "command": command, "server_id": server_id, "started": time.time()}
+        return render_action(actions[action_id])
+
+    def render_action(action: Dict[str, Any]) -> Dict[str, Any]:
+        elapsed = time.time() - action["started"]
+        progress = min(100, int(elapsed / action_duration * 100)) if action_duration else 100
+        return {
+            "id": action["id"],
+            "command": action["command"],
+            "status": "success" if progress >= 100 else "running",
+            "progress": progress,
+            "started": "2024-01-01T00:00:00+00:00",
+            "finished": "2024-01-01T00:00:00+00:00" if progress >= 100 else None,
+            "resources": [{"id": action["server_id"], "type": "server"}],
+            "error": None
+        }
+    # Fault injection settings, changed at runtime through POST /_faults
+    app.state.faults = {"error_rate": 0.0, "status": 503, "retry_after": None, "hang_rate": 0.0, "hang_ms": 0}
+    app.state.counters = {"requests": 0, "faults": 0}
+
+    @app.middleware("http")
+    async def inject_faults(request: Request, call_next):
+        if request.url.path.startswith("/_"):
+            return await call_next(request)
+        app.state.counters["requests"] += 1
+        if latency_ms:
+            await asyncio.sleep(latency_ms / 1000)
+
+        faults = app.state.faults
+        if random.random() < faults["hang_rate"]:
+            app.state.counters["faults"] += 1
+            await asyncio.sleep(faults["hang_ms"] / 1000)
+        if random.random() < faults["error_rate"]:
+            app.state.counters["faults"] += 1
+            headers = {"Retry-After": str(faults["retry_after"])} if faults["retry_after"] is not None else {}
+            return JSONResponse(
+                {"error": {"code": "unavailable" if faults["status"] != 429 else "rate_limit_exceeded", "message": "injected fault"}},
+                status_code=faults["status"],
+                headers=headers
+            )
+        return await call_next(request)
+
+    @app.post("/_faults")
+    async def set_faults(request: Request):
+        app.state.faults.update(await request.json())
+        return app.state.faults
+
+    @app.get("/_stats")
+    async def get_stats():
+        return app.state.counters
+
+    @app.get("/v1/servers")
+    async def list_servers(request: Request):
+        return paginate(filter_items(servers, request), "servers", request)
+
+    @app.post("/v1/servers")
+    async def create_server(request: Request):
+        body = await request.json()
+        server = {**make_server(len(servers) + 1), "name": body["name"], "status": "initializing"}
+        servers.append(server)
+        action = start_action("create_server", server["id"])
+        return JSONResponse({"server": server, "action": action, "next_actions": []}, status_code=201)
+
+    @app.post("/v1/servers/{server_id}/actions")
+    async def server_action(server_id: int, request: Request):
+        body = await request.json()
+        return JSONResponse({"action": start_action(body.get("type", "unknown"), server_id)}, status_code=201)
+
+    @app.get("/v1/actions")
+    async def list_actions(request: Request):
+        ids = [int(value) for value in request.query_params.getlist("id")]
+        found = [render_action(actions[action_id]) for action_id in ids if action_id in actions]
+        return paginate(found, "actions", request)
+
+    @app.get("/v1/servers/{server_id}/metrics")
+    async def server_metrics(server_id: int, request: Request):
+        params = request.query_params
+        start = datetime.fromisoformat(params["start"]).timestamp()
+        end = datetime.fromisoformat(params["end"]).timestamp()
+        step = int(params.get("step") or max(1, (end - start) // 10000))
+        timestamps = [start + offset for offset in range(0, int(end - start), step)]
+
+        def series(scale: float, phase: float):
+            return {"values": [[ts, str(round(scale * (1 + math.sin(ts / 600 + phase)) + random.random(), 3))] for ts in timestamps]}
+
+        time_series = {}
+        for metric_type in params["type"].split(","):
+            if metric_type == "cpu":
+                time_series["cpu"] = series(50, 0)
+            elif metric_type == "disk":
+                time_series["disk.0.iops.read"] = series(200, 1)
+                time_series["disk.0.iops.write"] = series(100, 2)
+            elif metric_type == "network":
+                time_series["network.0.bandwidth.in"] = series(1e6, 3)
+                time_series["network.0.bandwidth.out"] = series(5e5, 4)
+        return {"metrics": {"start": params["start"], "end": params["end"], "step": step, "time_series": time_series}}
+
+    @app.get("/v1/servers/{server_id}")
+    async def get_server(server_id: int):
+        return {"server": make_server(server_id)}
+
+    @app.get("/v1/images")
+    async def list_images(request: Request):
+        return paginate(filter_items(images, request), "images", request)
+
+    @app.get("/v1/server_types")
+    async def list_server_types(request: Request):
+        return paginate([{"id": 1, "name": "cx11", "cores": 1, "memory": 2.0, "disk": 20}], "server_types", request)
+
+    @app.get("/v1/datacenters")
+    async def list_datacenters(request: Request):
+        return paginate([{"id": 1, "name": "fsn1-dc14", "location": {"name": "fsn1"}}], "datacenters", request)
+
+    return app
+
+class MockHetznerServer:
+    """Run the mock application on a local port inside the current event loop"""
+
+    def __init__(self, app: FastAPI, host: str = "127.0.0.1", port: int = 8765):
+        self.app = app
+        self.host = host
+        self.port = port
+        self.server = uvicorn.Server(uvicorn.Config(app, host=host, port=port, log_level="warning", access_log=False))
+        self.task = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}/v1"
+
+    def set_faults(self, **faults):
+        """Update fault injection settings in place (same process)"""
+        self.app.state.faults.update(faults)
+
+    def reset_counters(self):
+        self.app.state.counters.update(requests=0, faults=0)
+
+    @property
+    def counters(self) -> Dict[str, int]:
+        return dict(self.app.state.counters)
+
+    async def __aenter__(self) -> "MockHetznerServer":
+        self.task = asyncio.create_task(self.server.serve())
+        while not self.server.started:
+            await asyncio.sleep(0.01)
+        os.environ.setdefault("HETZNER_API_TOKEN", "benchmark-token")
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        self.server.should_exit = True
+        await self.task
+
+if __name__ == "__main__":
+    uvicorn.run(create_mock_app(), host="127.0.0.1", port=8765)
@@ -1,13 +1,61 @@
 # main.py
-from fastapi import FastAPI, HTTPException, Depends, Header
+from fastapi import FastAPI, HTTPException, Depends, Header, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 from pydantic import BaseModel
 from typing import Optional, Dict, Any
+from contextlib import asynccontextmanager
 import os
 
 from routers.hetzner import router as hetzner_router
+from routers.metrics import router as metrics_router
+from routers.retention import router as retention_router
+from routers.billing import router as billing_router
+from routers.quotas import router as quotas_router
+from services.hetzner_client import (
+    startup_http_client, shutdown_http_client, request_coalescer, get_rate_limiter, circuit_breakers
+)
+from services.database import resources, check_all_services_async
+from services.server_sync import server_sync
+from services.action_tracker import action_tracker
+from services.metrics_ingest import metrics_ingestor
+from services.metric_rollups import metric_rollups
+from services.retention import retention
+from services.usage_metering import usage_metering
+from services.invoicing import invoice_pipeline
+from services.pricing import pricing_service
+from services.quotas import quota_service
+from utils.exceptions import BaseAPIException
+from utils.http_cache import ETagMiddleware
+from utils.compression import CompressionMiddleware
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await resources.startup()
+    await startup_http_client()
+    await server_sync.start()
+    await action_tracker.start()
+    await metrics_ingestor.start()
+    await metric_rollups.start()
+    await retention.start()
+    if os.getenv("METERING_PRICE_SOURCE", "env") == "hetzner":
+        usage_metering.price_source = pricing_service.price_table
+    await usage_metering.start()
+    await invoice_pipeline.start()
+    await quota_service.start()
+    yield
+    await quota_service.stop()
+    await invoice_pipeline.stop()
+    await usage_metering.stop()
+    await retention.stop()
+    await metric_rollups.stop()
+    await metrics_ingestor.stop()
+    await action_tracker.stop()
+    await server_sync.stop()
+    await shutdown_http_client()
+    await resources.shutdown()
 
-app = FastAPI(title="Cloud Platform API", version="1.0.0")
+app = FastAPI(title="Cloud Platform API", version="1.0.0", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -15,6 +63,21 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag"],
+)
+
+# Conditional GETs for the Hetzner API (304 when If-None-Match matches)
+app.add_middleware(
+    ETagMiddleware,
+    path_prefix="/api/v1/hetzner",
+    max_body_size=int(os.getenv("ETAG_MAX_BODY_SIZE", str(16 * 1024 * 1024))),
+)
+
+# Added last so it wraps the ETag middleware and sees the ETag it sets
+app.add_middleware(
+    CompressionMiddleware,
+    minimum_size=int(os.getenv("COMPRESSION_MIN_SIZE", "1024")),
+    cache_max_bytes=int(os.getenv("COMPRESSION_CACHE_MAX_BYTES", str(32 * 1024 * 1024))),
 )
 
 async def verify_internal_key(x_internal_key: Optional[str] = Header(None)):
@@ -22,8 +85,41 @@ async def verify_internal_key(x_internal_key: Optional[str] = Header(None)):
         raise HTTPException(status_code=401, detail="Invalid internal API key")
     return True
 
+@app.exception_handler(BaseAPIException)
+async def api_exception_handler(request: Request, exc: BaseAPIException):
+    headers = {}
+    if exc.details.get("retry_after"):
+        headers["Retry-After"] = str(exc.details["retry_after"])
+    return JSONResponse(status_code=exc.status_code, content={"detail": exc.to_dict()}, headers=headers)
+
 app.include_router(hetzner_router, prefix="/api/v1", dependencies=[Depends(verify_internal_key)])
+app.include_router(metrics_router, prefix="/api/v1", dependencies=[Depends(verify_internal_key)])
+app.include_router(retention_router, prefix="/api/v1", dependencies=[Depends(verify_internal_key)])
+app.include_router(billing_router, prefix="/api/v1", dependencies=[Depends(verify_internal_key)])
+app.include_router(quotas_router, prefix="/api/v1", dependencies=[Depends(verify_internal_key)])
 
 @app.get("/health")
 async def health_check():
-    return {"status": "healthy", "service": "fastapi"}
\ No newline at end of file
+    return {
+        "status": "degraded" if circuit_breakers.any_open() else "healthy",
+        "service": "fastapi",
+        "hetzner": {
+            "request_coalescing": request_coalescer.get_stats(),
+            "rate_limiter": get_rate_limiter().get_stats(),
+            "circuit_breakers": circuit_breakers.get_stats()
+        },
+        "server_sync": server_sync.get_stats(),
+        "action_tracker": action_tracker.get_stats(),
+        "metrics_ingest": metrics_ingestor.get_stats(),
+        "metric_rollups": metric_rollups.get_stats(),
+        "retention": retention.get_stats(),
+        "usage_metering": usage_metering.get_stats(),
+        "invoicing": invoice_pipeline.get_stats(),
+        "pricing": pricing_service.get_stats(),
+        "quotas": quota_service.get_stats()
+    }
+@app.get("/health/services")
+async def services_health_check():
+    services = await check_all_services_async()
+    healthy = services["database"]["status"] == "healthy"
+    return JSONResponse(status_code=200 if healthy else 503, content=services)
@@ -215,6 +215,35 @@ class ServerMetric(Base):
     def __repr__(self):
         return f"<ServerMetric(server_id={self.server_id}, type={self.metric_type}, value={self.value})>"
 
+class MetricRollupMixin:
+    """One pre-aggregated bucket of server_metrics samples"""
+    server_id = Column(Integer, ForeignKey("servers.id"), primary_key=True)
+    metric_type = Column(String(50), primary_key=True)
+    bucket_start = Column(DateTime, primary_key=True, index=True)
+    sample_count = Column(Integer, nullable=False)
+    min_value = Column(Float, nullable=False)
+    max_value = Column(Float, nullable=False)
+    sum_value = Column(Float, nullable=False)
+    avg_value = Column(Float, nullable=False)
+    p95_value = Column(Float, nullable=False)
+
+class ServerMetricRollup1m(MetricRollupMixin, Base):
+    __tablename__ = "server_metrics_1m"
+
+class ServerMetricRollup1h(MetricRollupMixin, Base):
+    __tablename__ = "server_metrics_1h"
+
+class ServerMetricRollup1d(MetricRollupMixin, Base):
+    __tablename__ = "server_metrics_1d"
+
+class MetricRollupState(Base):
+    __tablename__ = "metric_rollup_state"
+    
+    tier = Column(String(8), primary_key=True)
+    # Every bucket starting before the watermark has been rolled up
+    watermark = Column(DateTime, nullable=False)
+    updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
+
 class ServerAction(Base):
     __tablename__ = "server_actions"
     
@@ -295,6 +324,21 @@ class ResourceQuota(Base):
     def __repr__(self):
         return f"<ResourceQuota(user_id={self.user_id}, type={self.resource_type})>"
 
+class QuotaReservation(Base):
+    """Reservation held in MySQL while the Redis quota counters are unavailable"""
+    __tablename__ = "quota_reservations"
+    
+    reservation_id = Column(String(100), primary_key=True)
+    user_id = Column(Integer, nullable=False)
+    resource_type = Column(String(50), nullable=False)
+    amount = Column(Integer, nullable=False)
+    expires_at = Column(DateTime, nullable=False)
+    created_at = Column(DateTime, default=func.now())
+    
+    __table_args__ = (
+        Index('idx_quota_reservations_counter', 'user_id', 'resource_type', 'expires_at'),
+    )
+
 class Invoice(Base):
     __tablename__ = "invoices"
     
@@ -304,7 +348,7 @@ class Invoice(Base):
     status = Column(String(50), default="draft")
     subtotal = Column(Float, nullable=False)
     tax_amount = Column(Float, default=0)
-    total_amount = Column(Float, nullable=False)
+    total_amount = Column("total", Float, nullable=False)  # column is "total" in mysql/init.sql
     currency = Column(String(3), default="EUR")
     billing_period_start = Column(DateTime, nullable=False)
     billing_period_end = Column(DateTime, nullable=False)
@@ -320,6 +364,25 @@ class Invoice(Base):
     def __repr__(self):
         return f"<Invoice(id={self.id}, number={self.invoice_number})>"
 
+class InvoiceRun(Base):
+    __tablename__ = "invoice_runs"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    billing_period = Column(String(7), unique=True, nullable=False)  # Format: YYYY-MM
+    status = Column(String(20), nullable=False, default="running")
+    users_total = Column(Integer, default=0)
+    users_done = Column(Integer, default=0)
+    invoices_created = Column(Integer, default=0)
+    line_items_created = Column(Integer, default=0)
+    total_amount = Column(Float, default=0)
+    error = Column(Text)
+    started_at = Column(DateTime, default=func.now())
+    finished_at = Column(DateTime)
+    updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
+    
+    def __repr__(self):
+        return f"<InvoiceRun(period={self.billing_period}, status={self.status})>"
+
 class InvoiceLineItem(Base):
     __tablename__ = "invoice_line_items"
     
@@ -366,6 +429,42 @@ class UsageRecord(Base):
     def __repr__(self):
         return f"<UsageRecord(id={self.id}, type={self.usage_type})>"
 
+class ServerStateChange(Base):
+    __tablename__ = "server_state_changes"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    server_id = Column(Integer, ForeignKey("servers.id"), nullable=False)
+    status = Column(String(50), nullable=False)
+    server_type = Column(String(50), nullable=False)
+    datacenter = Column(String(50))
+    monthly_cost = Column(Float)
+    # The state holds from changed_at until the server's next change
+    changed_at = Column(DateTime, nullable=False)
+    
+    __table_args__ = (
+        Index('idx_state_change_server_time', 'server_id', 'changed_at'),
+        Index('idx_state_change_time', 'changed_at'),
+    )
+    
+    def __repr__(self):
+        return f"<ServerStateChange(server_id={self.server_id}, status={self.status}, at={self.changed_at})>"
+
+class UsageMeteringRun(Base):
+    __tablename__ = "usage_metering_runs"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    period_start = Column(DateTime, nullable=False)
+    period_end = Column(DateTime, nullable=False, index=True)
+    status = Column(String(20), nullable=False, default="running")
+    records = Column(Integer, default=0)
+    total_cost = Column(Float, default=0)
+    error = Column(Text)
+    started_at = Column(DateTime, default=func.now())
+    finished_at = Column(DateTime)
+    
+    def __repr__(self):
+        return f"<UsageMeteringRun(id={self.id}, {self.period_start}..{self.period_end}, status={self.status})>"
+
 class Notification(Base):
     __tablename__ = "notifications"
     
@@ -252,15 +252,17 @@ class ConsoleResponse(BaseModel):
     password: str
 
 class PricingResponse(BaseModel):
-    """Response model for pricing"""
+    """Response model for pricing (GET /hetzner/pricing)"""
     currency: str
     vat_rate: str
     image: Dict[str, Any]
-    floating_ip: Dict[str, Any]
-    traffic: Dict[str, Any]
+    floating_ip: Optional[Dict[str, Any]] = None  # deprecated upstream, see floating_ips
+    floating_ips: List[Dict[str, Any]] = []
+    primary_ips: List[Dict[str, Any]] = []
+    traffic: Optional[Dict[str, Any]] = None  # deprecated upstream, now per server type
     server_backup: Dict[str, Any]
-    server_types: Dict[str, Any]
-    load_balancer_types: Dict[str, Any]
+    server_types: List[Dict[str, Any]]
+    load_balancer_types: List[Dict[str, Any]]
     volume: Dict[str, Any]
 
 class ErrorResponse(BaseModel):
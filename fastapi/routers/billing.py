@@ -0,0 +1,107 @@
+from datetime import datetime
+from typing import List, Optional
+
+from fastapi import APIRouter, HTTPException, Request
+from pydantic import BaseModel, Field
+
+from services.invoicing import invoice_pipeline
+from services.pricing import pricing_service
+from services.usage_metering import naive_utc, usage_metering
+from utils.exceptions import ConflictException, HetznerAPIException, NetworkException, TimeoutException, ValidationException
+from utils.serialization import api_response
+
+router = APIRouter(prefix="/billing", tags=["billing"])
+
+class MeteringRunRequest(BaseModel):
+    start: datetime  # whole hours, UTC
+    end: datetime
+
+class InvoiceRunRequest(BaseModel):
+    billing_period: str = Field(..., pattern=r"^\d{4}-(0[1-9]|1[0-2])$")
+    force: bool = False  # run even if the period's usage is not fully metered
+
+class CostEstimateRequest(BaseModel):
+    """A ServerCreateRequest payload (extra fields are ignored), plus quantity and duration"""
+    server_type: str = Field(..., min_length=1, max_length=63)
+    location: str = Field(..., min_length=1, max_length=63)
+    enable_backups: bool = False
+    enable_ipv4: bool = True  # Hetzner bills the primary IPv4 separately
+    count: int = Field(1, ge=1, le=1000)
+    hours: Optional[float] = Field(None, gt=0, le=24 * 366)  # also price a period (hourly, capped monthly)
+
+class BatchCostEstimateRequest(BaseModel):
+    items: List[CostEstimateRequest] = Field(..., min_length=1, max_length=1000)
+
+@router.post("/usage/meter", status_code=202)
+async def meter_usage(request: MeteringRunRequest):
+    """(Re)compute server_hour usage records for a period in the background; safe to repeat"""
+    start, end = naive_utc(request.start), naive_utc(request.end)
+    try:
+        started = usage_metering.trigger(start, end)
+    except ValidationException as e:
+        raise HTTPException(status_code=e.status_code, detail=e.to_dict())
+    if not started:
+        raise HTTPException(status_code=409, detail="A metering run is already in progress")
+    return {
+        "success": True,
+        "data": {"started": True, "period_start": start.isoformat(), "period_end": end.isoformat()}
+    }
+
+@router.get("/usage/status")
+async def metering_status():
+    return {
+        "success": True,
+        "data": usage_metering.get_stats()
+    }
+
+@router.post("/invoices/run", status_code=202)
+async def run_invoices(request: InvoiceRunRequest):
+    """Generate (or resume) invoices for a billing period in the background; 422 until its usage is fully metered, 409 while it runs elsewhere"""
+    try:
+        started = await invoice_pipeline.trigger(request.billing_period, request.force)
+    except (ValidationException, ConflictException) as e:
+        raise HTTPException(status_code=e.status_code, detail=e.to_dict())
+    if not started:
+        raise HTTPException(status_code=409, detail=f"Invoices for {request.billing_period} are already being generated")
+    return {
+        "success": True,
+        "data": {"started": True, "billing_period": request.billing_period}
+    }
+
+@router.get("/invoices/runs/{billing_period}")
+async def invoice_run_status(billing_period: str):
+    try:
+        run = await invoice_pipeline.get_run(billing_period)
+    except ValidationException as e:
+        raise HTTPException(status_code=e.status_code, detail=e.to_dict())
+    if run is None:
+        raise HTTPException(status_code=404, detail=f"No invoice run for {billing_period}")
+    return {
+        "success": True,
+        "data": run
+    }
+
+@router.post("/estimate")
+async def estimate_cost(configuration: CostEstimateRequest):
+    """Hourly/monthly cost of a server configuration from the cached Hetzner price list"""
+    try:
+        estimate = await pricing_service.estimate(configuration.model_dump())
+    except (ValidationException, HetznerAPIException, NetworkException, TimeoutException) as e:
+        raise HTTPException(status_code=e.status_code, detail=e.to_dict())
+    return {
+        "success": True,
+        "data": estimate
+    }
+
+@router.post("/estimate/batch")
+async def estimate_costs(batch: BatchCostEstimateRequest, request: Request):
+    """Price many configurations in one call; ones Hetzner does not sell are flagged per item"""
+    try:
+        data = await pricing_service.estimate_many([item.model_dump() for item in batch.items])
+    except (HetznerAPIException, NetworkException, TimeoutException) as e:
+        raise HTTPException(status_code=e.status_code, detail=e.to_dict())
+    return api_response(request, {
+        "success": True,
+        "data": data["items"],
+        "meta": {"totals": data["totals"], "count": len(data["items"])}
+    })
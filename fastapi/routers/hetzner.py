@@ -1,8 +1,28 @@
-from fastapi import APIRouter, HTTPException
-from pydantic import BaseModel
+import os
+import re
+from fastapi import APIRouter, HTTPException, Depends, Query, Request
+import uuid
+from datetime import datetime
+from pydantic import BaseModel, Field, model_validator
 from typing import List, Optional, Dict, Any
-from services.hetzner_client import HetznerClient
-from utils.exceptions import HetznerAPIException, NetworkException, TimeoutException, ValidationException
+from services.hetzner_client import HetznerClient, get_http_client
+from services.catalog_cache import catalog_cache
+from services.database import stable_cache_key
+from services.server_sync import server_sync
+from services.action_tracker import action_tracker
+from services.bulk_actions import BulkActionRunner
+from services.fleet import FleetProvisioner, fleet_names
+from services.server_metrics import METRIC_TYPES, server_metrics
+from services.pricing import pricing_service
+from services.quotas import quota_service
+from utils.exceptions import (
+    BaseAPIException, CircuitOpenException, DatabaseException, HetznerAPIException, NetworkException,
+    QuotaExceededException, TimeoutException, ValidationException
+)
+from utils.streaming import stream_pages, sse_response
+from utils.http_cache import conditional_response
+from utils.serialization import api_response
+from utils.projection import parse_fields, project_items
 
 router = APIRouter(prefix="/hetzner", tags=["hetzner"])
 
@@ -13,39 +33,197 @@ class ServerCreateRequest(BaseModel):
     datacenter: Optional[str] = None
     ssh_keys: Optional[List[str]] = []
     user_data: Optional[str] = None
+    user_id: Optional[int] = None  # enforce this user's "servers" quota
 
 class ServerActionRequest(BaseModel):
     action: str  # "start", "stop", "restart", "reset"
 
+class FleetTemplate(BaseModel):
+    server_type: str
+    image: str
+    datacenter: Optional[str] = None
+    location: Optional[str] = None
+    ssh_keys: Optional[List[str]] = []
+    user_data: Optional[str] = None
+    labels: Optional[Dict[str, str]] = None
+    name_prefix: str = Field("server", pattern="^[a-z0-9][a-z0-9-]*$", max_length=40)
+
+class FleetCreateRequest(BaseModel):
+    template: FleetTemplate
+    count: Optional[int] = Field(None, ge=1, le=100)
+    names: Optional[List[str]] = Field(None, min_length=1, max_length=100)  # explicit names instead of count
+    concurrency: Optional[int] = Field(None, ge=1, le=20)
+    follow: bool = False  # keep reporting action progress until every server is up
+    user_id: Optional[int] = None  # enforce this user's "servers" quota for the whole batch
+    
+    @model_validator(mode="after")
+    def check_count_or_names(self):
+        if (self.count is None) == (self.names is None):
+            raise ValueError("Provide exactly one of count or names")
+        return self
+
+class BulkServerActionRequest(BaseModel):
+    server_ids: List[int] = Field(..., min_length=1, max_length=1000)
+    action: str
+    concurrency: Optional[int] = Field(None, ge=1, le=50)
+    wave_size: Optional[int] = Field(None, ge=1)  # rolling waves of this many servers
+    wave_delay: float = Field(0, ge=0, le=600)  # pause between waves (seconds)
+    wait_for_completion: bool = False  # wait for each wave's actions to finish before the next
+    max_failures: Optional[int] = Field(None, ge=0)  # skip remaining waves beyond this many failures
+
+def get_hetzner_client() -> HetznerClient:
+    """Dependency returning a client bound to the shared connection pool"""
+    try:
+        return HetznerClient(get_http_client())
+    except HetznerAPIException as e:
+        raise HTTPException(status_code=e.status_code, detail=e.message)
+
+# ?stream=ndjson|json streams every page instead of buffering the full list
+StreamFormat = Query(None, pattern="^(ndjson|json)$")
+
+# ?source=mirror serves GET /servers from the synced servers table while it is fresh
+ServerSource = Query(None, pattern="^(live|mirror)$")
+
+# ?fields=id,name,public_net.ipv4.ip returns only those attributes (id is always kept)
+FieldSelection = Query(None, pattern=r"^[a-z0-9_]+(\.[a-z0-9_]+)*(,[a-z0-9_]+(\.[a-z0-9_]+)*)*$", max_length=1000)
+
+# Hetzner's own list filters, per endpoint
+LIST_FILTERS = {
+    "servers": ("label_selector", "status", "name", "sort"),
+    "images": ("label_selector", "status", "name", "type", "sort"),
+    "server_types": ("name",),
+    "datacenters": ("name", "sort"),
+}
+
+def list_filters(
+    label_selector: Optional[str] = Query(None, max_length=1000),
+    status: Optional[List[str]] = Query(None),
+    name: Optional[str] = Query(None, max_length=255),
+    type: Optional[List[str]] = Query(None),
+    sort: Optional[List[str]] = Query(None)
+) -> Dict[str, Any]:
+    """Hetzner filters passed through as upstream query params"""
+    filters = {"label_selector": label_selector, "status": status, "name": name, "type": type, "sort": sort}
+    return {key: value for key, value in filters.items() if value}
+
+def _upstream_params(resource: str, filters: Dict[str, Any]) -> Dict[str, Any]:
+    unsupported = sorted(set(filters) - set(LIST_FILTERS[resource]))
+    if unsupported:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unsupported filter(s) for {resource}: {', '.join(unsupported)}"
+        )
+    for value in filters.get("sort") or []:
+        if not re.fullmatch(r"[a-z_]+(:(asc|desc))?", value):
+            raise HTTPException(status_code=400, detail=f"Invalid sort: {value}")
+    return filters
+
+async def _projected_pages(pages, fields):
+    async for page in pages:
+        yield project_items(page, fields)
+
 @router.get("/servers")
-async def list_servers():
+async def list_servers(
+    request: Request,
+    stream: Optional[str] = StreamFormat,
+    source: Optional[str] = ServerSource,
+    fields: Optional[str] = FieldSelection,
+    filters: Dict[str, Any] = Depends(list_filters),
+    client: HetznerClient = Depends(get_hetzner_client)
+):
+    """Servers, optionally filtered upstream and projected to ?fields= (filtered lists are always live)"""
+    params = _upstream_params("servers", filters)
+    tree = parse_fields(fields)
     try:
-        client = HetznerClient()
-        response = await client.get_servers()
-        return {
+        source = source or os.getenv("SERVERS_READ_SOURCE", "live")
+        synced_at = await server_sync.synced_at() if source == "mirror" and not stream and not params else None
+        if server_sync.is_fresh(synced_at):
+            servers = project_items(await server_sync.list_servers(), tree)
+            return api_response(request, {
+                "success": True,
+                "data": servers,
+                "meta": {
+                    "source": "mirror",
+                    "synced_at": datetime.utcfromtimestamp(synced_at).isoformat(),
+                    "pagination": {"total_entries": len(servers)}
+                }
+            })
+        if stream:
+            return await stream_pages(_projected_pages(client.iter_pages("/servers", "servers", params), tree), stream)
+        response = await client.get_servers(params)
+        return api_response(request, {
             "success": True,
-            "data": response.get("servers", []),
+            "data": project_items(response.get("servers", []), tree),
             "meta": response.get("meta", {})
-        }
+        })
     except (HetznerAPIException, NetworkException, TimeoutException, ValidationException) as e:
         raise HTTPException(status_code=e.status_code, detail=e.to_dict())
 
 @router.get("/servers/{server_id}")
-async def get_server(server_id: int):
+async def get_server(server_id: int, request: Request, client: HetznerClient = Depends(get_hetzner_client)):
     try:
-        client = HetznerClient()
         response = await client.get_server(server_id)
-        return {
+        return api_response(request, {
             "success": True,
             "data": response.get("server")
-        }
+        })
     except HetznerAPIException as e:
         raise HTTPException(status_code=e.status_code, detail=e.message)
 
+@router.get("/servers/{server_id}/metrics")
+async def get_server_metrics(
+    server_id: int,
+    request: Request,
+    type: List[str] = Query(list(METRIC_TYPES)),
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    step: Optional[int] = Query(None, ge=1),
+    points: int = Query(500, ge=10, le=5000),
+    downsample: str = Query("lttb", pattern="^(lttb|avg|min|max|minmax)$"),
+    client: HetznerClient = Depends(get_hetzner_client)
+):
+    """CPU/disk/network series (default: last hour), downsampled to at most `points` per series"""
+    unknown = sorted(set(type) - set(METRIC_TYPES))
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown metric type(s): {', '.join(unknown)}")
+    try:
+        data = await server_metrics.get_metrics(client, server_id, type, start, end, step, points, downsample)
+        return api_response(request, {
+            "success": True,
+            "data": data
+        })
+    except (HetznerAPIException, NetworkException, TimeoutException, ValidationException) as e:
+        raise HTTPException(status_code=e.status_code, detail=e.to_dict())
+
+async def _reserve_servers(user_id: Optional[int], count: int):
+    if user_id is None:
+        return None
+    try:
+        return await quota_service.reserve(user_id, "servers", count)
+    except (QuotaExceededException, ValidationException, DatabaseException) as e:
+        raise HTTPException(status_code=e.status_code, detail=e.to_dict())
+
+async def _settle_fleet(events, provisioner: FleetProvisioner, reservation):
+    """Pass fleet events through, then count the servers that were created against the quota"""
+    try:
+        async for event in events:
+            yield event
+    finally:
+        if reservation:
+            await quota_service.commit(reservation.id, provisioner.summary["created"])
+
+def _not_created(e: BaseAPIException) -> bool:
+    """Hetzner rejected the create (4xx), or the request was never sent"""
+    if isinstance(e, HetznerAPIException):
+        return e.status_code is not None and 400 <= e.status_code < 500
+    if isinstance(e, (TimeoutException, NetworkException)):
+        return e.details.get("request_sent") is False
+    return isinstance(e, CircuitOpenException)
+
 @router.post("/servers")
-async def create_server(request: ServerCreateRequest):
+async def create_server(request: ServerCreateRequest, client: HetznerClient = Depends(get_hetzner_client)):
+    reservation = await _reserve_servers(request.user_id, 1)
     try:
-        client = HetznerClient()
         data = {
             "name": request.name,
             "server_type": request.server_type,
@@ -59,7 +237,19 @@ async def create_server(request: ServerCreateRequest):
         if request.user_data:
             data["user_data"] = request.user_data
             
-        response = await client.create_server(data)
+        try:
+            response = await client.create_server(data)
+        except BaseAPIException as e:
+            # Anything else (timeouts after sending, 5xx, cancellation) may have created the
+            # server; that reservation is left to expire rather than handed back
+            if reservation and _not_created(e):
+                await quota_service.release(reservation.id)
+            raise
+        if reservation:
+            await quota_service.commit(reservation.id)
+        server_sync.wake()
+        if response.get("server"):
+            await action_tracker.track(response.get("action"), response["server"]["id"], response["server"])
         return {
             "success": True,
             "data": response
@@ -67,11 +257,39 @@ async def create_server(request: ServerCreateRequest):
     except HetznerAPIException as e:
         raise HTTPException(status_code=e.status_code, detail=e.message)
 
+@router.post("/servers:batch")
+async def create_fleet(
+    request: FleetCreateRequest,
+    http_request: Request,
+    stream: Optional[str] = StreamFormat,
+    client: HetznerClient = Depends(get_hetzner_client)
+):
+    """Create many servers from one template; events per server, then action progress with follow"""
+    batch_id = uuid.uuid4().hex[:6]
+    template = request.template.model_dump(exclude_none=True, exclude={"name_prefix"})
+    if not template.get("ssh_keys"):
+        template.pop("ssh_keys", None)
+    names = request.names or fleet_names(request.template.name_prefix, request.count, batch_id)
+    provisioner = FleetProvisioner(client, template, names, batch_id=batch_id, concurrency=request.concurrency)
+    reservation = await _reserve_servers(request.user_id, len(provisioner.names))
+    events = _settle_fleet(provisioner.run(follow=request.follow), provisioner, reservation)
+    
+    if stream:
+        return await stream_pages(_single_item_pages(events), stream)
+    
+    events = [event async for event in events]
+    return api_response(http_request, {
+        "success": provisioner.summary["failed"] == 0,
+        "data": [event for event in events if event["type"] in ("created", "failed")],
+        "meta": provisioner.summary
+    })
+
 @router.post("/servers/{server_id}/actions")
-async def server_action(server_id: int, request: ServerActionRequest):
+async def server_action(server_id: int, request: ServerActionRequest, client: HetznerClient = Depends(get_hetzner_client)):
     try:
-        client = HetznerClient()
         response = await client.server_action(server_id, request.action)
+        server_sync.wake()
+        await action_tracker.track(response.get("action"), server_id)
         return {
             "success": True,
             "data": response
@@ -79,11 +297,55 @@ async def server_action(server_id: int, request: ServerActionRequest):
     except HetznerAPIException as e:
         raise HTTPException(status_code=e.status_code, detail=e.message)
 
+@router.post("/servers/actions:bulk")
+async def bulk_server_action(
+    request: BulkServerActionRequest,
+    http_request: Request,
+    stream: Optional[str] = StreamFormat,
+    client: HetznerClient = Depends(get_hetzner_client)
+):
+    """Run one power action on many servers; per-server results, partial failures included"""
+    try:
+        runner = BulkActionRunner(
+            client,
+            request.action,
+            concurrency=request.concurrency,
+            wave_size=request.wave_size,
+            wave_delay=request.wave_delay,
+            wait_for_completion=request.wait_for_completion,
+            max_failures=request.max_failures
+        )
+    except HetznerAPIException as e:
+        raise HTTPException(status_code=e.status_code, detail=e.message)
+
+    server_sync.wake()
+    if stream:
+        return await stream_pages(_single_item_pages(runner.run(request.server_ids)), stream)
+
+    results = [result async for result in runner.run(request.server_ids)]
+    order = {server_id: index for index, server_id in enumerate(request.server_ids)}
+    results.sort(key=lambda result: order[result["server_id"]])
+    return api_response(http_request, {
+        "success": runner.summary["failed"] == 0 and runner.summary["skipped"] == 0,
+        "data": results,
+        "meta": runner.summary
+    })
+
+async def _single_item_pages(items):
+    async for item in items:
+        yield [item]
+
 @router.delete("/servers/{server_id}")
-async def delete_server(server_id: int):
+async def delete_server(
+    server_id: int,
+    user_id: Optional[int] = Query(None),  # give back one of this user's "servers" quota
+    client: HetznerClient = Depends(get_hetzner_client)
+):
     try:
-        client = HetznerClient()
         response = await client.delete_server(server_id)
+        if user_id is not None:
+            await quota_service.free(user_id, "servers")
+        server_sync.wake()
         return {
             "success": True,
             "data": response
@@ -91,38 +353,132 @@ async def delete_server(server_id: int):
     except HetznerAPIException as e:
         raise HTTPException(status_code=e.status_code, detail=e.message)
 
-@router.get("/server-types")
-async def get_server_types():
+@router.post("/servers/sync")
+async def sync_servers():
+    """Run a mirror sync pass now and return what it changed"""
     try:
-        client = HetznerClient()
-        response = await client.get_server_types()
+        result = await server_sync.sync_once()
         return {
             "success": True,
-            "data": response.get("server_types", [])
+            "data": result,
+            "meta": server_sync.get_stats()
         }
+    except (HetznerAPIException, NetworkException, TimeoutException) as e:
+        raise HTTPException(status_code=e.status_code, detail=e.to_dict())
+
+@router.get("/actions")
+async def get_actions(
+    request: Request,
+    id: List[int] = Query(..., min_length=1, max_length=500),
+    wait: float = Query(0, ge=0, le=60),
+    since: int = Query(0, ge=0)
+):
+    """
+    Batched action status; with ?wait= it long-polls until one of the actions
+    changes after version `since` (pass back meta.version from the last reply)
+    """
+    try:
+        if wait:
+            states, version = await action_tracker.wait(id, since, wait)
+        else:
+            states, version = await action_tracker.get(id), action_tracker.version
+        return api_response(request, {
+            "success": True,
+            "data": states,
+            "meta": {"version": version}
+        })
+    except (HetznerAPIException, NetworkException, TimeoutException) as e:
+        raise HTTPException(status_code=e.status_code, detail=e.to_dict())
+
+@router.get("/actions/stream")
+async def stream_actions(
+    id: List[int] = Query(..., min_length=1, max_length=500),
+    timeout: float = Query(600, gt=0, le=3600)
+):
+    """Server-Sent Events with action progress until every action finished"""
+    return sse_response(action_tracker.subscribe(id, timeout), event="action")
+
+async def _catalog_list(fetch, key: str, params: Dict[str, Any], tree) -> List[Dict[str, Any]]:
+    response = await fetch(params or None)
+    return project_items(response.get(key, []), tree)
+
+async def _catalog_response(request: Request, key: str, fetch, filters: Dict[str, Any], fields: Optional[str]):
+    """
+    Cached catalog listing, one entry per filter/fields combination (projected
+    before caching); If-None-Match against the entry's ETag short-circuits to 304
+    """
+    params = _upstream_params(key, filters)
+    tree = parse_fields(fields)
+    cache_key = stable_cache_key(key, **params, **({"fields": tree} if tree else {}))
+    entry = await catalog_cache.get_entry(cache_key, lambda: _catalog_list(fetch, key, params, tree))
+    return conditional_response(request, {"success": True, "data": entry.value}, entry.etag)
+
+async def _catalog_stream(client: HetznerClient, endpoint: str, key: str, filters: Dict[str, Any], fields: Optional[str], fmt: str):
+    pages = client.iter_pages(endpoint, key, _upstream_params(key, filters))
+    return await stream_pages(_projected_pages(pages, parse_fields(fields)), fmt)
+
+@router.get("/server-types")
+async def get_server_types(
+    request: Request,
+    stream: Optional[str] = StreamFormat,
+    fields: Optional[str] = FieldSelection,
+    filters: Dict[str, Any] = Depends(list_filters),
+    client: HetznerClient = Depends(get_hetzner_client)
+):
+    try:
+        if stream:
+            return await _catalog_stream(client, "/server_types", "server_types", filters, fields, stream)
+        return await _catalog_response(request, "server_types", client.get_server_types, filters, fields)
     except HetznerAPIException as e:
         raise HTTPException(status_code=e.status_code, detail=e.message)
 
 @router.get("/images")
-async def get_images():
+async def get_images(
+    request: Request,
+    stream: Optional[str] = StreamFormat,
+    fields: Optional[str] = FieldSelection,
+    filters: Dict[str, Any] = Depends(list_filters),
+    client: HetznerClient = Depends(get_hetzner_client)
+):
     try:
-        client = HetznerClient()
-        response = await client.get_images()
-        return {
-            "success": True,
-            "data": response.get("images", [])
-        }
+        if stream:
+            return await _catalog_stream(client, "/images", "images", filters, fields, stream)
+        return await _catalog_response(request, "images", client.get_images, filters, fields)
     except HetznerAPIException as e:
         raise HTTPException(status_code=e.status_code, detail=e.message)
 
 @router.get("/datacenters")
-async def get_datacenters():
+async def get_datacenters(
+    request: Request,
+    stream: Optional[str] = StreamFormat,
+    fields: Optional[str] = FieldSelection,
+    filters: Dict[str, Any] = Depends(list_filters),
+    client: HetznerClient = Depends(get_hetzner_client)
+):
     try:
-        client = HetznerClient()
-        response = await client.get_datacenters()
-        return {
-            "success": True,
-            "data": response.get("datacenters", [])
-        }
+        if stream:
+            return await _catalog_stream(client, "/datacenters", "datacenters", filters, fields, stream)
+        return await _catalog_response(request, "datacenters", client.get_datacenters, filters, fields)
+    except HetznerAPIException as e:
+        raise HTTPException(status_code=e.status_code, detail=e.message)
+
+@router.get("/pricing")
+async def get_pricing(request: Request):
+    """Hetzner's price list (cached; estimates are served from /billing/estimate)"""
+    try:
+        entry = await pricing_service.pricing()
+        return conditional_response(request, {"success": True, "data": entry.value}, entry.etag)
     except HetznerAPIException as e:
-        raise HTTPException(status_code=e.status_code, detail=e.message)
\ No newline at end of file
+        raise HTTPException(status_code=e.status_code, detail=e.message)
+
+@router.delete("/catalog-cache")
+async def invalidate_catalog_cache(name: Optional[str] = Query(None, pattern="^(server_types|images|datacenters|pricing)$")):
+    """Explicitly drop cached catalog data (all of it, or a single listing)"""
+    if name == "pricing":
+        await pricing_service.invalidate()
+    else:
+        await catalog_cache.invalidate(stable_cache_key(name) if name else None)
+    return {
+        "success": True,
+        "data": catalog_cache.get_stats()
+    }
\ No newline at end of file
@@ -0,0 +1,144 @@
+import asyncio
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Literal, Optional
+
+import msgpack
+import orjson
+from fastapi import APIRouter, HTTPException, Query, Request
+from pydantic import BaseModel, Field
+
+from services.metric_rollups import metric_rollups
+from services.metrics_query import metrics_query
+from services.metrics_ingest import metrics_ingestor, parse_batch
+from utils.compression import BodyTooLarge, decompress
+from utils.exceptions import DatabaseException, RateLimitException, ValidationException
+from utils.serialization import MSGPACK_MEDIA_TYPES, api_response
+
+router = APIRouter(prefix="/metrics", tags=["metrics"])
+
+class MetricsQueryRequest(BaseModel):
+    metric_types: Optional[List[str]] = Field(None, min_length=1)  # default: every type in range
+    aggregations: List[Literal["count", "sum", "avg", "min", "max", "rate", "p50", "p90", "p95", "p99"]] = Field(
+        ["avg", "p95"], min_length=1
+    )
+    group_by: List[Literal["server", "metric", "time"]] = ["metric"]
+    start: Optional[datetime] = None  # default: 24h before end
+    end: Optional[datetime] = None  # default: now
+    interval: Optional[int] = Field(None, ge=1)  # time bucket seconds, required with group_by "time"
+    server_ids: Optional[List[int]] = Field(None, min_length=1, max_length=10000)
+    user_id: Optional[int] = None  # every (non-deleted) server of this user
+
+def _decode_batch(body: bytes, content_encoding: str, content_type: str, limit: int) -> List[Dict[str, Any]]:
+    """Decompress, decode (JSON or MessagePack) and validate one ingest batch"""
+    try:
+        raw = decompress(body, content_encoding, limit)
+        if content_type.split(";")[0].strip() in MSGPACK_MEDIA_TYPES:
+            payload = msgpack.unpackb(raw, raw=False)
+        else:
+            payload = orjson.loads(raw)
+    except BodyTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except (ValueError, msgpack.UnpackException) as e:
+        raise ValidationException(f"Unreadable batch: {e}")
+    return parse_batch(payload)
+
+async def _read_body(request: Request, limit: int) -> bytes:
+    """The request body, refused with 413 as soon as it is known to be larger than `limit`"""
+    content_length = request.headers.get("content-length", "")
+    if content_length.isdigit() and int(content_length) > limit:
+        raise HTTPException(status_code=413, detail=f"Batch exceeds {limit} bytes")
+    # Content-Length may be missing (chunked uploads) or wrong: count what actually arrives
+    chunks, size = [], 0
+    async for chunk in request.stream():
+        size += len(chunk)
+        if size > limit:
+            raise HTTPException(status_code=413, detail=f"Batch exceeds {limit} bytes")
+        chunks.append(chunk)
+    return b"".join(chunks)
+
+@router.post("/ingest", status_code=202)
+async def ingest_metrics(request: Request):
+    """
+    Queue a batch of samples (JSON or MessagePack, optionally gzip/zstd/br
+    compressed); 429 with Retry-After while the write queue is full
+    """
+    try:
+        # Refuse early, before reading and decoding the body
+        metrics_ingestor.ensure_capacity()
+        body = await _read_body(request, metrics_ingestor.max_batch_bytes)
+        rows = await asyncio.to_thread(
+            _decode_batch,
+            body,
+            request.headers.get("content-encoding", "identity"),
+            request.headers.get("content-type", "application/json"),
+            metrics_ingestor.max_batch_bytes
+        )
+        if len(rows) > metrics_ingestor.max_batch_samples:
+            raise HTTPException(status_code=413, detail=f"Batch exceeds {metrics_ingestor.max_batch_samples} samples")
+        accepted = metrics_ingestor.offer(rows)
+    except (ValidationException, RateLimitException) as e:
+        headers = {"Retry-After": str(e.details["retry_after"])} if e.details.get("retry_after") else None
+        raise HTTPException(status_code=e.status_code, detail=e.to_dict(), headers=headers)
+    return {
+        "success": True,
+        "data": {"accepted": accepted},
+        "meta": {"pending": metrics_ingestor.pending, "capacity": metrics_ingestor.max_pending}
+    }
+
+@router.get("/ingest/stats")
+async def ingest_stats():
+    return {
+        "success": True,
+        "data": metrics_ingestor.get_stats()
+    }
+
+@router.get("/servers/{server_id}/series")
+async def server_series(
+    server_id: int,
+    request: Request,
+    type: List[str] = Query(...),
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    resolution: Optional[int] = Query(None, ge=1),
+    points: int = Query(500, ge=10, le=5000)
+):
+    """
+    Ingested samples as min/max/avg/count/p95 buckets (default: last 24h),
+    read from the coarsest rollup tier that satisfies the resolution
+    """
+    end = end or datetime.utcnow()
+    start = start or end - timedelta(days=1)
+    try:
+        data = await metric_rollups.query(server_id, type, start, end, points, resolution)
+    except (ValidationException, DatabaseException) as e:
+        raise HTTPException(status_code=e.status_code, detail=e.to_dict())
+    return api_response(request, {
+        "success": True,
+        "data": data
+    })
+
+@router.post("/query")
+async def query_metrics(query: MetricsQueryRequest, request: Request):
+    """
+    Aggregate raw samples across servers, e.g. p95 CPU over all servers of
+    a user: {"user_id": 7, "metric_types": ["cpu"], "aggregations": ["p95"]}
+    """
+    try:
+        data = await metrics_query.query(
+            query.metric_types, query.aggregations, query.group_by, query.start, query.end,
+            query.interval, query.server_ids, query.user_id
+        )
+    except (ValidationException, DatabaseException) as e:
+        raise HTTPException(status_code=e.status_code, detail=e.to_dict())
+    return api_response(request, {
+        "success": True,
+        "data": {"groups": data["groups"], "values": data["values"]},
+        "meta": data["meta"]
+    })
+
+@router.get("/rollups/stats")
+async def rollup_stats():
+    return {
+        "success": True,
+        "data": metric_rollups.get_stats()
+    }
@@ -0,0 +1,90 @@
+from typing import Optional
+
+from fastapi import APIRouter, HTTPException
+from pydantic import BaseModel, Field
+
+from services.quotas import quota_service
+from utils.exceptions import DatabaseException, QuotaExceededException, ValidationException
+
+router = APIRouter(prefix="/quotas", tags=["quotas"])
+
+class QuotaReserveRequest(BaseModel):
+    user_id: int = Field(..., ge=1)
+    resource_type: str = Field(..., pattern="^[a-z][a-z0-9_]{0,49}$")
+    amount: int = Field(1, ge=1, le=10000)
+    ttl: Optional[int] = Field(None, ge=1, le=86400)  # seconds until an uncommitted reservation lapses
+
+class QuotaCommitRequest(BaseModel):
+    amount: Optional[int] = Field(None, ge=0)  # how many were actually created (default: all reserved)
+
+class QuotaFreeRequest(BaseModel):
+    amount: int = Field(1, ge=1, le=10000)
+
+@router.post("/reserve")
+async def reserve_quota(request: QuotaReserveRequest):
+    """Hold quota before creating resources; 429 when the user's limit would be exceeded"""
+    try:
+        reservation = await quota_service.reserve(request.user_id, request.resource_type, request.amount, request.ttl)
+    except (QuotaExceededException, ValidationException, DatabaseException) as e:
+        raise HTTPException(status_code=e.status_code, detail=e.to_dict())
+    return {
+        "success": True,
+        "data": reservation.to_dict()
+    }
+
+@router.post("/reservations/{reservation_id}/commit")
+async def commit_reservation(reservation_id: str, request: Optional[QuotaCommitRequest] = None):
+    try:
+        data = await quota_service.commit(reservation_id, request.amount if request else None)
+    except (ValidationException, DatabaseException) as e:
+        raise HTTPException(status_code=e.status_code, detail=e.to_dict())
+    return {
+        "success": True,
+        "data": data
+    }
+
+@router.post("/reservations/{reservation_id}/release")
+async def release_reservation(reservation_id: str):
+    try:
+        data = await quota_service.release(reservation_id)
+    except (ValidationException, DatabaseException) as e:
+        raise HTTPException(status_code=e.status_code, detail=e.to_dict())
+    return {
+        "success": True,
+        "data": data
+    }
+
+@router.post("/{user_id}/{resource_type}/free")
+async def free_quota(user_id: int, resource_type: str, request: QuotaFreeRequest):
+    """Resources were deleted outside this service: lower the user's usage"""
+    try:
+        data = await quota_service.free(user_id, resource_type, request.amount)
+    except (ValidationException, DatabaseException) as e:
+        raise HTTPException(status_code=e.status_code, detail=e.to_dict())
+    return {
+        "success": True,
+        "data": data
+    }
+
+@router.post("/reconcile")
+async def reconcile_quotas():
+    """Write dirty counters to resource_quotas now (normally done by the leader every few seconds)"""
+    try:
+        reconciled = await quota_service.reconcile()
+    except DatabaseException as e:
+        raise HTTPException(status_code=e.status_code, detail=e.to_dict())
+    return {
+        "success": True,
+        "data": {"reconciled": reconciled, "stats": quota_service.get_stats()}
+    }
+
+@router.get("/{user_id}")
+async def get_quotas(user_id: int):
+    try:
+        data = await quota_service.usage(user_id)
+    except DatabaseException as e:
+        raise HTTPException(status_code=e.status_code, detail=e.to_dict())
+    return {
+        "success": True,
+        "data": data
+    }
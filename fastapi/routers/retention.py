@@ -0,0 +1,31 @@
+from typing import List, Optional
+
+from fastapi import APIRouter, HTTPException, Query
+
+from services.retention import retention
+
+router = APIRouter(prefix="/retention", tags=["retention"])
+
+@router.get("/status")
+async def retention_status():
+    """Policies plus per-table progress of the current or last run"""
+    return {
+        "success": True,
+        "data": retention.get_stats()
+    }
+
+@router.post("/run", status_code=202)
+async def run_retention(
+    table: Optional[List[str]] = Query(None),
+    dry_run: bool = False
+):
+    """Start a retention run now (dry_run counts expired rows without deleting); poll /retention/status"""
+    unknown = sorted(set(table or []) - set(retention.policies))
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"No retention policy for: {', '.join(unknown)}")
+    if not retention.trigger(table, dry_run):
+        raise HTTPException(status_code=409, detail="A retention run is already in progress")
+    return {
+        "success": True,
+        "data": {"started": True, "tables": table or [name for name, policy in retention.policies.items() if policy.enabled], "dry_run": dry_run}
+    }
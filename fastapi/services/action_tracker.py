@@ -0,0 +1,400 @@
+"""
+Tracks Hetzner actions (server creates, power actions) until they finish
+
+Actions are recorded in server_actions. One background poller per process
+refreshes every running action with batched GET /actions?id=... calls and
+publishes changes to waiting clients (long-poll and SSE), replacing
+per-client polling of individual servers.
+"""
+
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from sqlalchemy import insert, select, update
+
+from models.database_models import Server, ServerAction
+from services.database import get_async_session
+from services.hetzner_client import HetznerClient, get_http_client
+from services.server_sync import parse_created, server_sync
+from utils.exceptions import BaseAPIException
+
+logger = logging.getLogger(__name__)
+
+FINISHED = ("success", "error")
+
+def _finished(state: Dict[str, Any]) -> bool:
+    return state["status"] in FINISHED
+
+class ActionTracker:
+    """In-process registry of tracked actions plus the batched poller"""
+
+    def __init__(self):
+        self.poll_interval = float(os.getenv("ACTION_POLL_INTERVAL", "1"))
+        # Hetzner pages are capped at 50 objects
+        self.batch_size = max(1, min(50, int(os.getenv("ACTION_POLL_BATCH_SIZE", "50"))))
+        self.retention = float(os.getenv("ACTION_RETENTION", "300"))
+        self.resume_window = float(os.getenv("ACTION_RESUME_WINDOW", "3600"))
+        self.max_misses = 3
+        # Same bound as bulk actions, which register many servers' actions at once
+        self.mirror_concurrency = max(1, int(os.getenv("BULK_ACTION_CONCURRENCY", "10")))
+
+        # Hetzner action id -> public state; row ids are None when the action has no server_actions row
+        self._actions: Dict[int, Dict[str, Any]] = {}
+        self._row_ids: Dict[int, Optional[int]] = {}
+        self._misses: Dict[int, int] = {}
+        self._finished_at: Dict[int, float] = {}
+        self.version = 0
+        self._changed = asyncio.Condition()
+        self._wake = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self.stats = {"tracked": 0, "polls": 0, "polled_actions": 0, "updates": 0, "poll_errors": 0, "subscribers": 0}
+
+    # Lifecycle
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        try:
+            await self._resume()
+        except Exception as e:
+            logger.warning(f"Could not resume running actions: {str(e)}")
+
+        while True:
+            self._wake.clear()
+            running = [action_id for action_id, state in self._actions.items() if not _finished(state)]
+            self._expire()
+            if not running:
+                # Idle: no upstream traffic until something is tracked
+                await self._wake.wait()
+                continue
+            try:
+                await self.poll_once(running)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.stats["poll_errors"] += 1
+                logger.warning(f"Action poll failed: {str(e)}")
+            await asyncio.sleep(self.poll_interval)
+
+    async def _resume(self):
+        """Pick up actions that were still running when the process last stopped"""
+        cutoff = datetime.utcfromtimestamp(time.time() - self.resume_window)
+        async with get_async_session() as session:
+            result = await session.execute(
+                select(ServerAction, Server.hetzner_id)
+                .join(Server, Server.id == ServerAction.server_id)
+                .where(
+                    ServerAction.status == "running",
+                    ServerAction.hetzner_action_id.isnot(None),
+                    ServerAction.started_at >= cutoff
+                )
+            )
+            rows = result.all()
+        async with self._changed:
+            for row, hetzner_server_id in rows:
+                self._register(row.hetzner_action_id, row.id, {
+                    "id": row.hetzner_action_id,
+                    "command": row.action_type,
+                    "status": row.status,
+                    "progress": row.progress or 0,
+                    "started": row.started_at.isoformat() if row.started_at else None,
+                    "finished": None,
+                    "error": None
+                }, hetzner_server_id)
+        if rows:
+            logger.info(f"Resumed tracking of {len(rows)} running actions")
+
+    # Tracking
+
+    async def track(
+        self,
+        action: Optional[Dict[str, Any]],
+        hetzner_server_id: int,
+        server: Optional[Dict[str, Any]] = None
+    ) -> Optional[Dict[str, Any]]:
+        """Record an action returned by Hetzner and start watching it"""
+        if not action:
+            return None
+        states = await self.track_many([(action, hetzner_server_id, server)])
+        return states[0]
+
+    async def track_many(
+        self,
+        items: List[Tuple[Dict[str, Any], int, Optional[Dict[str, Any]]]]
+    ) -> List[Dict[str, Any]]:
+        """Record many actions with one multi-row insert: (action, hetzner server id, server object or None)"""
+        row_ids = {}
+        try:
+            row_ids = await self._insert_rows(items)
+        except Exception as e:
+            # Tracking still works from memory; only the history row is missing
+            logger.warning(f"Could not record {len(items)} actions: {str(e)}")
+
+        async with self._changed:
+            self.version += 1
+            states = [
+                self._register(action["id"], row_ids.get(action["id"]), action, hetzner_server_id)
+                for action, hetzner_server_id, _ in items
+            ]
+            self._changed.notify_all()
+        self.stats["tracked"] += len(items)
+        self._wake.set()
+        return states
+
+    async def _insert_rows(self, items) -> Dict[int, int]:
+        local_ids = {}
+        for action, hetzner_server_id, server in items:
+            local_ids[hetzner_server_id] = (
+                await server_sync.ensure_mirrored(server) if server else await server_sync.local_id(hetzner_server_id)
+            )
+        
+        # server_actions.server_id is required, so unmirrored servers get their mirror row first:
+        # one GET per server, at most mirror_concurrency in flight, and only for the servers involved
+        missing = [hetzner_id for hetzner_id, server_id in local_ids.items() if server_id is None]
+        if missing:
+            client = HetznerClient(get_http_client())
+            semaphore = asyncio.Semaphore(self.mirror_concurrency)
+            mirrored = await asyncio.gather(
+                *(self._mirror(client, semaphore, hetzner_id) for hetzner_id in missing)
+            )
+            local_ids.update(zip(missing, mirrored))
+        
+        rows = []
+        for action, hetzner_server_id, server in items:
+            server_id = local_ids[hetzner_server_id]
+            if server_id is None:
+                continue
+            rows.append({
+                "server_id": server_id,
+                "hetzner_action_id": action["id"],
+                "action_type": action.get("command") or "unknown",
+                "status": action.get("status", "running"),
+                "progress": action.get("progress", 0),
+                "started_at": parse_created(action.get("started")) or datetime.utcnow(),
+                "finished_at": parse_created(action.get("finished")),
+                "error_message": (action.get("error") or {}).get("message")
+            })
+        if not rows:
+            return {}
+
+        async with get_async_session() as session:
+            await session.execute(insert(ServerAction), rows)
+            result = await session.execute(
+                select(ServerAction.id, ServerAction.hetzner_action_id)
+                .where(ServerAction.hetzner_action_id.in_([row["hetzner_action_id"] for row in rows]))
+            )
+            # Latest row wins if an action id was recorded before
+            return {hetzner_action_id: row_id for row_id, hetzner_action_id in sorted(result.all())}
+
+    async def _mirror(self, client: HetznerClient, semaphore: asyncio.Semaphore, hetzner_server_id: int) -> Optional[int]:
+        """Mirror row id for one server fetched from Hetzner; None skips its history rows"""
+        async with semaphore:
+            try:
+                server = (await client.get_server(hetzner_server_id)).get("server")
+                return await server_sync.ensure_mirrored(server) if server else None
+            except BaseAPIException as e:
+                logger.warning(f"Could not mirror server {hetzner_server_id}: {str(e)}")
+                return None
+
+    def _register(self, action_id: int, row_id: Optional[int], action: Dict[str, Any], hetzner_server_id: Optional[int]) -> Dict[str, Any]:
+        """Add or replace an action's state (caller holds the condition)"""
+        state = {
+            "id": action_id,
+            "server_id": hetzner_server_id,
+            "command": action.get("command"),
+            "status": action.get("status", "running"),
+            "progress": action.get("progress", 0),
+            "started": action.get("started"),
+            "finished": action.get("finished"),
+            "error": action.get("error"),
+            "version": self.version
+        }
+        self._actions[action_id] = state
+        if row_id is not None or action_id not in self._row_ids:
+            self._row_ids[action_id] = row_id
+        if _finished(state):
+            self._finished_at[action_id] = time.monotonic()
+        return state
+
+    # Polling
+
+    async def poll_once(self, action_ids: List[int]) -> int:
+        """Refresh the given actions in batches and publish what changed"""
+        client = HetznerClient(get_http_client())
+        fetched: Dict[int, Dict[str, Any]] = {}
+        for i in range(0, len(action_ids), self.batch_size):
+            chunk = action_ids[i:i + self.batch_size]
+            response = await client.get_actions(chunk)
+            self.stats["polls"] += 1
+            self.stats["polled_actions"] += len(chunk)
+            for action in response.get("actions", []):
+                fetched[action["id"]] = action
+
+        changed = []
+        for action_id in action_ids:
+            current = self._actions.get(action_id)
+            if current is None:
+                continue
+            action = fetched.get(action_id)
+            if action is None:
+                # Not returned: give up after a few polls instead of watching it forever
+                self._misses[action_id] = self._misses.get(action_id, 0) + 1
+                if self._misses[action_id] < self.max_misses:
+                    continue
+                action = {**current, "status": "error", "error": {"code": "not_found", "message": "Action no longer reported by Hetzner"}}
+            if (action["status"], action["progress"]) != (current["status"], current["progress"]):
+                changed.append(action)
+
+        if changed:
+            await self._persist(changed)
+            async with self._changed:
+                self.version += 1
+                for action in changed:
+                    current = self._actions[action["id"]]
+                    self._register(action["id"], self._row_ids.get(action["id"]), {**current, **action}, current["server_id"])
+                self._changed.notify_all()
+            self.stats["updates"] += len(changed)
+        return len(changed)
+
+    async def _persist(self, actions: List[Dict[str, Any]]):
+        rows = [
+            {
+                "id": self._row_ids[action["id"]],
+                "status": action["status"],
+                "progress": action["progress"],
+                "finished_at": parse_created(action.get("finished")) or (datetime.utcnow() if action["status"] in FINISHED else None),
+                "error_message": (action.get("error") or {}).get("message")
+            }
+            for action in actions if self._row_ids.get(action["id"]) is not None
+        ]
+        if not rows:
+            return
+        try:
+            async with get_async_session() as session:
+                await session.execute(update(ServerAction), rows)
+        except Exception as e:
+            logger.warning(f"Could not persist {len(rows)} action updates: {str(e)}")
+
+    def _expire(self):
+        """Forget finished actions once late subscribers have had time to see them"""
+        cutoff = time.monotonic() - self.retention
+        for action_id in [a for a, finished_at in self._finished_at.items() if finished_at < cutoff]:
+            self._finished_at.pop(action_id, None)
+            self._actions.pop(action_id, None)
+            self._row_ids.pop(action_id, None)
+            self._misses.pop(action_id, None)
+
+    # Reads
+
+    async def get(self, action_ids: List[int]) -> List[Dict[str, Any]]:
+        """Current state of the given actions; unknown IDs are looked up once and then watched"""
+        missing = [action_id for action_id in action_ids if action_id not in self._actions]
+        if missing:
+            await self._adopt(missing)
+        return [self._actions[action_id] for action_id in action_ids if action_id in self._actions]
+
+    async def _adopt(self, action_ids: List[int]):
+        known: Dict[int, Tuple[int, int]] = {}
+        try:
+            async with get_async_session() as session:
+                result = await session.execute(
+                    select(ServerAction.hetzner_action_id, ServerAction.id, Server.hetzner_id)
+                    .join(Server, Server.id == ServerAction.server_id)
+                    .where(ServerAction.hetzner_action_id.in_(action_ids))
+                )
+                known = {action_id: (row_id, server_id) for action_id, row_id, server_id in result.all()}
+        except Exception as e:
+            logger.warning(f"Could not look up actions {action_ids}: {str(e)}")
+
+        client = HetznerClient(get_http_client())
+        fetched = []
+        for i in range(0, len(action_ids), self.batch_size):
+            response = await client.get_actions(action_ids[i:i + self.batch_size])
+            fetched.extend(response.get("actions", []))
+
+        async with self._changed:
+            self.version += 1
+            for action in fetched:
+                if action["id"] in self._actions:
+                    continue
+                row_id, server_id = known.get(action["id"], (None, None))
+                if server_id is None:
+                    server_id = next((r["id"] for r in action.get("resources") or [] if r.get("type") == "server"), None)
+                self._register(action["id"], row_id, action, server_id)
+            self._changed.notify_all()
+        self._wake.set()
+
+    def _changed_since(self, action_ids: List[int], since: int) -> bool:
+        states = [self._actions[action_id] for action_id in action_ids if action_id in self._actions]
+        return any(state["version"] > since for state in states)
+
+    async def wait(self, action_ids: List[int], since: int, timeout: float) -> Tuple[List[Dict[str, Any]], int]:
+        """Long-poll: return once any of the actions changed after `since`, or at timeout"""
+        states = await self.get(action_ids)
+        if states and all(_finished(state) for state in states):
+            return states, self.version
+        async with self._changed:
+            try:
+                await asyncio.wait_for(self._changed.wait_for(lambda: self._changed_since(action_ids, since)), timeout)
+            except asyncio.TimeoutError:
+                pass
+            return [self._actions[action_id] for action_id in action_ids if action_id in self._actions], self.version
+
+    async def wait_finished(self, action_ids: List[int], timeout: float) -> List[Dict[str, Any]]:
+        """Block until every action finished (or timeout) and return the latest states"""
+        deadline = time.monotonic() + timeout
+        states = await self.get(action_ids)
+        since = self.version
+        while states and not all(_finished(state) for state in states):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            states, since = await self.wait(action_ids, since, remaining)
+        return states
+
+    async def subscribe(self, action_ids: List[int], timeout: float, heartbeat: float = 15.0) -> AsyncIterator[List[Dict[str, Any]]]:
+        """
+        Yield the initial states, then each batch of changes, until every action
+        finished or the timeout passed; an empty batch is a heartbeat
+        """
+        self.stats["subscribers"] += 1
+        try:
+            deadline = time.monotonic() + timeout
+            states = await self.get(action_ids)
+            since = self.version
+            yield states
+            while states and not all(_finished(state) for state in states):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return
+                states, version = await self.wait(action_ids, since, min(heartbeat, remaining))
+                yield [state for state in states if state["version"] > since]
+                since = version
+        finally:
+            self.stats["subscribers"] -= 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            "watching": sum(1 for state in self._actions.values() if not _finished(state)),
+            "retained": len(self._actions),
+            "version": self.version
+        }
+
+# Global tracker instance
+action_tracker = ActionTracker()
@@ -0,0 +1,130 @@
+"""
+Fleet-wide power actions with bounded concurrency
+
+Servers are processed in rolling waves; within a wave at most `concurrency`
+requests are in flight, and every request still goes through the shared
+outbound rate limiter. Results are yielded per server as they complete, so
+callers can stream them or collect them into one response.
+"""
+
+import asyncio
+import logging
+import os
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from services.action_tracker import action_tracker
+from services.hetzner_client import HetznerClient
+from utils.exceptions import BaseAPIException
+
+logger = logging.getLogger(__name__)
+
+class BulkActionRunner:
+    """Run one action against many servers"""
+
+    def __init__(
+        self,
+        client: HetznerClient,
+        action: str,
+        concurrency: Optional[int] = None,
+        wave_size: Optional[int] = None,
+        wave_delay: float = 0.0,
+        wait_for_completion: bool = False,
+        max_failures: Optional[int] = None
+    ):
+        client.validate_server_action(action)
+        self.client = client
+        self.action = action
+        self.concurrency = concurrency or int(os.getenv("BULK_ACTION_CONCURRENCY", "10"))
+        self.wave_size = wave_size
+        self.wave_delay = wave_delay
+        self.wait_for_completion = wait_for_completion
+        self.max_failures = max_failures
+        self.wave_timeout = float(os.getenv("BULK_ACTION_WAVE_TIMEOUT", "600"))
+        self.summary = {"requested": 0, "succeeded": 0, "failed": 0, "skipped": 0, "waves": 0}
+
+    async def _run_one(self, semaphore: asyncio.Semaphore, server_id: int, wave: int) -> Dict[str, Any]:
+        async with semaphore:
+            try:
+                response = await self.client.server_action(server_id, self.action)
+                return {"server_id": server_id, "wave": wave, "success": True, "action": response.get("action")}
+            except BaseAPIException as e:
+                return {"server_id": server_id, "wave": wave, "success": False, "error": e.to_dict()}
+
+    async def run(self, server_ids: List[int]) -> AsyncIterator[Dict[str, Any]]:
+        """Yield one result per server (duplicates removed, input order kept per wave)"""
+        server_ids = list(dict.fromkeys(server_ids))
+        self.summary["requested"] = len(server_ids)
+        wave_size = self.wave_size or max(1, len(server_ids))
+        semaphore = asyncio.Semaphore(self.concurrency)
+        failures = 0
+
+        for start in range(0, len(server_ids), wave_size):
+            wave = start // wave_size + 1
+            wave_ids = server_ids[start:start + wave_size]
+
+            if self.max_failures is not None and failures > self.max_failures:
+                # Stop rolling further waves once the fleet looks unhealthy
+                for server_id in wave_ids:
+                    self.summary["skipped"] += 1
+                    yield {
+                        "server_id": server_id, "wave": wave, "success": False, "skipped": True,
+                        "error": {"message": f"Skipped: more than {self.max_failures} failures in earlier waves"}
+                    }
+                continue
+
+            if wave > 1 and self.wave_delay:
+                await asyncio.sleep(self.wave_delay)
+            self.summary["waves"] += 1
+
+            tasks = [asyncio.create_task(self._run_one(semaphore, server_id, wave)) for server_id in wave_ids]
+            try:
+                if self.wait_for_completion:
+                    results = await self._complete_wave(await asyncio.gather(*tasks))
+                else:
+                    results = []
+                    for next_done in asyncio.as_completed(tasks):
+                        result = await next_done
+                        results.append(result)
+                        failures += self._count(result)
+                        yield result
+                    await self._track(results)
+                    continue
+            finally:
+                for task in tasks:
+                    task.cancel()
+
+            for result in results:
+                failures += self._count(result)
+                yield result
+
+    async def _complete_wave(self, results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Track the wave's actions and wait for them to finish before the next wave starts"""
+        await self._track(results)
+        action_ids = [result["action"]["id"] for result in results if result["success"] and result.get("action")]
+        if not action_ids:
+            return results
+        final = {state["id"]: state for state in await action_tracker.wait_finished(action_ids, self.wave_timeout)}
+        for result in results:
+            state = final.get((result.get("action") or {}).get("id"))
+            if state is None:
+                continue
+            result["action"] = {**result["action"], **{k: state[k] for k in ("status", "progress", "finished", "error")}}
+            if state["status"] == "error":
+                result["success"] = False
+                result["error"] = state["error"] or {"message": "Action failed"}
+            elif state["status"] != "success":
+                result["success"] = False
+                result["error"] = {"message": f"Action still {state['status']} after {self.wave_timeout:.0f}s"}
+        return results
+
+    async def _track(self, results: List[Dict[str, Any]]):
+        items = [(result["action"], result["server_id"], None) for result in results if result["success"] and result.get("action")]
+        if items:
+            await action_tracker.track_many(items)
+
+    def _count(self, result: Dict[str, Any]) -> int:
+        if result["success"]:
+            self.summary["succeeded"] += 1
+            return 0
+        self.summary["failed"] += 1
+        return 1
@@ -0,0 +1,210 @@
+"""
+Read-through cache for rarely changing Hetzner catalog data
+(server types, images, datacenters)
+
+Two tiers: an in-process dict in front of Redis. Entries are served fresh
+for `ttl` seconds, then served stale for up to `stale_ttl` more seconds
+while a single background task refreshes them. Filtered listings are
+cached under `<name>:<hash of filters>`, next to the unfiltered `<name>`.
+"""
+
+import asyncio
+import logging
+import os
+import time
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from services.database import redis_manager
+from utils.http_cache import content_etag
+from utils.single_flight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+@dataclass
+class CacheEntry:
+    value: Any
+    fetched_at: float
+    ttl: float
+    stale_ttl: float
+    # Hash of the cached representation, computed once when the value is stored
+    etag: Optional[str] = None
+    
+    def __post_init__(self):
+        if self.etag is None:
+            self.etag = content_etag(self.value)
+    
+    @property
+    def age(self) -> float:
+        return time.time() - self.fetched_at
+    
+    def is_fresh(self) -> bool:
+        return self.age < self.ttl
+    
+    def is_usable(self) -> bool:
+        return self.age < self.ttl + self.stale_ttl
+
+class CatalogCache:
+    """Two-tier stale-while-revalidate cache"""
+    
+    def __init__(
+        self,
+        ttl: Optional[float] = None,
+        stale_ttl: Optional[float] = None,
+        namespace: str = "catalog",
+        max_entries: Optional[int] = None
+    ):
+        self.ttl = ttl if ttl is not None else float(os.getenv("CATALOG_CACHE_TTL", "300"))
+        self.stale_ttl = stale_ttl if stale_ttl is not None else float(os.getenv("CATALOG_CACHE_STALE_TTL", "3600"))
+        self.namespace = namespace
+        self.max_entries = max_entries or int(os.getenv("CATALOG_CACHE_MAX_ENTRIES", "1000"))
+        self._local: Dict[str, CacheEntry] = {}
+        self._loads = SingleFlight()
+        self._refreshing: Dict[str, asyncio.Task] = {}
+        # Bumped by invalidate(); a load that started under an older generation is not stored
+        self._epoch = 0
+        self._generations: Dict[str, int] = {}
+        self.stats = {"hits": 0, "stale_hits": 0, "redis_hits": 0, "misses": 0, "refreshes": 0, "refresh_errors": 0}
+    
+    def _redis_key(self, key: str) -> str:
+        return f"{self.namespace}:{key}"
+    
+    async def _redis_get(self, key: str) -> Optional[CacheEntry]:
+        # The Redis client is synchronous; keep it off the event loop
+        data = await asyncio.to_thread(redis_manager.get, self._redis_key(key))
+        if not data or "value" not in data:
+            return None
+        return CacheEntry(data["value"], data["fetched_at"], data["ttl"], data["stale_ttl"], data.get("etag"))
+    
+    async def _redis_set(self, key: str, entry: CacheEntry):
+        data = {
+            "value": entry.value,
+            "fetched_at": entry.fetched_at,
+            "ttl": entry.ttl,
+            "stale_ttl": entry.stale_ttl,
+            "etag": entry.etag
+        }
+        await asyncio.to_thread(redis_manager.set, self._redis_key(key), data, int(entry.ttl + entry.stale_ttl))
+    
+    def _generation(self, key: str) -> tuple:
+        # Filtered variants (<name>:<hash>) are invalidated together with <name>
+        return (self._epoch, self._generations.get(key, 0), self._generations.get(key.split(":", 1)[0], 0))
+    
+    async def _load(self, key: str, loader: Callable[[], Awaitable[Any]], ttl: float, stale_ttl: float) -> CacheEntry:
+        """Run the loader once per key, sharing the result with concurrent callers"""
+        generation = self._generation(key)
+        
+        async def load() -> CacheEntry:
+            value = await loader()
+            entry = CacheEntry(value, time.time(), ttl, stale_ttl)
+            if self._generation(key) != generation:
+                # Invalidated while loading: hand the value to the waiting callers, but do not cache it
+                return entry
+            self._local[key] = entry
+            self._evict()
+            await self._redis_set(key, entry)
+            if self._generation(key) != generation:
+                # invalidate() ran while the write was in flight; undo it
+                self._local.pop(key, None)
+                await asyncio.to_thread(redis_manager.delete, self._redis_key(key))
+            return entry
+        
+        return await self._loads.do((key, generation), load)
+    
+    def _evict(self):
+        """Bound the local tier: every filter combination adds an entry"""
+        if len(self._local) <= self.max_entries:
+            return
+        for key in [key for key, entry in self._local.items() if not entry.is_usable()]:
+            del self._local[key]
+        overflow = len(self._local) - self.max_entries
+        if overflow > 0:
+            for key in sorted(self._local, key=lambda key: self._local[key].fetched_at)[:overflow]:
+                del self._local[key]
+    
+    def _schedule_refresh(self, key: str, loader: Callable[[], Awaitable[Any]], ttl: float, stale_ttl: float):
+        if key in self._refreshing:
+            return
+        
+        async def refresh():
+            try:
+                await self._load(key, loader, ttl, stale_ttl)
+                self.stats["refreshes"] += 1
+            except Exception as e:
+                # Keep serving the stale value; the next request retries
+                self.stats["refresh_errors"] += 1
+                logger.warning(f"Background refresh failed for {key}: {str(e)}")
+            finally:
+                self._refreshing.pop(key, None)
+        
+        self._refreshing[key] = asyncio.create_task(refresh())
+    
+    async def get_or_load(
+        self,
+        key: str,
+        loader: Callable[[], Awaitable[Any]],
+        ttl: Optional[float] = None,
+        stale_ttl: Optional[float] = None
+    ) -> Any:
+        """Return the cached value for key, loading or revalidating it as needed"""
+        return (await self.get_entry(key, loader, ttl, stale_ttl)).value
+    
+    async def get_entry(
+        self,
+        key: str,
+        loader: Callable[[], Awaitable[Any]],
+        ttl: Optional[float] = None,
+        stale_ttl: Optional[float] = None
+    ) -> CacheEntry:
+        """Like get_or_load, but return the entry (value plus its precomputed ETag)"""
+        ttl = self.ttl if ttl is None else ttl
+        stale_ttl = self.stale_ttl if stale_ttl is None else stale_ttl
+        
+        entry = self._local.get(key)
+        if entry is None or not entry.is_usable():
+            entry = await self._redis_get(key)
+            if entry is not None and entry.is_usable():
+                self._local[key] = entry
+                self.stats["redis_hits"] += 1
+            else:
+                entry = None
+        
+        if entry is None:
+            self.stats["misses"] += 1
+            return await self._load(key, loader, ttl, stale_ttl)
+        
+        if entry.is_fresh():
+            self.stats["hits"] += 1
+        else:
+            self.stats["stale_hits"] += 1
+            self._schedule_refresh(key, loader, ttl, stale_ttl)
+        return entry
+    
+    async def invalidate(self, key: Optional[str] = None):
+        """Drop one key (with its filtered variants), or every key in the namespace, from both tiers"""
+        if key is not None:
+            self._generations[key] = self._generations.get(key, 0) + 1
+            for local_key in [k for k in self._local if k == key or k.startswith(f"{key}:")]:
+                del self._local[local_key]
+            await asyncio.to_thread(redis_manager.delete, self._redis_key(key))
+            await asyncio.to_thread(self._redis_delete_matching, f"{self._redis_key(key)}:*")
+        else:
+            self._epoch += 1
+            self._local.clear()
+            await asyncio.to_thread(self._redis_delete_matching, f"{self.namespace}:*")
+        logger.info(f"Catalog cache invalidated: {key or 'all'}")
+    
+    def _redis_delete_matching(self, pattern: str):
+        if not redis_manager.redis_client:
+            return
+        try:
+            for redis_key in redis_manager.redis_client.scan_iter(match=pattern):
+                redis_manager.redis_client.delete(redis_key)
+        except Exception as e:
+            logger.error(f"Redis delete error for {pattern}: {str(e)}")
+    
+    def get_stats(self) -> Dict[str, Any]:
+        return {**self.stats, "entries": len(self._local), "refreshing": len(self._refreshing)}
+
+# Global catalog cache instance
+catalog_cache = CatalogCache()
@@ -1,15 +1,20 @@
 import os
+import time
+import asyncio
 import logging
+import threading
 from contextlib import asynccontextmanager
-from typing import Generator, Optional, AsyncGenerator
+from typing import Any, Callable, Dict, Generator, List, Optional, AsyncGenerator
 from sqlalchemy import create_engine, pool, event, text
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, Session
-from sqlalchemy.pool import QueuePool
-from sqlalchemy.engine import Engine
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.exc import SQLAlchemyError, DisconnectionError
 import redis
 import json
+import hashlib
 from datetime import datetime, timedelta
 
 from utils.exceptions import DatabaseException
@@ -18,10 +23,30 @@ from utils.logging_config import setup_logging
 # Setup logging
 logger = logging.getLogger(__name__)
 
+# Sync driver -> asyncio driver for the same backend
+ASYNC_DRIVERS = {
+    "mysql": "mysql+aiomysql",
+    "sqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg"
+}
+
+def to_async_url(database_url: str) -> str:
+    """Map a sync DATABASE_URL (e.g. mysql+pymysql://) to its asyncio driver"""
+    url = make_url(database_url)
+    if url.get_driver_name() in ("aiomysql", "asyncmy", "aiosqlite", "asyncpg"):
+        return database_url
+    driver = ASYNC_DRIVERS.get(url.get_backend_name())
+    if not driver:
+        raise DatabaseException(f"No async driver known for {url.get_backend_name()}; set ASYNC_DATABASE_URL")
+    return url.set(drivername=driver).render_as_string(hide_password=False)
+
 class DatabaseManager:
     """
     Database connection and session management
     Handles connection pooling, health checks, and error recovery
+    
+    Request handlers use the asyncio engine (AsyncSession); the sync engine
+    is kept for scripts, migrations and background jobs running in threads
     """
     
     def __init__(self):
@@ -31,8 +56,11 @@ class DatabaseManager:
         
         self.engine = None
         self.SessionLocal = None
+        self.async_engine = None
+        self.AsyncSessionLocal = None
         self.Base = declarative_base()
         self._initialize_engine()
+        self._initialize_async_engine()
         self._setup_event_listeners()
     
     def _initialize_engine(self):
@@ -51,7 +79,7 @@ class DatabaseManager:
                     "charset": "utf8mb4",
                     "autocommit": False,
                     "connect_timeout": 10
-                }
+                } if "mysql" in self.database_url else {}
             )
             
             self.SessionLocal = sessionmaker(
@@ -66,6 +94,48 @@ class DatabaseManager:
             logger.error(f"Failed to initialize database engine: {str(e)}")
             raise DatabaseException(f"Database initialization failed: {str(e)}")
     
+    def _initialize_async_engine(self):
+        """Initialize the asyncio engine used from request handlers"""
+        try:
+            self.async_database_url = os.getenv("ASYNC_DATABASE_URL") or to_async_url(self.database_url)
+            connect_args = {}
+            if "mysql" in self.async_database_url:
+                # Same session settings the sync engine applies in its connect listener
+                connect_args = {
+                    "charset": "utf8mb4",
+                    "autocommit": False,
+                    "connect_timeout": 10,
+                    "init_command": "SET SESSION sql_mode='STRICT_TRANS_TABLES', innodb_lock_wait_timeout=10"
+                }
+            
+            self.async_engine = create_async_engine(
+                self.async_database_url,
+                poolclass=AsyncAdaptedQueuePool,
+                pool_size=int(os.getenv("DB_ASYNC_POOL_SIZE", os.getenv("DB_POOL_SIZE", "10"))),
+                max_overflow=int(os.getenv("DB_ASYNC_MAX_OVERFLOW", os.getenv("DB_MAX_OVERFLOW", "20"))),
+                pool_pre_ping=True,
+                pool_recycle=int(os.getenv("DB_POOL_RECYCLE", "3600")),
+                pool_timeout=int(os.getenv("DB_POOL_TIMEOUT", "30")),
+                echo=os.getenv("SQL_DEBUG", "false").lower() == "true",
+                connect_args=connect_args
+            )
+            
+            # expire_on_commit=False: attribute access after commit must not trigger implicit IO
+            self.AsyncSessionLocal = async_sessionmaker(
+                self.async_engine,
+                class_=AsyncSession,
+                autoflush=False,
+                expire_on_commit=False
+            )
+            
+            logger.info("Async database engine initialized successfully")
+            
+        except DatabaseException:
+            raise
+        except Exception as e:
+            logger.error(f"Failed to initialize async database engine: {str(e)}")
+            raise DatabaseException(f"Async database initialization failed: {str(e)}")
+    
     def _setup_event_listeners(self):
         """Setup SQLAlchemy event listeners for monitoring"""
         
@@ -77,20 +147,23 @@ class DatabaseManager:
                     cursor.execute("SET SESSION sql_mode='STRICT_TRANS_TABLES'")
                     cursor.execute("SET SESSION innodb_lock_wait_timeout=10")
         
-        @event.listens_for(self.engine, "checkout")
         def receive_checkout(dbapi_connection, connection_record, connection_proxy):
             """Log connection checkout"""
             logger.debug("Database connection checked out from pool")
         
-        @event.listens_for(self.engine, "checkin")
         def receive_checkin(dbapi_connection, connection_record):
             """Log connection checkin"""
             logger.debug("Database connection checked in to pool")
         
-        @event.listens_for(self.engine, "invalidate")
         def receive_invalidate(dbapi_connection, connection_record, exception):
             """Handle connection invalidation"""
             logger.warning(f"Database connection invalidated: {exception}")
+        
+        # Async engine pool events are emitted on its sync_engine
+        for engine in (self.engine, self.async_engine.sync_engine):
+            event.listen(engine, "checkout", receive_checkout)
+            event.listen(engine, "checkin", receive_checkin)
+            event.listen(engine, "invalidate", receive_invalidate)
     
     def get_session(self) -> Session:
         """Get a new database session"""
@@ -103,6 +176,12 @@ class DatabaseManager:
             logger.error(f"Failed to create database session: {str(e)}")
             raise DatabaseException(f"Session creation failed: {str(e)}")
     
+    def get_async_session(self) -> AsyncSession:
+        """Get a new asyncio database session"""
+        if not self.AsyncSessionLocal:
+            raise DatabaseException("Async database not initialized")
+        return self.AsyncSessionLocal()
+    
     def create_tables(self):
         """Create all database tables"""
         try:
@@ -145,14 +224,7 @@ class DatabaseManager:
             health_status["checks"]["session_creation"] = True
             
             # Check pool status
-            pool = self.engine.pool
-            health_status["checks"]["pool_info"] = {
-                "size": pool.size(),
-                "checked_in": pool.checkedin(),
-                "checked_out": pool.checkedout(),
-                "overflow": pool.overflow(),
-                "invalidated": pool.invalidated()
-            }
+            health_status["checks"]["pool_info"] = self._pool_info(self.engine.pool)
             
             # Overall status
             if all(health_status["checks"][key] for key in ["connectivity", "session_creation"]):
@@ -164,6 +236,50 @@ class DatabaseManager:
         
         return health_status
     
+    async def async_health_check(self, timeout: Optional[float] = None) -> dict:
+        """Database health check through the asyncio engine (never blocks the event loop)"""
+        timeout = timeout or float(os.getenv("DB_HEALTH_TIMEOUT", "5"))
+        health_status = {
+            "status": "unhealthy",
+            "timestamp": datetime.utcnow().isoformat(),
+            "checks": {}
+        }
+        
+        async def run_checks():
+            async with self.async_engine.connect() as conn:
+                result = await conn.execute(text("SELECT 1 as test"))
+                health_status["checks"]["connectivity"] = result.scalar() == 1
+            
+            async with self.get_async_session() as session:
+                await session.execute(text("SELECT 1"))
+            health_status["checks"]["session_creation"] = True
+        
+        try:
+            await asyncio.wait_for(run_checks(), timeout)
+            health_status["checks"]["pool_info"] = self._pool_info(self.async_engine.pool)
+            if all(health_status["checks"].get(key) for key in ["connectivity", "session_creation"]):
+                health_status["status"] = "healthy"
+        except asyncio.TimeoutError:
+            logger.error(f"Async database health check timed out after {timeout}s")
+            health_status["checks"]["error"] = f"timed out after {timeout}s"
+        except Exception as e:
+            logger.error(f"Async database health check failed: {str(e)}")
+            health_status["checks"]["error"] = str(e)
+        
+        return health_status
+    
+    @staticmethod
+    def _pool_info(pool) -> dict:
+        if not hasattr(pool, "checkedout"):
+            return {"class": type(pool).__name__}
+        return {
+            "size": pool.size(),
+            "checked_in": pool.checkedin(),
+            "checked_out": pool.checkedout(),
+            "overflow": pool.overflow(),
+            "invalidated": getattr(pool, "invalidated", lambda: None)()
+        }
+    
     def cleanup(self):
         """Cleanup database resources"""
         try:
@@ -172,6 +288,15 @@ class DatabaseManager:
                 logger.info("Database engine disposed")
         except Exception as e:
             logger.error(f"Error during database cleanup: {str(e)}")
+    
+    async def async_cleanup(self):
+        """Dispose the asyncio engine (must run on the event loop that used it)"""
+        try:
+            if self.async_engine:
+                await self.async_engine.dispose()
+                logger.info("Async database engine disposed")
+        except Exception as e:
+            logger.error(f"Error during async database cleanup: {str(e)}")
 
 class DatabaseTransaction:
     """
@@ -212,18 +337,38 @@ class DatabaseTransaction:
                 self.session.close()
 
 @asynccontextmanager
-async def get_async_session() -> AsyncGenerator[Session, None]:
-    """Async context manager for database sessions"""
-    session = db_manager.get_session()
+async def get_async_session() -> AsyncGenerator[AsyncSession, None]:
+    """Async context manager for database sessions (commits on success)"""
+    session = db_manager.get_async_session()
     try:
         yield session
-        session.commit()
+        await session.commit()
     except Exception as e:
-        session.rollback()
+        await session.rollback()
         logger.error(f"Database session error: {str(e)}")
+        if isinstance(e, DatabaseException):
+            raise
         raise DatabaseException(f"Session error: {str(e)}")
     finally:
-        session.close()
+        await session.close()
+
+async def get_async_db() -> AsyncGenerator[AsyncSession, None]:
+    """
+    Async database dependency for FastAPI
+    Same contract as get_db, but queries are awaited instead of blocking the event loop
+    """
+    session = db_manager.get_async_session()
+    try:
+        yield session
+    except SQLAlchemyError as e:
+        await session.rollback()
+        logger.error(f"Database error in async dependency: {str(e)}")
+        raise DatabaseException(f"Database operation failed: {str(e)}")
+    except Exception:
+        await session.rollback()
+        raise
+    finally:
+        await session.close()
 
 def get_db() -> Generator[Session, None, None]:
     """
@@ -356,6 +501,16 @@ class RedisManager:
         except Exception as e:
             logger.error(f"Error during Redis cleanup: {str(e)}")
 
+def stable_cache_key(prefix: str, *args, **kwargs) -> str:
+    """
+    Derive a cache key that is identical across processes and restarts
+    (the builtin hash() is salted per interpreter)
+    """
+    if not args and not kwargs:
+        return prefix
+    payload = json.dumps([args, kwargs], sort_keys=True, default=str, separators=(",", ":"))
+    return f"{prefix}:{hashlib.sha256(payload.encode()).hexdigest()[:32]}"
+
 def cache_result(key_prefix: str, ttl: Optional[int] = None):
     """
     Decorator for caching function results in Redis
@@ -363,7 +518,7 @@ def cache_result(key_prefix: str, ttl: Optional[int] = None):
     def decorator(func):
         async def wrapper(*args, **kwargs):
             # Generate cache key
-            cache_key = f"{key_prefix}:{hash(str(args) + str(kwargs))}"
+            cache_key = stable_cache_key(key_prefix, *args, **kwargs)
             
             # Try to get from cache
             cached_result = redis_manager.get(cache_key)
@@ -437,9 +592,87 @@ class DatabaseMetrics:
         self.slow_queries = []
         self.error_count = 0
 
-# Global instances
-db_manager = DatabaseManager()
-redis_manager = RedisManager()
+class ResourceRegistry:
+    """
+    Lazily created process-wide resources (database engines, Redis client)
+    Importing this module opens no connections: each resource is built on
+    first use, or up front (off the event loop) during the FastAPI lifespan
+    """
+    
+    def __init__(self):
+        self._factories: Dict[str, Callable[[], Any]] = {}
+        self._instances: Dict[str, Any] = {}
+        self._lock = threading.RLock()
+    
+    def register(self, name: str, factory: Callable[[], Any]):
+        self._factories[name] = factory
+    
+    def get(self, name: str) -> Any:
+        """Return the resource, creating it on first use"""
+        instance = self._instances.get(name)
+        if instance is None:
+            with self._lock:
+                instance = self._instances.get(name)
+                if instance is None:
+                    start = time.perf_counter()
+                    instance = self._factories[name]()
+                    self._instances[name] = instance
+                    logger.info(f"Initialized {name} in {(time.perf_counter() - start) * 1000:.1f}ms")
+        return instance
+    
+    def proxy(self, name: str) -> "LazyResource":
+        return LazyResource(self, name)
+    
+    def is_initialized(self, name: str) -> bool:
+        return name in self._instances
+    
+    def initialized(self) -> List[str]:
+        return list(self._instances)
+    
+    async def startup(self, *names: str):
+        """Create resources in a worker thread so connection setup never blocks the loop"""
+        for name in names or tuple(self._factories):
+            await asyncio.to_thread(self.get, name)
+    
+    async def shutdown(self):
+        """Tear down created resources in reverse creation order"""
+        for name in reversed(self.initialized()):
+            instance = self._instances.pop(name)
+            if hasattr(instance, "async_cleanup"):
+                await instance.async_cleanup()
+            if hasattr(instance, "cleanup"):
+                instance.cleanup()
+    
+    def cleanup(self):
+        """Synchronous teardown for scripts"""
+        for name in reversed(self.initialized()):
+            instance = self._instances.pop(name)
+            if hasattr(instance, "cleanup"):
+                instance.cleanup()
+
+class LazyResource:
+    """Module-level handle that resolves to the registry instance on attribute access"""
+    
+    __slots__ = ("_registry", "_name")
+    
+    def __init__(self, registry: ResourceRegistry, name: str):
+        self._registry = registry
+        self._name = name
+    
+    def __getattr__(self, attr: str) -> Any:
+        return getattr(self._registry.get(self._name), attr)
+    
+    def __repr__(self) -> str:
+        state = "initialized" if self._registry.is_initialized(self._name) else "lazy"
+        return f"<LazyResource {self._name} ({state})>"
+
+# Global instances (resolved on first use)
+resources = ResourceRegistry()
+resources.register("database", DatabaseManager)
+resources.register("redis", RedisManager)
+
+db_manager: DatabaseManager = resources.proxy("database")
+redis_manager: RedisManager = resources.proxy("redis")
 db_metrics = DatabaseMetrics()
 
 def initialize_database():
@@ -460,10 +693,22 @@ def check_all_services() -> dict:
         "timestamp": datetime.utcnow().isoformat()
     }
 
+async def check_all_services_async() -> dict:
+    """Check health of all database services without blocking the event loop"""
+    database, redis_health = await asyncio.gather(
+        db_manager.async_health_check(),
+        asyncio.to_thread(redis_manager.health_check)
+    )
+    return {
+        "database": database,
+        "redis": redis_health,
+        "metrics": db_metrics.get_metrics(),
+        "timestamp": datetime.utcnow().isoformat()
+    }
+
 def cleanup_all_services():
     """Cleanup all database services"""
-    db_manager.cleanup()
-    redis_manager.cleanup()
+    resources.cleanup()
     logger.info("All database services cleaned up")
 
 # Database utilities
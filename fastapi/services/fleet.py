@@ -0,0 +1,112 @@
+"""
+Fleet provisioning: create many servers from one template
+
+Creates fan out under a semaphore (and the shared outbound rate limiter),
+every resulting action (create_server plus next_actions such as
+start_server) is handed to the action tracker in one batch, and progress is
+reported as a sequence of events so callers can stream it.
+"""
+
+import asyncio
+import logging
+import os
+import time
+import uuid
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from services.action_tracker import action_tracker
+from services.hetzner_client import HetznerClient
+from services.server_sync import server_sync
+from utils.exceptions import BaseAPIException
+
+logger = logging.getLogger(__name__)
+
+def fleet_names(prefix: str, count: int, batch_id: str) -> List[str]:
+    """Unique names for a count-based batch, e.g. web-3f9a1c-01"""
+    width = max(2, len(str(count)))
+    return [f"{prefix}-{batch_id}-{i:0{width}d}" for i in range(1, count + 1)]
+
+class FleetProvisioner:
+    """Create a batch of servers and follow their actions"""
+
+    def __init__(
+        self,
+        client: HetznerClient,
+        template: Dict[str, Any],
+        names: List[str],
+        batch_id: Optional[str] = None,
+        concurrency: Optional[int] = None
+    ):
+        self.client = client
+        self.batch_id = batch_id or uuid.uuid4().hex[:6]
+        self.template = template
+        self.names = list(dict.fromkeys(names))
+        self.concurrency = concurrency or int(os.getenv("FLEET_CREATE_CONCURRENCY", "5"))
+        self.progress_timeout = float(os.getenv("FLEET_PROGRESS_TIMEOUT", "900"))
+        self.summary = {"batch_id": self.batch_id, "requested": len(self.names), "created": 0, "failed": 0, "action_ids": []}
+
+    def _payload(self, name: str) -> Dict[str, Any]:
+        # Every server in the batch is labelled so the fleet can be found (and cleaned up) later
+        labels = {**(self.template.get("labels") or {}), "fleet_batch": self.batch_id}
+        return {**self.template, "name": name, "labels": labels}
+
+    async def _create(self, semaphore: asyncio.Semaphore, name: str) -> Dict[str, Any]:
+        async with semaphore:
+            try:
+                response = await self.client.create_server(self._payload(name))
+            except BaseAPIException as e:
+                return {"type": "failed", "name": name, "error": e.to_dict()}
+        actions = [action for action in [response.get("action"), *(response.get("next_actions") or [])] if action]
+        return {
+            "type": "created",
+            "name": name,
+            "server": response.get("server"),
+            "root_password": response.get("root_password"),
+            "actions": actions
+        }
+
+    async def run(self, follow: bool = False) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Yield a "created"/"failed" event per server as each create returns, then
+        (with follow) "progress" events for the tracked actions, and a final "summary"
+        """
+        start = time.perf_counter()
+        semaphore = asyncio.Semaphore(self.concurrency)
+        tasks = [asyncio.create_task(self._create(semaphore, name)) for name in self.names]
+        created = []
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                event = await next_done
+                if event["type"] == "created":
+                    created.append(event)
+                    self.summary["created"] += 1
+                else:
+                    self.summary["failed"] += 1
+                yield event
+        finally:
+            for task in tasks:
+                task.cancel()
+
+        # One multi-row insert for every action of the batch
+        items = [
+            (action, event["server"]["id"], event["server"])
+            for event in created if event.get("server")
+            for action in event["actions"]
+        ]
+        if items:
+            await action_tracker.track_many(items)
+        if created:
+            server_sync.wake()
+        self.summary["action_ids"] = [action["id"] for action, _, _ in items]
+
+        if follow and self.summary["action_ids"]:
+            async for batch in action_tracker.subscribe(self.summary["action_ids"], self.progress_timeout):
+                for state in batch:
+                    yield {"type": "progress", "action": state}
+            states = await action_tracker.get(self.summary["action_ids"])
+            self.summary["actions_succeeded"] = sum(1 for state in states if state["status"] == "success")
+            self.summary["actions_failed"] = sum(1 for state in states if state["status"] == "error")
+
+        self.summary["duration_ms"] = round((time.perf_counter() - start) * 1000, 1)
+        logger.info(f"Fleet batch {self.batch_id}: {self.summary['created']} created, {self.summary['failed']} failed")
+        yield {"type": "summary", **self.summary}
@@ -1,81 +1,400 @@
 import httpx
 import os
-from typing import Dict, Optional, Any
-from utils.exceptions import HetznerAPIException, NetworkException, TimeoutException
+import asyncio
+import logging
+import random
+from collections import deque
+from typing import Dict, Optional, Any, List, AsyncIterator
+from utils.exceptions import BaseAPIException, HetznerAPIException, NetworkException, TimeoutException
+from utils.single_flight import SingleFlight
+from utils.rate_limiter import RateLimiter, create_hetzner_rate_limiter
+from utils.circuit_breaker import CircuitBreakerRegistry
+
+logger = logging.getLogger(__name__)
+
+# Application-scoped connection pool, created in the FastAPI lifespan
+_http_client: Optional[httpx.AsyncClient] = None
+
+# Identical concurrent GETs share one upstream call
+request_coalescer = SingleFlight()
+
+# Per-endpoint circuit breakers, shared by every HetznerClient instance
+circuit_breakers = CircuitBreakerRegistry()
+
+IDEMPOTENT_METHODS = ("GET", "HEAD", "PUT", "DELETE")
+SERVER_ACTIONS = ("start", "stop", "restart", "reset", "shutdown")
+RETRYABLE_STATUS_CODES = (429, 500, 502, 503, 504)
+
+# Outbound request governor, created on first use
+_rate_limiter: Optional[RateLimiter] = None
+
+def get_rate_limiter() -> RateLimiter:
+    global _rate_limiter
+    if _rate_limiter is None:
+        _rate_limiter = create_hetzner_rate_limiter()
+    return _rate_limiter
+
+def create_http_client() -> httpx.AsyncClient:
+    """Build a keep-alive pooled client configured from the environment"""
+    http2 = os.getenv("HETZNER_HTTP2", "true").lower() == "true"
+    if http2:
+        try:
+            import h2  # noqa: F401
+        except ImportError:
+            logger.warning("HTTP/2 requested but the 'h2' package is not installed, using HTTP/1.1")
+            http2 = False
+    
+    limits = httpx.Limits(
+        max_connections=int(os.getenv("HETZNER_POOL_MAX_CONNECTIONS", "100")),
+        max_keepalive_connections=int(os.getenv("HETZNER_POOL_MAX_KEEPALIVE", "20")),
+        keepalive_expiry=float(os.getenv("HETZNER_POOL_KEEPALIVE_EXPIRY", "30"))
+    )
+    timeout = httpx.Timeout(
+        float(os.getenv("HETZNER_TIMEOUT", "30")),
+        connect=float(os.getenv("HETZNER_CONNECT_TIMEOUT", "5"))
+    )
+    return httpx.AsyncClient(limits=limits, timeout=timeout, http2=http2)
+
+async def startup_http_client() -> httpx.AsyncClient:
+    """Open the shared Hetzner connection pool"""
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = create_http_client()
+        logger.info("Hetzner HTTP connection pool initialized")
+    return _http_client
+
+async def shutdown_http_client():
+    """Close the shared Hetzner connection pool"""
+    global _http_client, _rate_limiter
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+        logger.info("Hetzner HTTP connection pool closed")
+    if _rate_limiter is not None and hasattr(_rate_limiter, "close"):
+        await _rate_limiter.close()
+        _rate_limiter = None
+
+def get_http_client() -> httpx.AsyncClient:
+    """Return the shared client, creating it lazily outside the app lifespan (scripts)"""
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = create_http_client()
+    return _http_client
 
 class HetznerClient:
-    def __init__(self):
+    def __init__(self, http_client: Optional[httpx.AsyncClient] = None):
         self.api_token = os.getenv("HETZNER_API_TOKEN")
         if not self.api_token:
             raise HetznerAPIException("HETZNER_API_TOKEN not configured", 500, error_code="MISSING_CONFIG")
-        self.base_url = "https://api.hetzner.cloud/v1"
+        self.base_url = os.getenv("HETZNER_API_URL", "https://api.hetzner.cloud/v1")
+        self._http_client = http_client
+        self.per_page = int(os.getenv("HETZNER_PER_PAGE", "50"))
+        self.page_concurrency = int(os.getenv("HETZNER_PAGE_CONCURRENCY", "4"))
+        self.coalesce_gets = os.getenv("HETZNER_COALESCE_GETS", "true").lower() == "true"
+        self.retry_attempts = max(1, int(os.getenv("HETZNER_RETRY_ATTEMPTS", "3")))
+        self.retry_base_delay = float(os.getenv("HETZNER_RETRY_BASE_DELAY", "0.2"))
+        self.retry_max_delay = float(os.getenv("HETZNER_RETRY_MAX_DELAY", "5"))
+    
+    async def _request(
+        self,
+        method: str,
+        endpoint: str,
+        data: Optional[Dict] = None,
+        params: Optional[Dict] = None,
+        idempotent: Optional[bool] = None
+    ) -> Dict[str, Any]:
+        if method == "GET" and self.coalesce_gets:
+            query = tuple(sorted((k, tuple(v) if isinstance(v, list) else v) for k, v in (params or {}).items()))
+            key = (self.base_url, self.api_token, endpoint, query)
+            return await request_coalescer.do(key, lambda: self._request_with_retry(method, endpoint, data, params, idempotent))
+        return await self._request_with_retry(method, endpoint, data, params, idempotent)
+    
+    async def _request_with_retry(
+        self,
+        method: str,
+        endpoint: str,
+        data: Optional[Dict] = None,
+        params: Optional[Dict] = None,
+        idempotent: Optional[bool] = None
+    ) -> Dict[str, Any]:
+        """
+        Send a request through the circuit breaker and outbound rate limiter,
+        retrying transient failures with decorrelated-jitter backoff
+        """
+        if idempotent is None:
+            idempotent = method in IDEMPOTENT_METHODS
+        breaker = circuit_breakers.get(method, endpoint)
+        rate_limiter = get_rate_limiter()
+        delay = self.retry_base_delay
+        attempt = 0
         
-    async def _request(self, method: str, endpoint: str, data: Optional[Dict] = None) -> Dict[str, Any]:
+        while True:
+            attempt += 1
+            breaker.before_call()
+            try:
+                await rate_limiter.acquire()
+            except BaseException:
+                breaker.release()
+                raise
+            try:
+                result = await self._send(method, endpoint, data, params)
+            except BaseAPIException as e:
+                if self._is_upstream_failure(e):
+                    breaker.record_failure()
+                else:
+                    breaker.record_success()
+                
+                if attempt >= self.retry_attempts or not self._is_retryable(e, idempotent):
+                    raise
+                
+                # Decorrelated jitter: sleep = min(cap, uniform(base, previous * 3))
+                delay = min(self.retry_max_delay, random.uniform(self.retry_base_delay, delay * 3))
+                retry_after = e.details.get("retry_after")
+                if retry_after and retry_after > self.retry_max_delay:
+                    raise
+                if e.status_code == 429:
+                    # The rate limiter already holds back the next acquire for Retry-After
+                    delay = 0
+                elif retry_after:
+                    delay = max(delay, float(retry_after))
+                
+                logger.warning(
+                    f"Retrying {method} {endpoint} in {delay:.2f}s "
+                    f"(attempt {attempt}/{self.retry_attempts}): {e.message}"
+                )
+                await asyncio.sleep(delay)
+                continue
+            except BaseException:
+                # Cancelled mid-flight: do not count it either way
+                breaker.release()
+                raise
+            
+            breaker.record_success()
+            return result
+    
+    @staticmethod
+    def _is_upstream_failure(e: BaseAPIException) -> bool:
+        """Failures that indicate Hetzner (or the path to it) is unhealthy"""
+        if isinstance(e, (TimeoutException, NetworkException)):
+            return True
+        return isinstance(e, HetznerAPIException) and e.status_code is not None and e.status_code >= 500
+    
+    @staticmethod
+    def _is_retryable(e: BaseAPIException, idempotent: bool) -> bool:
+        """
+        Idempotent requests retry any transient failure. Other requests only
+        retry when Hetzner certainly did not act on them: the connection was
+        never established, or the request was rejected with 429
+        """
+        if isinstance(e, HetznerAPIException):
+            if e.status_code == 429:
+                return True
+            return idempotent and e.status_code in RETRYABLE_STATUS_CODES
+        if isinstance(e, (TimeoutException, NetworkException)):
+            return idempotent or e.details.get("request_sent") is False
+        return False
+    
+    async def _send(
+        self,
+        method: str,
+        endpoint: str,
+        data: Optional[Dict] = None,
+        params: Optional[Dict] = None
+    ) -> Dict[str, Any]:
         headers = {
             "Authorization": f"Bearer {self.api_token}",
             "Content-Type": "application/json"
         }
         
-        async with httpx.AsyncClient(timeout=30.0) as client:
+        client = self._http_client or get_http_client()
+        rate_limiter = get_rate_limiter()
+        try:
+            response = await client.request(
+                method=method,
+                url=f"{self.base_url}{endpoint}",
+                headers=headers,
+                json=data,
+                params=params
+            )
+        except (httpx.ConnectTimeout, httpx.PoolTimeout):
+            raise TimeoutException(
+                "Hetzner API connect timeout",
+                operation="hetzner_api_call",
+                details={"request_sent": False}
+            )
+        except httpx.TimeoutException:
+            raise TimeoutException("Hetzner API request timeout", operation="hetzner_api_call")
+        except httpx.ConnectError as e:
+            raise NetworkException(
+                f"Network error: {str(e)}",
+                endpoint=f"{self.base_url}{endpoint}",
+                details={"request_sent": False}
+            )
+        except httpx.RequestError as e:
+            raise NetworkException(f"Network error: {str(e)}", endpoint=f"{self.base_url}{endpoint}")
+        
+        rate_limiter.update_from_headers(response.headers)
+        retry_after = self._retry_after(response)
+        if response.status_code == 429:
+            rate_limiter.penalize(retry_after or 1.0)
+        
+        if response.status_code == 401:
+            raise HetznerAPIException("Invalid Hetzner API token", 401)
+        elif response.status_code == 403:
+            raise HetznerAPIException("Insufficient permissions", 403)
+        elif response.status_code == 404:
+            raise HetznerAPIException("Resource not found", 404)
+        elif response.status_code >= 400:
             try:
-                response = await client.request(
-                    method=method,
-                    url=f"{self.base_url}{endpoint}",
-                    headers=headers,
-                    json=data
-                )
-                
-                if response.status_code == 401:
-                    raise HetznerAPIException("Invalid Hetzner API token", 401)
-                elif response.status_code == 403:
-                    raise HetznerAPIException("Insufficient permissions", 403)
-                elif response.status_code == 404:
-                    raise HetznerAPIException("Resource not found", 404)
-                elif response.status_code == 422:
-                    error_data = response.json()
-                    raise HetznerAPIException.from_hetzner_response(error_data, 422)
-                elif response.status_code >= 400:
-                    try:
-                        error_data = response.json()
-                        raise HetznerAPIException.from_hetzner_response(error_data, response.status_code)
-                    except Exception:
-                        raise HetznerAPIException(f"API error: {response.status_code}", response.status_code)
-                    
-                return response.json()
-                
-            except httpx.TimeoutException:
-                raise TimeoutException("Hetzner API request timeout", operation="hetzner_api_call")
-            except httpx.RequestError as e:
-                raise NetworkException(f"Network error: {str(e)}", endpoint=f"{self.base_url}{endpoint}")
+                error_data = response.json()
+            except ValueError:
+                error_data = None
+            if isinstance(error_data, dict) and "error" in error_data:
+                error = HetznerAPIException.from_hetzner_response(error_data, response.status_code)
+            else:
+                error = HetznerAPIException(f"API error: {response.status_code}", response.status_code)
+            if retry_after:
+                error.details["retry_after"] = retry_after
+            raise error
+        
+        return response.json()
+    
+    @staticmethod
+    def _retry_after(response: httpx.Response) -> Optional[float]:
+        """Retry-After header in seconds, if present"""
+        try:
+            return max(0.0, float(response.headers["Retry-After"]))
+        except (KeyError, ValueError):
+            return None
+    
+    # Pagination
+    async def iter_pages(
+        self,
+        endpoint: str,
+        key: str,
+        params: Optional[Dict] = None,
+        concurrency: Optional[int] = None
+    ) -> AsyncIterator[List[Dict[str, Any]]]:
+        """
+        Yield each page of a Hetzner list endpoint in order
+        The first page reveals last_page; the remaining pages are then fetched
+        concurrently, with at most `concurrency` requests in flight at once
+        """
+        params = {**(params or {}), "per_page": self.per_page}
+        concurrency = max(1, concurrency or self.page_concurrency)
+        
+        first = await self._request("GET", endpoint, params={**params, "page": 1})
+        yield first.get(key, [])
+        
+        pagination = first.get("meta", {}).get("pagination") or {}
+        last_page = pagination.get("last_page")
+        
+        if last_page is None:
+            # Total unknown, follow next_page links sequentially
+            next_page = pagination.get("next_page")
+            while next_page:
+                response = await self._request("GET", endpoint, params={**params, "page": next_page})
+                yield response.get(key, [])
+                next_page = (response.get("meta", {}).get("pagination") or {}).get("next_page")
+            return
+        
+        pending = deque()
+        next_page = 2
+        try:
+            while next_page <= last_page or pending:
+                while next_page <= last_page and len(pending) < concurrency:
+                    pending.append(asyncio.ensure_future(
+                        self._request("GET", endpoint, params={**params, "page": next_page})
+                    ))
+                    next_page += 1
+                response = await pending.popleft()
+                yield response.get(key, [])
+        finally:
+            # Consumer stopped early or a page failed: drop in-flight requests
+            for task in pending:
+                task.cancel()
+    
+    async def iter_items(self, endpoint: str, key: str, params: Optional[Dict] = None) -> AsyncIterator[Dict[str, Any]]:
+        """Yield individual objects across all pages"""
+        async for page in self.iter_pages(endpoint, key, params):
+            for item in page:
+                yield item
+    
+    async def get_all(self, endpoint: str, key: str, params: Optional[Dict] = None) -> Dict[str, Any]:
+        """Fetch every page and combine them into a single list response"""
+        items: List[Dict[str, Any]] = []
+        async for page in self.iter_pages(endpoint, key, params):
+            items.extend(page)
+        return {
+            key: items,
+            "meta": {"pagination": {"page": 1, "last_page": 1, "total_entries": len(items)}}
+        }
     
     # Server operations
-    async def get_servers(self) -> Dict[str, Any]:
-        return await self._request("GET", "/servers")
+    async def get_servers(self, params: Optional[Dict] = None) -> Dict[str, Any]:
+        return await self.get_all("/servers", "servers", params)
     
     async def get_server(self, server_id: int) -> Dict[str, Any]:
         return await self._request("GET", f"/servers/{server_id}")
     
+    async def get_server_metrics(
+        self,
+        server_id: int,
+        types: List[str],
+        start: str,
+        end: str,
+        step: Optional[int] = None
+    ) -> Dict[str, Any]:
+        """CPU/disk/network time series; start and end are ISO 8601 timestamps"""
+        params = {"type": ",".join(types), "start": start, "end": end}
+        if step:
+            params["step"] = step
+        return await self._request("GET", f"/servers/{server_id}/metrics", params=params)
+    
     async def create_server(self, data: Dict[str, Any]) -> Dict[str, Any]:
-        return await self._request("POST", "/servers", data)
+        try:
+            return await self._request("POST", "/servers", data)
+        except (TimeoutException, NetworkException) as e:
+            if e.details.get("request_sent") is False:
+                raise
+            # Outcome unknown. Server names are unique per project, so check whether the create landed
+            existing = await self._request("GET", "/servers", params={"name": data["name"]})
+            if existing.get("servers"):
+                logger.warning(f"Create of {data['name']} timed out but the server exists, returning it")
+                return {"server": existing["servers"][0], "action": None, "next_actions": []}
+            raise
     
     async def delete_server(self, server_id: int) -> Dict[str, Any]:
         return await self._request("DELETE", f"/servers/{server_id}")
     
     # Power management
+    @staticmethod
+    def validate_server_action(action: str):
+        if action not in SERVER_ACTIONS:
+            raise HetznerAPIException(f"Invalid action. Must be one of: {', '.join(SERVER_ACTIONS)}", 400)
+    
     async def server_action(self, server_id: int, action: str) -> Dict[str, Any]:
-        valid_actions = ["start", "stop", "restart", "reset", "shutdown"]
-        if action not in valid_actions:
-            raise HetznerAPIException(f"Invalid action. Must be one of: {', '.join(valid_actions)}", 400)
-            
+        self.validate_server_action(action)
+        
         data = {"type": action}
-        return await self._request("POST", f"/servers/{server_id}/actions", data)
+        # Repeating start/stop/shutdown leaves the server in the same state, so they may be retried
+        idempotent = action in ("start", "stop", "shutdown")
+        return await self._request("POST", f"/servers/{server_id}/actions", data, idempotent=idempotent)
+    
+    # Actions
+    async def get_actions(self, action_ids: List[int]) -> Dict[str, Any]:
+        """Fetch up to one page of actions by ID (repeated ?id= filter)"""
+        return await self._request("GET", "/actions", params={"id": list(action_ids), "per_page": 50})
     
     # Resource listings
-    async def get_server_types(self) -> Dict[str, Any]:
-        return await self._request("GET", "/server_types")
+    async def get_server_types(self, params: Optional[Dict] = None) -> Dict[str, Any]:
+        return await self.get_all("/server_types", "server_types", params)
+    
+    async def get_images(self, params: Optional[Dict] = None) -> Dict[str, Any]:
+        return await self.get_all("/images", "images", params)
     
-    async def get_images(self) -> Dict[str, Any]:
-        return await self._request("GET", "/images")
+    async def get_datacenters(self, params: Optional[Dict] = None) -> Dict[str, Any]:
+        return await self.get_all("/datacenters", "datacenters", params)
     
-    async def get_datacenters(self) -> Dict[str, Any]:
-        return await self._request("GET", "/datacenters")
\ No newline at end of file
+    async def get_pricing(self) -> Dict[str, Any]:
+        return await self._request("GET", "/pricing")
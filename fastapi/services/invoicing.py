@@ -0,0 +1,413 @@
+"""
+Month-end invoice generation from usage_records
+
+A run covers one billing period (YYYY-MM). Users with usage in the period
+are handed to a pool of workers; each worker streams that user's usage
+rows (WHERE user_id = ? AND billing_period = ?, i.e. idx_usage_billing_period)
+through a server-side cursor and folds them into one line item per
+(resource, usage type, unit), so memory is bounded by a user's resource
+count, never by row count. Finished invoices are buffered and written in
+batches: one transaction inserts the invoices, their line items and the
+run's progress counters together.
+
+Invoice numbers are deterministic (INV-<period>-<user id>), so the
+invoices already in the table are the checkpoint: an interrupted run
+resumes with the users that have none yet, and nothing is invoiced twice.
+"""
+
+import asyncio
+import logging
+import os
+import random
+import re
+import time
+from collections import defaultdict
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import insert, select, update
+
+from models.database_models import Invoice, InvoiceLineItem, InvoiceRun, UsageRecord
+from services.database import get_async_session, redis_manager
+from services.usage_metering import usage_metering
+from utils.exceptions import ConflictException, ValidationException
+from utils.leader_lock import LeaderLock
+
+logger = logging.getLogger(__name__)
+
+PERIOD = re.compile(r"^\d{4}-(0[1-9]|1[0-2])$")
+
+def period_bounds(billing_period: str) -> Tuple[datetime, datetime]:
+    if not PERIOD.match(billing_period or ""):
+        raise ValidationException("billing_period must be YYYY-MM", field="billing_period")
+    year, month = map(int, billing_period.split("-"))
+    start = datetime(year, month, 1)
+    return start, datetime(year + month // 12, month % 12 + 1, 1)
+
+def invoice_number(billing_period: str, user_id: int) -> str:
+    return f"INV-{billing_period}-{user_id:07d}"
+
+@dataclass
+class DraftInvoice:
+    user_id: int
+    lines: List[Dict[str, Any]] = field(default_factory=list)
+    rows_read: int = 0
+
+    @property
+    def subtotal(self) -> float:
+        return round(sum(line["amount"] for line in self.lines), 2)
+
+class InvoicePipeline:
+    """Runs per billing period: worker pool, batched writer, resumable progress"""
+
+    def __init__(self):
+        self.workers = int(os.getenv("INVOICE_WORKERS", "4"))
+        self.batch_size = int(os.getenv("INVOICE_BATCH_SIZE", "200"))
+        self.stream_chunk = int(os.getenv("INVOICE_STREAM_CHUNK", "5000"))
+        self.tax_rate = float(os.getenv("INVOICE_TAX_RATE", "0"))
+        self.currency = os.getenv("INVOICE_CURRENCY", "EUR")
+        self.due_days = int(os.getenv("INVOICE_DUE_DAYS", "14"))
+        self.auto = os.getenv("INVOICE_AUTO_RUN", "true").lower() == "true"
+        self.auto_interval = float(os.getenv("INVOICE_AUTO_INTERVAL", "3600"))
+        self._task: Optional[asyncio.Task] = None
+        self._runs: Dict[str, asyncio.Task] = {}
+        self.progress: Dict[str, Dict[str, Any]] = {}
+
+    # Lifecycle
+
+    async def start(self):
+        if self.auto and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        tasks = [task for task in [self._task, *self._runs.values()] if task and not task.done()]
+        for task in tasks:
+            task.cancel()
+        for task in tasks:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+        self._runs.clear()
+
+    async def _run(self):
+        """Invoice the previous month once its usage is fully metered"""
+        while True:
+            try:
+                previous = (datetime.utcnow().replace(day=1) - timedelta(days=1)).strftime("%Y-%m")
+                async with get_async_session() as session:
+                    status = await session.scalar(select(InvoiceRun.status).where(InvoiceRun.billing_period == previous))
+                if status != "completed" and previous not in self._runs:
+                    await self.run(previous)
+            except asyncio.CancelledError:
+                raise
+            except (ValidationException, ConflictException) as e:
+                logger.debug(f"Invoice run not started: {e.message}")
+            except Exception as e:
+                logger.error(f"Scheduled invoice run failed: {str(e)}")
+            await asyncio.sleep(self.auto_interval * random.uniform(0.9, 1.1))
+
+    def _active(self, billing_period: str) -> bool:
+        task = self._runs.get(billing_period)
+        return bool(task and not task.done())
+
+    async def trigger(self, billing_period: str, force: bool = False) -> bool:
+        """
+        Start (or resume) a run in the background; False while one is in
+        progress here. The checks run before returning, so an unmetered period
+        (ValidationException) or a run on another instance (ConflictException)
+        is reported to the caller instead of failing inside the task
+        """
+        if self._active(billing_period):
+            return False
+        leader = await self._start(billing_period, force)
+        if self._active(billing_period):
+            # Another request started it while the checks ran
+            await asyncio.to_thread(leader.release)
+            return False
+        task = asyncio.create_task(self._execute(billing_period, leader))
+        task.add_done_callback(self._run_finished)
+        self._runs[billing_period] = task
+        return True
+
+    @staticmethod
+    def _run_finished(task: asyncio.Task):
+        # The failure is already recorded on the run; retrieve it so it is not reported as unhandled
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"Background invoice run failed: {str(task.exception())}")
+
+    # Runs
+
+    async def run(self, billing_period: str, force: bool = False) -> Dict[str, Any]:
+        """Generate every missing invoice for the period; safe to call again after an interruption"""
+        leader = await self._start(billing_period, force)
+        return await self._execute(billing_period, leader)
+
+    async def _start(self, billing_period: str, force: bool) -> LeaderLock:
+        """Refuse periods that are not fully metered, then take the period's run lock"""
+        _, period_end = period_bounds(billing_period)
+        if not force:
+            watermark = await usage_metering.watermark()
+            if watermark is None or watermark < period_end:
+                raise ValidationException(
+                    f"Usage for {billing_period} is not fully metered yet (metered up to {watermark})",
+                    field="billing_period"
+                )
+        leader = LeaderLock(f"invoicing:{billing_period}", redis_manager)
+        if not await asyncio.to_thread(leader.acquire, 300):
+            raise ConflictException(
+                f"Another instance is invoicing {billing_period}",
+                resource_type="invoice_run",
+                conflict_reason="run_in_progress"
+            )
+        return leader
+
+    async def _execute(self, billing_period: str, leader: LeaderLock) -> Dict[str, Any]:
+        """Invoice every pending user of the period; `leader` is held and released at the end"""
+        period_start, period_end = period_bounds(billing_period)
+        began = time.perf_counter()
+        try:
+            run_id = await self._open_run(billing_period)
+            pending = await self._pending_users(billing_period)
+            progress = self.progress[billing_period] = {
+                "billing_period": billing_period, "status": "running", "users_pending": len(pending),
+                "users_done": 0, "invoices_created": 0, "rows_read": 0, "elapsed_seconds": 0.0
+            }
+            logger.info(f"Invoice run {billing_period}: {len(pending)} users to invoice")
+
+            users: asyncio.Queue = asyncio.Queue()
+            for user_id in pending:
+                users.put_nowait(user_id)
+            drafts: asyncio.Queue = asyncio.Queue(maxsize=self.batch_size * 2)
+
+            async def worker():
+                while True:
+                    try:
+                        user_id = users.get_nowait()
+                    except asyncio.QueueEmpty:
+                        return
+                    await drafts.put(await self._draft(user_id, billing_period))
+
+            async def writer():
+                batch: List[DraftInvoice] = []
+                while True:
+                    draft = await drafts.get()
+                    if draft is not None:
+                        batch.append(draft)
+                    if batch and (draft is None or len(batch) >= self.batch_size):
+                        await self._write(run_id, billing_period, period_start, period_end, batch)
+                        progress["users_done"] += len(batch)
+                        progress["invoices_created"] += sum(1 for item in batch if item.lines)
+                        progress["rows_read"] += sum(item.rows_read for item in batch)
+                        progress["elapsed_seconds"] = round(time.perf_counter() - began, 1)
+                        batch = []
+                        # Keep the run lock for as long as batches keep landing
+                        await asyncio.to_thread(leader.acquire, 300)
+                    if draft is None:
+                        return
+
+            writer_task = asyncio.create_task(writer())
+            workers = asyncio.gather(*(worker() for _ in range(max(1, self.workers))))
+            try:
+                # A failed writer must not leave the workers blocked on a full queue
+                await asyncio.wait({workers, writer_task}, return_when=asyncio.FIRST_COMPLETED)
+                if writer_task.done():
+                    writer_task.result()
+                await workers
+                await drafts.put(None)
+                await writer_task
+            finally:
+                for task in (workers, writer_task):
+                    if not task.done():
+                        task.cancel()
+
+            await self._close_run(run_id, "completed")
+            progress["status"] = "completed"
+            progress["elapsed_seconds"] = round(time.perf_counter() - began, 1)
+            logger.info(
+                f"Invoice run {billing_period}: {progress['invoices_created']} invoices from "
+                f"{progress['rows_read']} usage rows in {progress['elapsed_seconds']}s"
+            )
+            return progress
+        except asyncio.CancelledError:
+            await self._mark(billing_period, "interrupted")
+            raise
+        except Exception as e:
+            await self._mark(billing_period, "failed", str(e))
+            raise
+        finally:
+            await asyncio.to_thread(leader.release)
+
+    async def _open_run(self, billing_period: str) -> int:
+        """The period's run row, created on first use and reset to running on resume"""
+        async with get_async_session() as session:
+            run = await session.scalar(select(InvoiceRun).where(InvoiceRun.billing_period == billing_period))
+            if run is None:
+                run = InvoiceRun(billing_period=billing_period, status="running", started_at=datetime.utcnow())
+                session.add(run)
+                await session.flush()
+            else:
+                run.status, run.error, run.finished_at = "running", None, None
+            return run.id
+
+    async def _pending_users(self, billing_period: str) -> List[int]:
+        """Users with usage in the period and no invoice for it yet"""
+        prefix = f"INV-{billing_period}-"
+        async with get_async_session() as session:
+            with_usage = await session.scalars(
+                select(UsageRecord.user_id).where(UsageRecord.billing_period == billing_period).distinct()
+            )
+            users = set(with_usage)
+            invoiced = await session.scalars(
+                select(Invoice.user_id).where(Invoice.invoice_number.like(f"{prefix}%"))
+            )
+            done = set(invoiced)
+            await session.execute(
+                update(InvoiceRun).where(InvoiceRun.billing_period == billing_period).values(users_total=len(users))
+            )
+        return sorted(users - done)
+
+    async def _draft(self, user_id: int, billing_period: str) -> DraftInvoice:
+        """Stream one user's usage for the period and fold it into line items"""
+        columns = (
+            UsageRecord.resource_type, UsageRecord.resource_id, UsageRecord.usage_type, UsageRecord.unit,
+            UsageRecord.quantity, UsageRecord.total_cost, UsageRecord.recorded_at
+        )
+        query = (
+            select(*columns)
+            .where(UsageRecord.user_id == user_id, UsageRecord.billing_period == billing_period)
+            .execution_options(yield_per=self.stream_chunk)
+        )
+        # (resource_type, resource_id, usage_type, unit) -> [quantity, amount, first, last]
+        totals: Dict[Tuple, List[Any]] = defaultdict(lambda: [0.0, 0.0, None, None])
+        draft = DraftInvoice(user_id)
+        async with get_async_session() as session:
+            result = await session.stream(query)
+            async for partition in result.partitions():
+                draft.rows_read += len(partition)
+                for resource_type, resource_id, usage_type, unit, quantity, cost, recorded_at in partition:
+                    total = totals[(resource_type, resource_id, usage_type, unit)]
+                    total[0] += quantity
+                    total[1] += cost
+                    if total[2] is None or recorded_at < total[2]:
+                        total[2] = recorded_at
+                    if total[3] is None or recorded_at > total[3]:
+                        total[3] = recorded_at
+
+        for (resource_type, resource_id, usage_type, unit), (quantity, amount, first, last) in sorted(totals.items()):
+            draft.lines.append({
+                "description": f"{resource_type} {resource_id}: {usage_type} ({quantity:g} {unit})",
+                "quantity": round(quantity, 4),
+                "unit_price": round(amount / quantity, 6) if quantity else 0.0,
+                "amount": round(amount, 2),
+                "resource_type": resource_type,
+                "resource_id": resource_id,
+                "period_start": first,
+                "period_end": last,
+            })
+        return draft
+
+    async def _write(
+        self,
+        run_id: int,
+        billing_period: str,
+        period_start: datetime,
+        period_end: datetime,
+        batch: List[DraftInvoice]
+    ):
+        """Invoices, line items and run progress for one batch, in one transaction"""
+        drafts = [draft for draft in batch if draft.lines]
+        now = datetime.utcnow()
+        invoices = []
+        for draft in drafts:
+            subtotal = draft.subtotal
+            tax = round(subtotal * self.tax_rate, 2)
+            invoices.append({
+                "user_id": draft.user_id,
+                "invoice_number": invoice_number(billing_period, draft.user_id),
+                "status": "draft",
+                "subtotal": subtotal,
+                "tax_amount": tax,
+                "total_amount": round(subtotal + tax, 2),
+                "currency": self.currency,
+                "billing_period_start": period_start,
+                "billing_period_end": period_end,
+                "due_date": now + timedelta(days=self.due_days),
+                "created_at": now,
+                "updated_at": now,
+            })
+        async with get_async_session() as session:
+            line_count = 0
+            if invoices:
+                await session.execute(insert(Invoice), invoices)
+                # Multi-row INSERT ids are not portable (no RETURNING on MySQL); look them up by number
+                ids = dict((await session.execute(
+                    select(Invoice.invoice_number, Invoice.id)
+                    .where(Invoice.invoice_number.in_([invoice["invoice_number"] for invoice in invoices]))
+                )).all())
+                lines = [
+                    {**line, "invoice_id": ids[invoice_number(billing_period, draft.user_id)]}
+                    for draft in drafts
+                    for line in draft.lines
+                ]
+                line_count = len(lines)
+                for offset in range(0, len(lines), 5000):
+                    await session.execute(insert(InvoiceLineItem), lines[offset:offset + 5000])
+            await session.execute(update(InvoiceRun).where(InvoiceRun.id == run_id).values(
+                users_done=InvoiceRun.users_done + len(batch),
+                invoices_created=InvoiceRun.invoices_created + len(invoices),
+                line_items_created=InvoiceRun.line_items_created + line_count,
+                total_amount=InvoiceRun.total_amount + sum(invoice["total_amount"] for invoice in invoices)
+            ))
+
+    async def _close_run(self, run_id: int, status: str):
+        async with get_async_session() as session:
+            await session.execute(update(InvoiceRun).where(InvoiceRun.id == run_id).values(
+                status=status, finished_at=datetime.utcnow()
+            ))
+
+    async def _mark(self, billing_period: str, status: str, error: Optional[str] = None):
+        if billing_period in self.progress:
+            self.progress[billing_period]["status"] = status
+        try:
+            async with get_async_session() as session:
+                await session.execute(update(InvoiceRun).where(InvoiceRun.billing_period == billing_period).values(
+                    status=status, error=error, finished_at=datetime.utcnow()
+                ))
+        except Exception as e:
+            logger.warning(f"Could not record invoice run state for {billing_period}: {str(e)}")
+
+    async def get_run(self, billing_period: str) -> Optional[Dict[str, Any]]:
+        period_bounds(billing_period)
+        async with get_async_session() as session:
+            run = await session.scalar(select(InvoiceRun).where(InvoiceRun.billing_period == billing_period))
+        if run is None:
+            return None
+        task = self._runs.get(billing_period)
+        return {
+            "billing_period": run.billing_period,
+            "status": run.status,
+            "active_here": bool(task and not task.done()),
+            "users_total": run.users_total,
+            "users_done": run.users_done,
+            "invoices_created": run.invoices_created,
+            "line_items_created": run.line_items_created,
+            "total_amount": round(run.total_amount or 0, 2),
+            "error": run.error,
+            "started_at": run.started_at.isoformat() if run.started_at else None,
+            "finished_at": run.finished_at.isoformat() if run.finished_at else None,
+            "live": self.progress.get(billing_period)
+        }
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "auto_run": self.auto,
+            "workers": self.workers,
+            "active_runs": [period for period, task in self._runs.items() if not task.done()],
+            "runs": self.progress
+        }
+
+# Global invoice pipeline instance
+invoice_pipeline = InvoicePipeline()
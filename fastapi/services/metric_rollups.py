@@ -0,0 +1,444 @@
+"""
+Rollup tiers for server metrics (1m, 1h, 1d buckets)
+
+A background job maintains server_metrics_1m from the raw server_metrics
+rows, server_metrics_1h from the 1m tier and server_metrics_1d from the 1h
+tier. Each pass recomputes the buckets between the tier's watermark (minus a
+lateness allowance for samples that arrive late) and the source's watermark,
+replacing them in one transaction, so passes are idempotent.
+
+min, max, sum and count are exact at every tier. p95 is exact in the 1m tier
+(nearest rank over the raw samples); coarser tiers take the count-weighted
+95th percentile of the finer buckets' p95 values.
+
+Reads go through plan_tier(): the coarsest tier whose bucket is no wider than
+the requested resolution, topped up with raw samples past its watermark.
+"""
+
+import asyncio
+import logging
+import os
+import random
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple, Type
+
+import numpy as np
+from sqlalchemy import delete, func, insert, select
+
+from models.database_models import (
+    MetricRollupState,
+    ServerMetric,
+    ServerMetricRollup1d,
+    ServerMetricRollup1h,
+    ServerMetricRollup1m,
+)
+from services.database import get_async_session, redis_manager
+from utils.exceptions import ValidationException
+from utils.leader_lock import LeaderLock
+
+logger = logging.getLogger(__name__)
+
+STAT_COLUMNS = ("count", "min", "max", "sum", "p95")
+
+@dataclass(frozen=True)
+class RollupTier:
+    name: str
+    seconds: int
+    model: Type
+    source: Optional[str]  # None: built from raw server_metrics rows
+
+TIERS = (
+    RollupTier("1m", 60, ServerMetricRollup1m, None),
+    RollupTier("1h", 3600, ServerMetricRollup1h, "1m"),
+    RollupTier("1d", 86400, ServerMetricRollup1d, "1h"),
+)
+TIERS_BY_NAME = {tier.name: tier for tier in TIERS}
+
+def to_epoch(values: List[datetime]) -> np.ndarray:
+    """Naive UTC datetimes -> int64 unix seconds"""
+    return np.array(values, dtype="datetime64[s]").astype(np.int64)
+
+def from_epoch(seconds: int) -> datetime:
+    return datetime.utcfromtimestamp(int(seconds))
+
+def _naive_utc(value: datetime) -> datetime:
+    return value.astimezone(timezone.utc).replace(tzinfo=None) if value.tzinfo else value
+
+def _floor(moment: datetime, seconds: int) -> datetime:
+    return from_epoch(int(to_epoch([moment])[0]) // seconds * seconds)
+
+# Vectorized aggregation. A rollup set is a dict of parallel arrays:
+# sid, mtype (int codes), bucket (unix seconds), count, min, max, sum, p95
+
+def _group_starts(*keys: np.ndarray) -> np.ndarray:
+    """Start index of every run of equal keys in already sorted arrays"""
+    change = np.zeros(len(keys[0]), dtype=bool)
+    change[0] = True
+    for key in keys:
+        change[1:] |= key[1:] != key[:-1]
+    return np.flatnonzero(change)
+
+def aggregate_samples(sid: np.ndarray, mtype: np.ndarray, ts: np.ndarray, vs: np.ndarray, seconds: int) -> Dict[str, np.ndarray]:
+    """Raw samples -> buckets of `seconds`; sorting by value inside each group gives min, max and p95 by index"""
+    if len(vs) == 0:
+        return empty_rollups()
+    bucket = ts.astype(np.int64) // seconds * seconds
+    order = np.lexsort((vs, bucket, mtype, sid))
+    sid, mtype, bucket, vs = sid[order], mtype[order], bucket[order], vs[order]
+    starts = _group_starts(sid, mtype, bucket)
+    counts = np.diff(np.r_[starts, len(vs)])
+    ends = starts + counts
+    # Nearest-rank p95
+    p95_index = starts + np.ceil(0.95 * counts).astype(np.int64) - 1
+    return {
+        "sid": sid[starts],
+        "mtype": mtype[starts],
+        "bucket": bucket[starts],
+        "count": counts,
+        "min": vs[starts],
+        "max": vs[ends - 1],
+        "sum": np.add.reduceat(vs, starts),
+        "p95": vs[p95_index],
+    }
+
+def merge_rollups(rollups: Dict[str, np.ndarray], seconds: int) -> Dict[str, np.ndarray]:
+    """Re-bucket rollup rows into wider buckets (p95: count-weighted percentile of the child p95s)"""
+    if len(rollups["count"]) == 0:
+        return empty_rollups()
+    bucket = rollups["bucket"] // seconds * seconds
+    order = np.lexsort((rollups["p95"], bucket, rollups["mtype"], rollups["sid"]))
+    sid, mtype, bucket = rollups["sid"][order], rollups["mtype"][order], bucket[order]
+    counts, p95 = rollups["count"][order], rollups["p95"][order]
+    starts = _group_starts(sid, mtype, bucket)
+    lengths = np.diff(np.r_[starts, len(counts)])
+    totals = np.add.reduceat(counts, starts)
+    # Running count within each group; the first child reaching 95% of the group total holds the p95
+    cumulative = np.cumsum(counts)
+    running = cumulative - np.repeat(cumulative[starts] - counts[starts], lengths)
+    below = running < np.repeat(np.ceil(0.95 * totals), lengths)
+    p95_index = starts + np.add.reduceat(below.astype(np.int64), starts)
+    return {
+        "sid": sid[starts],
+        "mtype": mtype[starts],
+        "bucket": bucket[starts],
+        "count": totals,
+        "min": np.minimum.reduceat(rollups["min"][order], starts),
+        "max": np.maximum.reduceat(rollups["max"][order], starts),
+        "sum": np.add.reduceat(rollups["sum"][order], starts),
+        "p95": p95[p95_index],
+    }
+
+def empty_rollups() -> Dict[str, np.ndarray]:
+    return {
+        "sid": np.empty(0, np.int64), "mtype": np.empty(0, np.int64), "bucket": np.empty(0, np.int64),
+        "count": np.empty(0, np.int64), "min": np.empty(0), "max": np.empty(0), "sum": np.empty(0), "p95": np.empty(0)
+    }
+
+def concat_rollups(*parts: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+    return {key: np.concatenate([part[key] for part in parts]) for key in empty_rollups()}
+
+# Database access
+
+# Rows fetched per round trip; only their NumPy columns are kept, never the row objects
+STREAM_PARTITION_SIZE = 50000
+
+async def _stream_columns(query, dtypes: Tuple[Any, ...]) -> Tuple[Optional[List[np.ndarray]], np.ndarray]:
+    """
+    Stream (server_id, metric_type, timestamp, *values) rows through a
+    server-side cursor into NumPy columns, metric types as integer codes;
+    returns (None, labels) when nothing matched
+    """
+    codes: Dict[str, int] = {}
+    chunks = []
+    async with get_async_session() as session:
+        result = await session.stream(query.execution_options(yield_per=STREAM_PARTITION_SIZE))
+        async for partition in result.partitions():
+            sid, types, timestamps, *values = zip(*partition)
+            found, inverse = np.unique(np.array(types, dtype=object), return_inverse=True)
+            mapping = np.array([codes.setdefault(label, len(codes)) for label in found], dtype=np.int64)
+            chunks.append([
+                np.array(sid, dtype=np.int64), mapping[inverse.reshape(-1)], to_epoch(list(timestamps)),
+                *(np.array(column, dtype=dtype) for column, dtype in zip(values, dtypes))
+            ])
+    labels = np.array(list(codes), dtype=object)
+    if not chunks:
+        return None, labels
+    return [np.concatenate(column) for column in zip(*chunks)], labels
+
+async def _load_raw(
+    start: datetime,
+    end: datetime,
+    server_ids: Optional[List[int]] = None,
+    metric_types: Optional[List[str]] = None
+) -> Tuple[Dict[str, np.ndarray], np.ndarray]:
+    """Raw samples in [start, end) as arrays (plus the metric type labels the codes refer to)"""
+    query = select(ServerMetric.server_id, ServerMetric.metric_type, ServerMetric.recorded_at, ServerMetric.value).where(
+        ServerMetric.recorded_at >= start, ServerMetric.recorded_at < end
+    )
+    if server_ids:
+        query = query.where(ServerMetric.server_id.in_(server_ids))
+    if metric_types:
+        query = query.where(ServerMetric.metric_type.in_(metric_types))
+    columns, labels = await _stream_columns(query, (np.float64,))
+    if columns is None:
+        return {"sid": np.empty(0, np.int64), "mtype": np.empty(0, np.int64), "ts": np.empty(0, np.int64), "vs": np.empty(0)}, labels
+    return dict(zip(("sid", "mtype", "ts", "vs"), columns)), labels
+
+async def _load_tier(
+    tier: RollupTier,
+    start: datetime,
+    end: datetime,
+    server_ids: Optional[List[int]] = None,
+    metric_types: Optional[List[str]] = None
+) -> Tuple[Dict[str, np.ndarray], np.ndarray]:
+    model = tier.model
+    query = select(
+        model.server_id, model.metric_type, model.bucket_start,
+        model.sample_count, model.min_value, model.max_value, model.sum_value, model.p95_value
+    ).where(model.bucket_start >= start, model.bucket_start < end)
+    if server_ids:
+        query = query.where(model.server_id.in_(server_ids))
+    if metric_types:
+        query = query.where(model.metric_type.in_(metric_types))
+    columns, labels = await _stream_columns(query, (np.int64, np.float64, np.float64, np.float64, np.float64))
+    if columns is None:
+        return empty_rollups(), labels
+    return dict(zip(("sid", "mtype", "bucket", "count", "min", "max", "sum", "p95"), columns)), labels
+
+def _relabel(rollups: Dict[str, np.ndarray], labels: np.ndarray, target: Dict[str, int]) -> Dict[str, np.ndarray]:
+    """Map metric type codes of one load onto a shared label -> code table"""
+    for label in labels:
+        target.setdefault(label, len(target))
+    if len(rollups["mtype"]):
+        rollups = {**rollups, "mtype": np.array([target[label] for label in labels], dtype=np.int64)[rollups["mtype"]]}
+    return rollups
+
+class MetricRollupWorker:
+    """Incremental rollup job plus the tier-aware read path"""
+
+    def __init__(self):
+        self.enabled = os.getenv("ROLLUP_ENABLED", "true").lower() == "true"
+        self.interval = float(os.getenv("ROLLUP_INTERVAL", "60"))
+        # Samples may arrive this late and still be counted
+        self.lateness = int(os.getenv("ROLLUP_LATENESS", "300"))
+        # Raw data younger than this is not rolled up yet (ingest queue flush delay)
+        self.settle = int(os.getenv("ROLLUP_SETTLE", "30"))
+        self.max_buckets_per_pass = int(os.getenv("ROLLUP_MAX_BUCKETS_PER_PASS", "720"))
+        self.batch_size = int(os.getenv("ROLLUP_BATCH_SIZE", "5000"))
+        self.leader = LeaderLock("metric_rollups:leader", redis_manager)
+        self._task: Optional[asyncio.Task] = None
+        self._pass_lock = asyncio.Lock()
+        self.watermarks: Dict[str, datetime] = {}
+        self.stats = {"passes": 0, "failed_passes": 0, "buckets_written": 0, "skipped_not_leader": 0, "last_duration_ms": None}
+
+    # Lifecycle
+
+    async def start(self):
+        if self.enabled and self._task is None:
+            self._task = asyncio.create_task(self._run())
+            logger.info(f"Metric rollup worker started (interval {self.interval}s)")
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+            await asyncio.to_thread(self.leader.release)
+
+    async def _run(self):
+        while True:
+            if await asyncio.to_thread(self.leader.acquire, self.interval * 2):
+                try:
+                    await self.run_once()
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    logger.error(f"Metric rollup pass failed: {str(e)}")
+            else:
+                self.stats["skipped_not_leader"] += 1
+            await asyncio.sleep(self.interval * random.uniform(0.9, 1.1))
+
+    # Rollup passes
+
+    async def run_once(self, now: Optional[datetime] = None) -> Dict[str, int]:
+        """Bring every tier up to date; returns buckets written per tier"""
+        async with self._pass_lock:
+            start = time.perf_counter()
+            try:
+                written = {}
+                source_watermark = (now or datetime.utcnow()) - timedelta(seconds=self.settle)
+                source_seconds = 0
+                self.watermarks = await self._load_watermarks()
+                for tier in TIERS:
+                    written[tier.name] = await self._roll_tier(tier, source_watermark, self.lateness + source_seconds)
+                    source_watermark = self.watermarks.get(tier.name)
+                    source_seconds = tier.seconds
+                    if source_watermark is None:
+                        break
+            except Exception:
+                self.stats["failed_passes"] += 1
+                raise
+            self.stats["passes"] += 1
+            self.stats["buckets_written"] += sum(written.values())
+            self.stats["last_duration_ms"] = round((time.perf_counter() - start) * 1000, 1)
+            return written
+
+    async def _load_watermarks(self) -> Dict[str, datetime]:
+        async with get_async_session() as session:
+            rows = (await session.execute(select(MetricRollupState.tier, MetricRollupState.watermark))).all()
+        return {tier: watermark for tier, watermark in rows}
+
+    async def _earliest(self, tier: RollupTier) -> Optional[datetime]:
+        async with get_async_session() as session:
+            if tier.source is None:
+                return await session.scalar(select(func.min(ServerMetric.recorded_at)))
+            source = TIERS_BY_NAME[tier.source].model
+            return await session.scalar(select(func.min(source.bucket_start)))
+
+    async def _roll_tier(self, tier: RollupTier, source_watermark: datetime, lateness: int) -> int:
+        """Recompute complete buckets between this tier's watermark (minus lateness) and the source watermark"""
+        end = _floor(source_watermark, tier.seconds)
+        watermark = self.watermarks.get(tier.name)
+        if watermark is None:
+            earliest = await self._earliest(tier)
+            if earliest is None:
+                return 0
+            begin = _floor(earliest, tier.seconds)
+        else:
+            begin = _floor(min(watermark, source_watermark - timedelta(seconds=lateness)), tier.seconds)
+
+        written = 0
+        while begin < end:
+            chunk_end = min(end, begin + timedelta(seconds=tier.seconds * self.max_buckets_per_pass))
+            written += await self._rebuild(tier, begin, chunk_end)
+            begin = chunk_end
+            self.watermarks[tier.name] = chunk_end
+        return written
+
+    async def _rebuild(self, tier: RollupTier, start: datetime, end: datetime) -> int:
+        if tier.source is None:
+            raw, labels = await _load_raw(start, end)
+            rollups = aggregate_samples(raw["sid"], raw["mtype"], raw["ts"], raw["vs"], tier.seconds)
+        else:
+            finer, labels = await _load_tier(TIERS_BY_NAME[tier.source], start, end)
+            rollups = merge_rollups(finer, tier.seconds)
+
+        rows = [
+            {
+                "server_id": int(sid), "metric_type": labels[mtype], "bucket_start": from_epoch(bucket),
+                "sample_count": int(count), "min_value": float(low), "max_value": float(high),
+                "sum_value": float(total), "avg_value": float(total / count), "p95_value": float(p95)
+            }
+            for sid, mtype, bucket, count, low, high, total, p95 in zip(
+                rollups["sid"], rollups["mtype"], rollups["bucket"], rollups["count"],
+                rollups["min"], rollups["max"], rollups["sum"], rollups["p95"]
+            )
+        ]
+        table = tier.model.__table__
+        # Replace the range and advance the watermark in one transaction
+        async with get_async_session() as session:
+            await session.execute(delete(table).where(table.c.bucket_start >= start, table.c.bucket_start < end))
+            for offset in range(0, len(rows), self.batch_size):
+                await session.execute(insert(table), rows[offset:offset + self.batch_size])
+            state = await session.get(MetricRollupState, tier.name)
+            if state is None:
+                session.add(MetricRollupState(tier=tier.name, watermark=end))
+            else:
+                state.watermark = end
+        return len(rows)
+
+    # Reads
+
+    def plan_tier(self, start: datetime, end: datetime, points: Optional[int] = None, resolution: Optional[int] = None) -> Tuple[Optional[RollupTier], int]:
+        """
+        Coarsest tier whose buckets are no wider than the wanted resolution
+        (seconds, or the range split into `points`); None means raw samples
+        """
+        step = resolution or max(1, int((end - start).total_seconds() // (points or 500)))
+        chosen = None
+        for tier in TIERS:
+            if tier.seconds <= step:
+                chosen = tier
+        # Output buckets are whole multiples of the tier bucket
+        base = chosen.seconds if chosen else 1
+        return chosen, max(base, step // base * base)
+
+    async def query(
+        self,
+        server_id: int,
+        metric_types: List[str],
+        start: datetime,
+        end: datetime,
+        points: Optional[int] = None,
+        resolution: Optional[int] = None
+    ) -> Dict[str, Any]:
+        """Columnar series per metric type at the planned resolution"""
+        start, end = _naive_utc(start), _naive_utc(end)
+        if start >= end:
+            raise ValidationException("start must be before end", field="start")
+        tier, step = self.plan_tier(start, end, points, resolution)
+        start = _floor(start, step)
+        codes: Dict[str, int] = {}
+        parts = []
+        rows_read = 0
+        covered = start
+        if tier is not None:
+            # Chosen tier first, then each finer tier past the previous one's watermark
+            watermarks = await self._load_watermarks()
+            for candidate in reversed(TIERS[:TIERS.index(tier) + 1]):
+                watermark = watermarks.get(candidate.name)
+                if watermark is None or watermark <= covered:
+                    continue
+                rollups, labels = await _load_tier(candidate, covered, min(end, watermark), [server_id], metric_types)
+                parts.append(_relabel(rollups, labels, codes))
+                rows_read += len(rollups["count"])
+                covered = min(end, watermark)
+                if covered >= end:
+                    break
+        if covered < end:
+            # Not rolled up yet (or finer than every tier): aggregate raw samples
+            raw, labels = await _load_raw(covered, end, [server_id], metric_types)
+            rows_read += len(raw["vs"])
+            parts.append(_relabel(
+                aggregate_samples(raw["sid"], raw["mtype"], raw["ts"], raw["vs"], tier.seconds if tier else 1),
+                labels, codes
+            ))
+        merged = merge_rollups(concat_rollups(*parts), step) if parts else empty_rollups()
+
+        series = {}
+        for label, code in codes.items():
+            mask = merged["mtype"] == code
+            counts = merged["count"][mask]
+            series[label] = {
+                "timestamps": merged["bucket"][mask].tolist(),
+                "count": counts.tolist(),
+                "min": merged["min"][mask].tolist(),
+                "max": merged["max"][mask].tolist(),
+                "avg": (merged["sum"][mask] / counts).tolist(),
+                "p95": merged["p95"][mask].tolist(),
+            }
+        return {
+            "server_id": server_id,
+            "start": start.isoformat(),
+            "end": end.isoformat(),
+            "tier": tier.name if tier else "raw",
+            "bucket_seconds": step,
+            "rows_read": rows_read,
+            "series": series
+        }
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            "enabled": self.enabled,
+            "running": self._task is not None and not self._task.done(),
+            "watermarks": {tier: watermark.isoformat() for tier, watermark in self.watermarks.items()}
+        }
+
+# Global rollup worker instance
+metric_rollups = MetricRollupWorker()
@@ -0,0 +1,240 @@
+"""
+Buffered ingestion of server metric samples into server_metrics
+
+Agents post batches of samples; accepted rows go onto a bounded in-process
+queue and a background writer flushes them with multi-row INSERTs once
+METRICS_FLUSH_SIZE rows are waiting or METRICS_FLUSH_INTERVAL seconds have
+passed. When the queue is full new batches are refused with 429 instead of
+buffering without limit.
+"""
+
+import asyncio
+import logging
+import math
+import os
+import time
+from collections import deque
+from datetime import datetime
+from typing import Any, Deque, Dict, List, Optional, Set
+
+from sqlalchemy import insert, select
+
+from models.database_models import Server, ServerMetric
+from services.database import get_async_session
+from utils.exceptions import RateLimitException, ValidationException
+
+logger = logging.getLogger(__name__)
+
+def _timestamp(value: Any) -> datetime:
+    """Unix seconds or ISO 8601 -> naive UTC (the convention of every DateTime column here)"""
+    if isinstance(value, (int, float)):
+        return datetime.utcfromtimestamp(value)
+    parsed = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    if parsed.tzinfo is not None:
+        parsed = datetime.utcfromtimestamp(parsed.timestamp())
+    return parsed
+
+def _row(server_id: Any, metric_type: Any, value: Any, unit: Any, recorded_at: Any) -> Dict[str, Any]:
+    if not isinstance(server_id, int) or isinstance(server_id, bool) or server_id <= 0:
+        raise ValueError("server_id must be a positive integer")
+    if not isinstance(metric_type, str) or not 0 < len(metric_type) <= 50:
+        raise ValueError("metric_type must be a string of 1-50 characters")
+    value = float(value)
+    if not math.isfinite(value):
+        raise ValueError("value must be finite")
+    if unit is not None and (not isinstance(unit, str) or len(unit) > 20):
+        raise ValueError("unit must be a string of at most 20 characters")
+    return {
+        "server_id": server_id,
+        "metric_type": metric_type,
+        "value": value,
+        "unit": unit,
+        "recorded_at": _timestamp(recorded_at) if recorded_at is not None else datetime.utcnow()
+    }
+
+def parse_batch(payload: Any) -> List[Dict[str, Any]]:
+    """
+    Rows from an ingest payload with either (or both) shapes:
+      {"samples": [{"server_id", "metric_type", "value", "unit"?, "recorded_at"?}, ...]}
+      {"series": [{"server_id", "metric_type", "unit"?, "points": [[recorded_at, value], ...]}, ...]}
+    The whole batch is rejected when any sample is invalid
+    """
+    if not isinstance(payload, dict):
+        raise ValidationException("Batch must be an object with samples and/or series")
+    rows = []
+    location = "batch"
+    try:
+        for index, sample in enumerate(payload.get("samples") or []):
+            location = f"samples[{index}]"
+            rows.append(_row(
+                sample.get("server_id"), sample.get("metric_type"), sample.get("value"),
+                sample.get("unit"), sample.get("recorded_at")
+            ))
+        for index, series in enumerate(payload.get("series") or []):
+            location = f"series[{index}]"
+            server_id, metric_type, unit = series.get("server_id"), series.get("metric_type"), series.get("unit")
+            for recorded_at, value in series.get("points") or []:
+                rows.append(_row(server_id, metric_type, value, unit, recorded_at))
+    except (AttributeError, TypeError, ValueError, OverflowError, OSError) as e:
+        raise ValidationException(f"Invalid sample in {location}: {e}", field=location)
+    return rows
+
+class MetricsIngestor:
+    """Bounded sample queue plus the background batch writer"""
+
+    def __init__(self):
+        self.max_pending = int(os.getenv("METRICS_QUEUE_MAX_SAMPLES", "200000"))
+        self.flush_size = int(os.getenv("METRICS_FLUSH_SIZE", "5000"))
+        self.flush_interval = float(os.getenv("METRICS_FLUSH_INTERVAL", "1"))
+        self.max_batch_samples = int(os.getenv("METRICS_MAX_BATCH_SAMPLES", "50000"))
+        self.max_batch_bytes = int(os.getenv("METRICS_MAX_BATCH_BYTES", str(16 * 1024 * 1024)))
+        self.max_flush_attempts = int(os.getenv("METRICS_FLUSH_MAX_ATTEMPTS", "5"))
+
+        self._queue: Deque[List[Dict[str, Any]]] = deque()
+        self.pending = 0
+        self._known_servers: Set[int] = set()
+        self._wake = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self.last_flush_at: Optional[float] = None
+        self._failed_attempts = 0
+        self.stats = {
+            "accepted": 0, "rejected_batches": 0, "written": 0, "dropped_unknown_server": 0,
+            "flushes": 0, "flush_errors": 0, "dropped_after_errors": 0, "lost_on_shutdown": 0
+        }
+
+    # Lifecycle
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self, timeout: float = 10.0):
+        """Stop the writer, flushing what is queued first (bounded by timeout)"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        try:
+            await asyncio.wait_for(self._drain(), timeout)
+        except Exception as e:
+            logger.warning(f"Final metrics flush failed: {str(e)}")
+        if self.pending:
+            self.stats["lost_on_shutdown"] += self.pending
+            logger.warning(f"Discarding {self.pending} queued metric samples on shutdown")
+
+    async def _drain(self):
+        while self.pending:
+            await self.flush_once()
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            # Size-triggered flushes run back to back; otherwise flush whatever the interval collected
+            while self.pending:
+                try:
+                    await self.flush_once()
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    self.stats["flush_errors"] += 1
+                    self._failed_attempts += 1
+                    if self._failed_attempts >= self.max_flush_attempts:
+                        # A chunk that keeps failing must not block the queue forever
+                        dropped = len(self._take(self.flush_size))
+                        self.pending -= dropped
+                        self.stats["dropped_after_errors"] += dropped
+                        self._failed_attempts = 0
+                        logger.error(f"Dropped {dropped} metric samples after {self.max_flush_attempts} failed flushes: {str(e)}")
+                    else:
+                        logger.warning(f"Metrics flush failed, keeping {self.pending} samples queued: {str(e)}")
+                    await asyncio.sleep(min(5.0, self.flush_interval * 2))
+                    break
+                if self.pending < self.flush_size:
+                    break
+
+    # Ingestion
+
+    def ensure_capacity(self, samples: int = 1):
+        """Raise 429 when `samples` more rows do not fit in the queue"""
+        if self.pending + samples > self.max_pending:
+            self.stats["rejected_batches"] += 1
+            raise RateLimitException(
+                "Metrics ingest queue is full",
+                retry_after=max(1, math.ceil(self.flush_interval)),
+                limit_type="metrics_queue",
+                details={"pending": self.pending, "capacity": self.max_pending}
+            )
+
+    def offer(self, rows: List[Dict[str, Any]]) -> int:
+        """Queue a parsed batch, or raise 429 when it does not fit"""
+        if not rows:
+            return 0
+        self.ensure_capacity(len(rows))
+        self._queue.append(rows)
+        self.pending += len(rows)
+        self.stats["accepted"] += len(rows)
+        if self.pending >= self.flush_size:
+            self._wake.set()
+        return len(rows)
+
+    def _take(self, limit: int) -> List[Dict[str, Any]]:
+        chunk: List[Dict[str, Any]] = []
+        while self._queue and len(chunk) < limit:
+            batch = self._queue.popleft()
+            room = limit - len(chunk)
+            if len(batch) > room:
+                self._queue.appendleft(batch[room:])
+                batch = batch[:room]
+            chunk.extend(batch)
+        return chunk
+
+    async def flush_once(self) -> int:
+        """Write up to flush_size queued rows with one multi-row INSERT; rows go back to the queue on failure"""
+        chunk = self._take(self.flush_size)
+        if not chunk:
+            return 0
+        try:
+            rows = await self._known_rows(chunk)
+            if rows:
+                async with get_async_session() as session:
+                    await session.execute(insert(ServerMetric.__table__), rows)
+        except BaseException:
+            self._queue.appendleft(chunk)
+            raise
+        self.pending -= len(chunk)
+        self._failed_attempts = 0
+        self.stats["flushes"] += 1
+        self.stats["written"] += len(rows)
+        self.last_flush_at = time.time()
+        return len(rows)
+
+    async def _known_rows(self, chunk: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Drop samples for servers that do not exist, instead of failing the whole INSERT on the foreign key"""
+        unseen = {row["server_id"] for row in chunk} - self._known_servers
+        if unseen:
+            async with get_async_session() as session:
+                found = await session.scalars(select(Server.id).where(Server.id.in_(unseen)))
+                self._known_servers.update(found)
+        rows = [row for row in chunk if row["server_id"] in self._known_servers]
+        if len(rows) < len(chunk):
+            self.stats["dropped_unknown_server"] += len(chunk) - len(rows)
+        return rows
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            "running": self._task is not None and not self._task.done(),
+            "pending": self.pending,
+            "capacity": self.max_pending,
+            "last_flush_at": datetime.utcfromtimestamp(self.last_flush_at).isoformat() if self.last_flush_at else None
+        }
+
+# Global ingestor instance
+metrics_ingestor = MetricsIngestor()
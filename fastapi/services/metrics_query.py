@@ -0,0 +1,286 @@
+"""
+Vectorized queries over raw server_metrics samples
+
+Rows are streamed from the database in partitions (server-side cursor where
+the driver supports one) straight into NumPy columns: metric types are
+mapped to integer codes in SQL, so the Python side only ever handles
+numbers. Samples are grouped by a packed int64 key (server, metric type,
+time bucket) mapped to dense group ids; count/sum/avg/min/max are then
+bincount and ufunc.at passes with no sort, and percentiles need one value
+sort plus a radix sort by group id, regardless of the number of groups.
+"""
+
+import asyncio
+import logging
+import os
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from sqlalchemy import case, select
+
+from models.database_models import Server, ServerMetric
+from services.database import get_async_session
+from utils.exceptions import ValidationException
+
+logger = logging.getLogger(__name__)
+
+GROUP_KEYS = ("server", "metric", "time")
+BASIC_AGGREGATIONS = ("count", "sum", "avg", "min", "max", "rate")
+PERCENTILES = {"p50": 50, "p90": 90, "p95": 95, "p99": 99}
+AGGREGATIONS = BASIC_AGGREGATIONS + tuple(PERCENTILES)
+# Packed keys below this are made dense with a lookup table rather than np.unique
+COMPACT_TABLE_LIMIT = 1 << 24
+
+@dataclass
+class SampleSet:
+    """Columnar samples; mtype holds indexes into labels"""
+    sid: np.ndarray
+    mtype: np.ndarray
+    ts: np.ndarray
+    vs: np.ndarray
+    labels: List[str]
+
+    def __len__(self) -> int:
+        return len(self.vs)
+
+    @classmethod
+    def empty(cls, labels: Optional[List[str]] = None) -> "SampleSet":
+        return cls(np.empty(0, np.int64), np.empty(0, np.int64), np.empty(0, np.int64), np.empty(0), labels or [])
+
+def _naive_utc(value: datetime) -> datetime:
+    return value.astimezone(timezone.utc).replace(tzinfo=None) if value.tzinfo else value
+
+def _compact(key: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Dense ids 0..G-1 for int64 keys (in key order), plus the distinct keys"""
+    if int(key.max()) < COMPACT_TABLE_LIMIT:
+        # Lookup table instead of a sort: O(n)
+        present = np.zeros(int(key.max()) + 1, dtype=bool)
+        present[key] = True
+        return (np.cumsum(present) - 1)[key], np.flatnonzero(present)
+    distinct, ids = np.unique(key, return_inverse=True)
+    return ids, distinct
+
+def _stable_order(ids: np.ndarray, count: int) -> np.ndarray:
+    """Stable argsort of dense ids; narrow dtypes let NumPy use radix sort"""
+    dtype = np.uint8 if count <= 1 << 8 else np.uint16 if count <= 1 << 16 else np.int64
+    return np.argsort(ids.astype(dtype, copy=False), kind="stable")
+
+def group_samples(
+    samples: SampleSet,
+    group_by: Sequence[str],
+    aggregations: Sequence[str],
+    interval: Optional[int] = None,
+    origin: int = 0
+) -> Dict[str, Any]:
+    """
+    Aggregate samples per group. group_by is any subset of server/metric/time
+    (time buckets are `interval` seconds from `origin`); percentiles use
+    linear interpolation like numpy.percentile; rate is the counter increase
+    per second (resets count from zero), summed over the series in the group
+    """
+    n = len(samples)
+    by_server, by_metric, by_time = ("server" in group_by), ("metric" in group_by), ("time" in group_by)
+    if by_time and not interval:
+        raise ValidationException("interval is required when grouping by time", field="interval")
+    if n == 0:
+        return {"groups": {name: [] for name in _group_columns(group_by)}, "values": {name: [] for name in aggregations}}
+
+    # Packed group key: ((server * metric_count) + metric) * bucket_count + bucket
+    n_metrics = max(1, len(samples.labels))
+    buckets = (samples.ts - origin) // interval if by_time else np.zeros(n, np.int64)
+    n_buckets = int(buckets.max()) + 1 if by_time else 1
+    key = np.zeros(n, np.int64)
+    if by_server:
+        key += samples.sid * (n_metrics * n_buckets)
+    if by_metric:
+        key += samples.mtype * n_buckets
+    if by_time:
+        key += buckets
+    gid, group_keys = _compact(key)
+    n_groups = len(group_keys)
+
+    groups: Dict[str, list] = {}
+    if by_server:
+        groups["server_id"] = (group_keys // (n_metrics * n_buckets)).tolist()
+    if by_metric:
+        groups["metric_type"] = [samples.labels[code] for code in (group_keys // n_buckets % n_metrics)]
+    if by_time:
+        groups["timestamp"] = (origin + group_keys % n_buckets * interval).tolist()
+
+    # count/sum/min/max need no sort
+    counts = np.bincount(gid, minlength=n_groups)
+    result: Dict[str, np.ndarray] = {}
+    sorted_values = None
+    for name in aggregations:
+        if name == "count":
+            result[name] = counts
+        elif name == "sum":
+            result[name] = np.bincount(gid, weights=samples.vs, minlength=n_groups)
+        elif name == "avg":
+            result[name] = np.bincount(gid, weights=samples.vs, minlength=n_groups) / counts
+        elif name == "min":
+            result[name] = np.full(n_groups, np.inf)
+            np.minimum.at(result[name], gid, samples.vs)
+        elif name == "max":
+            result[name] = np.full(n_groups, -np.inf)
+            np.maximum.at(result[name], gid, samples.vs)
+        elif name in PERCENTILES:
+            if sorted_values is None:
+                # Values ascending within each group: sort by value, then stably by group
+                by_value = np.argsort(samples.vs)
+                sorted_values = samples.vs[by_value[_stable_order(gid[by_value], n_groups)]]
+                starts = np.cumsum(counts) - counts
+            position = (counts - 1) * (PERCENTILES[name] / 100.0)
+            lower = np.floor(position).astype(np.int64)
+            upper = np.minimum(lower + 1, counts - 1)
+            low, high = sorted_values[starts + lower], sorted_values[starts + upper]
+            result[name] = low + (high - low) * (position - lower)
+        elif name == "rate":
+            result[name] = _rates(samples, gid, n_groups, n_metrics)
+
+    return {
+        "groups": groups,
+        "values": {name: _finite_list(column) for name, column in result.items()},
+    }
+
+def _group_columns(group_by: Sequence[str]) -> List[str]:
+    columns = {"server": "server_id", "metric": "metric_type", "time": "timestamp"}
+    return [columns[name] for name in GROUP_KEYS if name in group_by]
+
+def _rates(samples: SampleSet, gid: np.ndarray, n_groups: int, n_metrics: int) -> np.ndarray:
+    """Per group: sum over its series of counter increase, divided by the group's time span"""
+    series, _ = _compact((gid * n_metrics + samples.mtype) * (int(samples.sid.max()) + 1) + samples.sid)
+    # Time order within each series (samples usually arrive time-sorted already)
+    by_time = np.arange(len(series)) if np.all(samples.ts[1:] >= samples.ts[:-1]) else np.argsort(samples.ts, kind="stable")
+    order = by_time[_stable_order(series[by_time], int(series.max()) + 1)]
+    series, vs, g = series[order], samples.vs[order], gid[order]
+    delta = np.diff(vs)
+    increase = np.where(delta < 0, vs[1:], delta) * (series[1:] == series[:-1])
+    totals = np.bincount(g[1:], weights=increase, minlength=n_groups)
+    first, last = np.full(n_groups, np.iinfo(np.int64).max), np.full(n_groups, np.iinfo(np.int64).min)
+    np.minimum.at(first, gid, samples.ts)
+    np.maximum.at(last, gid, samples.ts)
+    span = last - first
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(span > 0, totals / span, np.nan)
+
+def _finite_list(column: np.ndarray) -> list:
+    """JSON has no NaN: undefined aggregates become null"""
+    if column.dtype.kind == "f" and not np.isfinite(column).all():
+        return [None if not np.isfinite(value) else value for value in column.tolist()]
+    return column.tolist()
+
+class MetricsQueryEngine:
+    """Streams server_metrics ranges into NumPy and aggregates them"""
+
+    def __init__(self):
+        self.partition_size = int(os.getenv("METRICS_QUERY_PARTITION_SIZE", "50000"))
+        self.max_samples = int(os.getenv("METRICS_QUERY_MAX_SAMPLES", "20000000"))
+        self.max_buckets = int(os.getenv("METRICS_QUERY_MAX_BUCKETS", "100000"))
+
+    async def _metric_labels(self, session, conditions) -> List[str]:
+        rows = await session.scalars(select(ServerMetric.metric_type).where(*conditions).distinct())
+        return sorted(rows)
+
+    async def load(
+        self,
+        start: datetime,
+        end: datetime,
+        server_ids: Optional[List[int]] = None,
+        user_id: Optional[int] = None,
+        metric_types: Optional[List[str]] = None
+    ) -> SampleSet:
+        """Samples in [start, end) for the selected servers; ValidationException past METRICS_QUERY_MAX_SAMPLES"""
+        conditions = [ServerMetric.recorded_at >= start, ServerMetric.recorded_at < end]
+        async with get_async_session() as session:
+            if user_id is not None:
+                owned = select(Server.id).where(Server.user_id == user_id, Server.deleted_at.is_(None))
+                if server_ids:
+                    owned = owned.where(Server.id.in_(server_ids))
+                server_ids = list(await session.scalars(owned))
+                if not server_ids:
+                    return SampleSet.empty()
+            if server_ids:
+                conditions.append(ServerMetric.server_id.in_(server_ids))
+            if metric_types:
+                conditions.append(ServerMetric.metric_type.in_(metric_types))
+                labels = sorted(set(metric_types))
+            else:
+                labels = await self._metric_labels(session, conditions)
+            if not labels:
+                return SampleSet.empty()
+
+            code = case({label: index for index, label in enumerate(labels)}, value=ServerMetric.metric_type)
+            query = select(ServerMetric.server_id, code, ServerMetric.recorded_at, ServerMetric.value).where(*conditions)
+            result = await session.stream(query.execution_options(yield_per=self.partition_size))
+            chunks = []
+            loaded = 0
+            async for partition in result.partitions():
+                sid, mtype, recorded, value = zip(*partition)
+                loaded += len(sid)
+                if loaded > self.max_samples:
+                    await result.close()
+                    raise ValidationException(
+                        f"Query matches more than {self.max_samples} samples; narrow the range or the server selection"
+                    )
+                chunks.append((
+                    np.array(sid, dtype=np.int64),
+                    np.array(mtype, dtype=np.int64),
+                    np.array(recorded, dtype="datetime64[s]").astype(np.int64),
+                    np.array(value, dtype=np.float64),
+                ))
+        if not chunks:
+            return SampleSet.empty(labels)
+        return SampleSet(*(np.concatenate(column) for column in zip(*chunks)), labels=labels)
+
+    async def query(
+        self,
+        metric_types: Optional[List[str]],
+        aggregations: List[str],
+        group_by: List[str],
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        interval: Optional[int] = None,
+        server_ids: Optional[List[int]] = None,
+        user_id: Optional[int] = None
+    ) -> Dict[str, Any]:
+        end = _naive_utc(end) if end else datetime.utcnow()
+        start = _naive_utc(start) if start else end - timedelta(days=1)
+        if start >= end:
+            raise ValidationException("start must be before end", field="start")
+        unknown = sorted(set(aggregations) - set(AGGREGATIONS)) + sorted(set(group_by) - set(GROUP_KEYS))
+        if unknown:
+            raise ValidationException(f"Unsupported aggregation or group: {', '.join(unknown)}")
+        if "time" in group_by and not interval:
+            raise ValidationException("interval is required when grouping by time", field="interval")
+        if interval and (end - start).total_seconds() / interval > self.max_buckets:
+            raise ValidationException(f"interval too small: more than {self.max_buckets} time buckets", field="interval")
+
+        started = time.perf_counter()
+        samples = await self.load(start, end, server_ids, user_id, metric_types)
+        loaded = time.perf_counter()
+        origin = int(np.datetime64(start, "s").astype(np.int64))
+        if interval:
+            origin -= origin % interval
+        # Sorting millions of samples takes a while; keep it off the event loop
+        data = await asyncio.to_thread(group_samples, samples, group_by, aggregations, interval, origin)
+        finished = time.perf_counter()
+        return {
+            **data,
+            "meta": {
+                "start": start.isoformat(),
+                "end": end.isoformat(),
+                "group_by": list(group_by),
+                "interval": interval,
+                "samples": len(samples),
+                "groups": len(next(iter(data["values"].values()), [])),
+                "load_ms": round((loaded - started) * 1000, 1),
+                "compute_ms": round((finished - loaded) * 1000, 1)
+            }
+        }
+
+# Global query engine instance
+metrics_query = MetricsQueryEngine()
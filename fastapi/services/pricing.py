@@ -0,0 +1,278 @@
+"""
+Hetzner pricing catalog and cost estimates
+
+GET /pricing is fetched through the catalog cache (fresh for
+PRICING_CACHE_TTL, then stale-while-revalidate, shared across workers via
+Redis) and compiled once per cached response into a lookup table keyed by
+(server_type, location). Each entry holds the server's hourly/monthly
+net/gross prices plus that location's primary IPv4 price, so estimating a
+configuration is one dict probe and a few multiplications; a batch of
+hundreds of configurations never goes back to Hetzner.
+
+Hetzner bills per started hour, capped at the monthly price, and backups
+as a percentage of the server price.
+"""
+
+import logging
+import math
+import os
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+from services.catalog_cache import catalog_cache
+from services.hetzner_client import HetznerClient, get_http_client
+from services.usage_metering import PriceTable
+from utils.exceptions import ValidationException
+
+logger = logging.getLogger(__name__)
+
+CACHE_KEY = "pricing"
+
+def _amount(price: Optional[Dict[str, Any]], kind: str) -> float:
+    """Hetzner prices are decimal strings: {"net": "3.2900000000", "gross": "3.9151000000"}"""
+    return float((price or {}).get(kind) or 0)
+
+@dataclass(frozen=True)
+class Rate:
+    hourly_net: float
+    hourly_gross: float
+    monthly_net: float
+    monthly_gross: float
+
+    @classmethod
+    def parse(cls, price: Dict[str, Any]) -> "Rate":
+        return cls(
+            _amount(price.get("price_hourly"), "net"),
+            _amount(price.get("price_hourly"), "gross"),
+            _amount(price.get("price_monthly"), "net"),
+            _amount(price.get("price_monthly"), "gross")
+        )
+
+    def scaled(self, factor: float) -> "Rate":
+        return Rate(
+            self.hourly_net * factor, self.hourly_gross * factor,
+            self.monthly_net * factor, self.monthly_gross * factor
+        )
+
+    def for_hours(self, hours: int) -> Tuple[float, float]:
+        """(net, gross) for this many started hours, capped at the monthly price"""
+        return (
+            min(self.hourly_net * hours, self.monthly_net),
+            min(self.hourly_gross * hours, self.monthly_gross)
+        )
+
+@dataclass(frozen=True)
+class LocationPrice:
+    """Everything needed to quote one (server_type, location)"""
+    server: Rate
+    primary_ipv4: Optional[Rate]
+    included_traffic: Optional[int]
+
+class PricingCatalog:
+    """Compiled form of a /pricing response"""
+
+    def __init__(
+        self,
+        currency: str,
+        vat_rate: float,
+        backup_percentage: float,
+        prices: Dict[Tuple[str, str], LocationPrice],
+        etag: Optional[str] = None
+    ):
+        self.currency = currency
+        self.vat_rate = vat_rate
+        self.backup_percentage = backup_percentage
+        self.prices = prices
+        self.etag = etag
+
+    @classmethod
+    def compile(cls, pricing: Dict[str, Any], etag: Optional[str] = None) -> "PricingCatalog":
+        ipv4: Dict[str, Rate] = {}
+        for primary_ip in pricing.get("primary_ips") or []:
+            if primary_ip.get("type") == "ipv4":
+                for price in primary_ip.get("prices") or []:
+                    ipv4[price["location"]] = Rate.parse(price)
+
+        prices: Dict[Tuple[str, str], LocationPrice] = {}
+        for server_type in pricing.get("server_types") or []:
+            for price in server_type.get("prices") or []:
+                location = price["location"]
+                prices[(server_type["name"], location)] = LocationPrice(
+                    Rate.parse(price), ipv4.get(location), price.get("included_traffic")
+                )
+
+        return cls(
+            currency=pricing.get("currency", "EUR"),
+            vat_rate=float(pricing.get("vat_rate") or 0),
+            backup_percentage=float((pricing.get("server_backup") or {}).get("percentage") or 0),
+            prices=prices,
+            etag=etag
+        )
+
+    def server_types(self) -> List[str]:
+        return sorted({server_type for server_type, _ in self.prices})
+
+    def locations(self, server_type: str) -> List[str]:
+        return sorted(location for name, location in self.prices if name == server_type)
+
+    def price_table(self) -> PriceTable:
+        """Hourly net prices in the shape usage metering consumes"""
+        return PriceTable({key: price.server.hourly_net for key, price in self.prices.items()})
+
+    def quote(
+        self,
+        server_type: str,
+        location: str,
+        enable_backups: bool = False,
+        enable_ipv4: bool = True,
+        count: int = 1,
+        hours: Optional[float] = None
+    ) -> Optional[Dict[str, Any]]:
+        """Cost of `count` servers of one configuration; None if Hetzner does not sell it there"""
+        price = self.prices.get((server_type, location))
+        if price is None:
+            return None
+
+        components = [("server", price.server)]
+        if enable_backups:
+            components.append(("backups", price.server.scaled(self.backup_percentage / 100)))
+        if enable_ipv4 and price.primary_ipv4 is not None:
+            components.append(("primary_ipv4", price.primary_ipv4))
+
+        started_hours = math.ceil(hours) if hours is not None else None
+        breakdown = []
+        totals = {"hourly_net": 0.0, "hourly_gross": 0.0, "monthly_net": 0.0, "monthly_gross": 0.0,
+                  "period_net": 0.0, "period_gross": 0.0}
+        for component, rate in components:
+            rate = rate.scaled(count)
+            line = {
+                "component": component,
+                "hourly": {"net": round(rate.hourly_net, 4), "gross": round(rate.hourly_gross, 4)},
+                "monthly": {"net": round(rate.monthly_net, 4), "gross": round(rate.monthly_gross, 4)}
+            }
+            totals["hourly_net"] += rate.hourly_net
+            totals["hourly_gross"] += rate.hourly_gross
+            totals["monthly_net"] += rate.monthly_net
+            totals["monthly_gross"] += rate.monthly_gross
+            if started_hours is not None:
+                net, gross = rate.for_hours(started_hours)
+                line["period"] = {"net": round(net, 4), "gross": round(gross, 4)}
+                totals["period_net"] += net
+                totals["period_gross"] += gross
+            breakdown.append(line)
+
+        estimate = {
+            "server_type": server_type,
+            "location": location,
+            "count": count,
+            "currency": self.currency,
+            "hourly": {"net": round(totals["hourly_net"], 4), "gross": round(totals["hourly_gross"], 4)},
+            "monthly": {"net": round(totals["monthly_net"], 4), "gross": round(totals["monthly_gross"], 4)},
+            "included_traffic": price.included_traffic,
+            "breakdown": breakdown
+        }
+        if started_hours is not None:
+            estimate["period"] = {
+                "hours": started_hours,
+                "net": round(totals["period_net"], 4),
+                "gross": round(totals["period_gross"], 4)
+            }
+        return estimate
+
+class PricingService:
+    """Cached Hetzner pricing, compiled once per fetched response"""
+
+    def __init__(self):
+        self.ttl = float(os.getenv("PRICING_CACHE_TTL", "3600"))
+        self.stale_ttl = float(os.getenv("PRICING_CACHE_STALE_TTL", "86400"))
+        self._compiled: Optional[PricingCatalog] = None
+        self.stats = {"compiles": 0, "estimates": 0, "unpriced": 0}
+
+    async def _fetch(self) -> Dict[str, Any]:
+        response = await HetznerClient(get_http_client()).get_pricing()
+        return response.get("pricing", {})
+
+    async def pricing(self):
+        """The raw /pricing document (cache entry, with its ETag)"""
+        return await catalog_cache.get_entry(CACHE_KEY, self._fetch, self.ttl, self.stale_ttl)
+
+    async def catalog(self) -> PricingCatalog:
+        entry = await self.pricing()
+        # Recompile only when the cached document changed
+        if self._compiled is None or self._compiled.etag != entry.etag:
+            self._compiled = PricingCatalog.compile(entry.value, entry.etag)
+            self.stats["compiles"] += 1
+            logger.info(f"Pricing catalog compiled: {len(self._compiled.prices)} server type/location prices")
+        return self._compiled
+
+    async def price_table(self) -> PriceTable:
+        """usage_metering.price_source"""
+        return (await self.catalog()).price_table()
+
+    async def estimate(self, configuration: Dict[str, Any]) -> Dict[str, Any]:
+        catalog = await self.catalog()
+        estimate = self._quote(catalog, configuration)
+        if estimate is None:
+            raise ValidationException(
+                f"{configuration['server_type']} is not available in {configuration['location']}",
+                field="server_type",
+                value=configuration["server_type"]
+            )
+        return estimate
+
+    async def estimate_many(self, configurations: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Price every configuration against one compiled catalog; unpriceable ones are reported in place"""
+        catalog = await self.catalog()
+        results = []
+        totals = {"hourly_net": 0.0, "hourly_gross": 0.0, "monthly_net": 0.0, "monthly_gross": 0.0}
+        for index, configuration in enumerate(configurations):
+            estimate = self._quote(catalog, configuration)
+            if estimate is None:
+                results.append({
+                    "index": index,
+                    "server_type": configuration["server_type"],
+                    "location": configuration["location"],
+                    "error": "not_available",
+                    "available_locations": catalog.locations(configuration["server_type"])
+                })
+                continue
+            for period in ("hourly", "monthly"):
+                totals[f"{period}_net"] += estimate[period]["net"]
+                totals[f"{period}_gross"] += estimate[period]["gross"]
+            results.append({"index": index, **estimate})
+        return {
+            "items": results,
+            "totals": {
+                "currency": catalog.currency,
+                "hourly": {"net": round(totals["hourly_net"], 4), "gross": round(totals["hourly_gross"], 4)},
+                "monthly": {"net": round(totals["monthly_net"], 4), "gross": round(totals["monthly_gross"], 4)}
+            }
+        }
+
+    def _quote(self, catalog: PricingCatalog, configuration: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        estimate = catalog.quote(
+            configuration["server_type"],
+            configuration["location"],
+            enable_backups=configuration.get("enable_backups", False),
+            enable_ipv4=configuration.get("enable_ipv4", True),
+            count=configuration.get("count", 1),
+            hours=configuration.get("hours")
+        )
+        self.stats["estimates"] += 1
+        if estimate is None:
+            self.stats["unpriced"] += 1
+        return estimate
+
+    async def invalidate(self):
+        await catalog_cache.invalidate(CACHE_KEY)
+        self._compiled = None
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            "compiled_prices": len(self._compiled.prices) if self._compiled else 0,
+            "currency": self._compiled.currency if self._compiled else None
+        }
+
+# Global pricing service instance
+pricing_service = PricingService()
@@ -0,0 +1,695 @@
+"""
+Resource quota enforcement on Redis counters
+
+Each (user, resource type) has a Redis hash holding the limit (loaded from
+resource_quotas), committed usage and the sum of outstanding reservations.
+Creating resources is a two-step protocol, each step one atomic Lua script:
+
+    reserve  - used + reserved + amount <= limit, else QuotaExceededException
+    commit   - the resources exist: move the amount (or part of it) to used
+    release  - the create failed: drop the reservation
+
+so concurrent creates never over-allocate and never wait on a row lock.
+Reservations expire after QUOTA_RESERVATION_TTL; one that is neither
+committed nor released (crashed worker) stops counting on its own. How
+each reservation ended is remembered for QUOTA_TOMBSTONE_TTL, so a commit
+that is repeated (retried request), late (expired reservation) or made up
+counts nothing.
+
+MySQL's resource_quotas.current_usage is the source of truth for usage.
+Each counter remembers the usage MySQL already reflects (`base`); changes
+mark it dirty, and a leader-only reconciler adds each dirty counter's
+delta (used - base) to current_usage and acknowledges it, which moves base
+and clears the dirty mark once nothing changed meanwhile. A failed write
+leaves the mark for the next pass. Limits are re-read from MySQL every
+QUOTA_LIMIT_TTL seconds, and usage is rebased onto current_usage then, so
+changes made through the fallback below are picked up (a Redis that lost
+its data simply reloads).
+
+While Redis is unreachable, reservations are quota_reservations rows
+checked under a lock on the resource_quotas row: unexpired rows count
+against the limit, commit and release delete the row (so repeating either,
+or passing an id that was never issued, changes nothing), and expired rows
+are swept by the next reservation of that counter. Open rows also count
+against the limit in Redis (loaded as `held`), and counters the fallback
+touched are reloaded before this worker reserves against them in Redis.
+"""
+
+import asyncio
+import logging
+import os
+import random
+import re
+import time
+import uuid
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from sqlalchemy import bindparam, case, delete, func, select, update
+
+from models.database_models import QuotaReservation, ResourceQuota
+from services.database import get_async_session, redis_manager
+from utils.exceptions import QuotaExceededException, ValidationException
+from utils.leader_lock import LeaderLock
+from utils.single_flight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+RESOURCE_TYPE = re.compile(r"^[a-z][a-z0-9_]{0,49}$")
+DIRTY_KEY = "quota:dirty"
+
+# Shared by the scripts below: KEYS[1] counter hash, KEYS[2] reservation expiry
+# zset, KEYS[3] reservation amounts hash, KEYS[4] settled reservation outcomes
+# hash, KEYS[5] settled reservation expiry zset. Frees reservations that timed
+# out and remembers how each reservation ended, so a repeated commit or one
+# for an expired reservation changes nothing.
+EXPIRE_RESERVATIONS = """
+local function now_seconds()
+    local t = redis.call('TIME')
+    return tonumber(t[1]) + tonumber(t[2]) / 1000000
+end
+local function settle(id, outcome, now, tombstone_ttl)
+    redis.call('HSET', KEYS[4], id, outcome)
+    redis.call('ZADD', KEYS[5], now + tombstone_ttl, id)
+end
+local function expire_reservations(now, tombstone_ttl)
+    local forgotten = redis.call('ZRANGEBYSCORE', KEYS[5], '-inf', now, 'LIMIT', 0, 1000)
+    if #forgotten > 0 then
+        redis.call('HDEL', KEYS[4], unpack(forgotten))
+        redis.call('ZREM', KEYS[5], unpack(forgotten))
+    end
+    local stale = redis.call('ZRANGEBYSCORE', KEYS[2], '-inf', now, 'LIMIT', 0, 1000)
+    if #stale == 0 then
+        return
+    end
+    local freed = 0
+    for _, id in ipairs(stale) do
+        freed = freed + (tonumber(redis.call('HGET', KEYS[3], id)) or 0)
+        redis.call('HDEL', KEYS[3], id)
+        settle(id, 'expired', now, tombstone_ttl)
+    end
+    redis.call('ZREM', KEYS[2], unpack(stale))
+    redis.call('HINCRBY', KEYS[1], 'reserved', -freed)
+end
+local function touch(ttl)
+    for i = 1, 5 do
+        redis.call('EXPIRE', KEYS[i], ttl)
+    end
+end
+"""
+
+# ARGV: reservation id, amount, reservation ttl, limit ttl (-1: trust the loaded limit), state ttl, tombstone ttl
+# Returns {status, used, reserved, limit}: 1 reserved, 0 over quota, -1 limit must be (re)loaded.
+# `held` is what open MySQL fallback reservations hold; it counts like reserved
+RESERVE_SCRIPT = EXPIRE_RESERVATIONS + """
+local now = now_seconds()
+local state = redis.call('HMGET', KEYS[1], 'limit', 'loaded_at')
+local limit_ttl = tonumber(ARGV[4])
+if not state[1] or (limit_ttl >= 0 and now - tonumber(state[2]) > limit_ttl) then
+    return {-1, 0, 0, 0}
+end
+expire_reservations(now, tonumber(ARGV[6]))
+local limit = tonumber(state[1])
+local counts = redis.call('HMGET', KEYS[1], 'used', 'reserved', 'held')
+local used, reserved = tonumber(counts[1]), tonumber(counts[2]) + (tonumber(counts[3]) or 0)
+if redis.call('ZSCORE', KEYS[2], ARGV[1]) then
+    return {1, used, reserved, limit}
+end
+local amount = tonumber(ARGV[2])
+if limit >= 0 and used + reserved + amount > limit then
+    return {0, used, reserved, limit}
+end
+redis.call('HINCRBY', KEYS[1], 'reserved', amount)
+redis.call('ZADD', KEYS[2], now + tonumber(ARGV[3]), ARGV[1])
+redis.call('HSET', KEYS[3], ARGV[1], amount)
+touch(tonumber(ARGV[5]))
+return {1, used, reserved + amount, limit}
+"""
+
+# ARGV: limit, MySQL current_usage, amount held by open fallback reservations, state ttl
+# `base` is the usage MySQL already reflects; changes not yet reconciled
+# (used - base) are kept on top of MySQL's current value
+LOAD_SCRIPT = EXPIRE_RESERVATIONS + """
+local now = now_seconds()
+local state = redis.call('HMGET', KEYS[1], 'used', 'base')
+local current = tonumber(ARGV[2])
+if not state[1] or not state[2] then
+    redis.call('DEL', KEYS[2], KEYS[3])
+    redis.call('HSET', KEYS[1], 'limit', ARGV[1], 'used', current, 'base', current, 'reserved', 0,
+        'held', ARGV[3], 'loaded_at', tostring(now))
+else
+    local pending = tonumber(state[1]) - tonumber(state[2])
+    redis.call('HSET', KEYS[1], 'limit', ARGV[1], 'used', math.max(0, current + pending), 'base', current,
+        'held', ARGV[3], 'loaded_at', tostring(now))
+end
+touch(tonumber(ARGV[4]))
+return 1
+"""
+
+# KEYS[6] dirty set. ARGV: reservation id, committed amount, dirty member, state ttl, tombstone ttl
+# Returns {status, used, reserved, limit, counted}: 1 committed now, 2 already
+# committed (counted then), 3 expired, 4 released, 0 never issued, -1 counter
+# not loaded. Only status 1 changes usage
+COMMIT_SCRIPT = EXPIRE_RESERVATIONS + """
+if redis.call('HEXISTS', KEYS[1], 'base') == 0 then
+    return {-1, 0, 0, 0, 0}
+end
+local now = now_seconds()
+expire_reservations(now, tonumber(ARGV[5]))
+local status, counted = 0, 0
+local held = tonumber(redis.call('HGET', KEYS[3], ARGV[1]))
+if held then
+    status, counted = 1, tonumber(ARGV[2])
+    redis.call('HDEL', KEYS[3], ARGV[1])
+    redis.call('ZREM', KEYS[2], ARGV[1])
+    redis.call('HINCRBY', KEYS[1], 'reserved', -held)
+    settle(ARGV[1], 'committed:' .. counted, now, tonumber(ARGV[5]))
+    if counted ~= 0 then
+        redis.call('HINCRBY', KEYS[1], 'used', counted)
+        redis.call('SADD', KEYS[6], ARGV[3])
+    end
+    touch(tonumber(ARGV[4]))
+else
+    local outcome = redis.call('HGET', KEYS[4], ARGV[1])
+    if outcome == 'expired' then
+        status = 3
+    elseif outcome == 'released' then
+        status = 4
+    elseif outcome then
+        status, counted = 2, tonumber(string.sub(outcome, 11))
+    end
+end
+local counts = redis.call('HMGET', KEYS[1], 'used', 'reserved', 'held', 'limit')
+return {status, tonumber(counts[1]), tonumber(counts[2]) + (tonumber(counts[3]) or 0), tonumber(counts[4]), counted}
+"""
+
+# ARGV: reservation id, tombstone ttl. Returns the amount released (0 if it was unknown, settled or expired)
+RELEASE_SCRIPT = EXPIRE_RESERVATIONS + """
+local now = now_seconds()
+expire_reservations(now, tonumber(ARGV[2]))
+local held = tonumber(redis.call('HGET', KEYS[3], ARGV[1]))
+if not held then
+    return 0
+end
+redis.call('HDEL', KEYS[3], ARGV[1])
+redis.call('ZREM', KEYS[2], ARGV[1])
+redis.call('HINCRBY', KEYS[1], 'reserved', -held)
+settle(ARGV[1], 'released', now, tonumber(ARGV[2]))
+return held
+"""
+
+# KEYS[6] dirty set. ARGV: amount, dirty member, state ttl. Returns new usage, or -1 if not loaded
+FREE_SCRIPT = EXPIRE_RESERVATIONS + """
+if redis.call('HEXISTS', KEYS[1], 'base') == 0 then
+    return -1
+end
+local used = math.max(0, tonumber(redis.call('HGET', KEYS[1], 'used')) - tonumber(ARGV[1]))
+redis.call('HSET', KEYS[1], 'used', used)
+redis.call('SADD', KEYS[6], ARGV[2])
+touch(tonumber(ARGV[3]))
+return used
+"""
+
+# ARGV: tombstone ttl. Returns {limit, used, reserved} after expiring stale reservations, or {} if not loaded
+PEEK_SCRIPT = EXPIRE_RESERVATIONS + """
+if redis.call('HEXISTS', KEYS[1], 'base') == 0 then
+    return {}
+end
+expire_reservations(now_seconds(), tonumber(ARGV[1]))
+local counts = redis.call('HMGET', KEYS[1], 'limit', 'used', 'reserved', 'held')
+return {tonumber(counts[1]), tonumber(counts[2]), tonumber(counts[3]) + (tonumber(counts[4]) or 0)}
+"""
+
+# KEYS[2] dirty set. ARGV: delta added to MySQL, dirty member
+# Moves base by what was written and clears the dirty mark unless usage moved on since
+ACK_SCRIPT = """
+if redis.call('HEXISTS', KEYS[1], 'base') == 0 then
+    redis.call('SREM', KEYS[2], ARGV[2])
+    return 1
+end
+local base = redis.call('HINCRBY', KEYS[1], 'base', ARGV[1])
+if tonumber(redis.call('HGET', KEYS[1], 'used')) == base then
+    redis.call('SREM', KEYS[2], ARGV[2])
+    return 1
+end
+return 0
+"""
+
+@dataclass
+class Reservation:
+    id: str
+    user_id: int
+    resource_type: str
+    amount: int
+    backend: str  # "redis", "database", or "none" (no resource_quotas row while on the fallback)
+    usage: Dict[str, Any]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "reservation_id": self.id,
+            "user_id": self.user_id,
+            "resource_type": self.resource_type,
+            "amount": self.amount,
+            "backend": self.backend,
+            "usage": self.usage
+        }
+
+BACKEND_CODES = {"redis": "r", "database": "d", "none": "n"}
+
+# COMMIT_SCRIPT statuses
+COMMIT_OUTCOMES = {1: "committed", 2: "already_committed", 3: "expired", 4: "released", 0: "unknown"}
+
+def reservation_id(backend: str, user_id: int, resource_type: str, amount: int) -> str:
+    """Self-describing id, so commit/release need nothing but the id"""
+    return f"{BACKEND_CODES[backend]}.{user_id}.{resource_type}.{amount}.{uuid.uuid4().hex[:12]}"
+
+def parse_reservation_id(value: str) -> Tuple[str, int, str, int]:
+    try:
+        code, user_id, resource_type, amount, _ = value.split(".")
+        backend = next(name for name, short in BACKEND_CODES.items() if short == code)
+        return backend, int(user_id), resource_type, int(amount)
+    except (ValueError, StopIteration):
+        raise ValidationException("Malformed reservation id", field="reservation_id", value=value)
+
+def check_resource_type(resource_type: str):
+    if not RESOURCE_TYPE.match(resource_type or ""):
+        raise ValidationException("Invalid resource type", field="resource_type", value=resource_type)
+
+def usage_dict(limit: int, used: int, reserved: int) -> Dict[str, Any]:
+    unlimited = limit is None or limit < 0
+    return {
+        "limit": None if unlimited else limit,
+        "used": used,
+        "reserved": reserved,
+        "available": None if unlimited else max(0, limit - used - reserved)
+    }
+
+class QuotaService:
+    """Reservation API, Redis scripts with a MySQL fallback, and the reconciler"""
+
+    def __init__(self):
+        self.reservation_ttl = int(os.getenv("QUOTA_RESERVATION_TTL", "600"))
+        self.limit_ttl = float(os.getenv("QUOTA_LIMIT_TTL", "60"))
+        self.state_ttl = int(os.getenv("QUOTA_STATE_TTL", str(7 * 86400)))
+        # How long a settled reservation id is remembered, so repeated commits are recognised
+        self.tombstone_ttl = int(os.getenv("QUOTA_TOMBSTONE_TTL", "86400"))
+        self.reconcile_interval = float(os.getenv("QUOTA_RECONCILE_INTERVAL", "10"))
+        self.reconcile_batch = int(os.getenv("QUOTA_RECONCILE_BATCH", "1000"))
+        self.enabled = os.getenv("QUOTA_RECONCILE_ENABLED", "true").lower() == "true"
+        self.leader = LeaderLock("quotas:reconcile:leader", redis_manager)
+        self._loads = SingleFlight()
+        self.redis = None
+        self._redis_retry_at = 0.0
+        # Counters the MySQL fallback changed; reloaded before Redis reserves against them again
+        self._fallback_counters: Set[str] = set()
+        self._task: Optional[asyncio.Task] = None
+        self.stats = {
+            "reserved": 0, "rejected": 0, "committed": 0, "ignored_commits": 0, "released": 0, "freed": 0,
+            "limit_loads": 0, "database_fallbacks": 0, "reconciled": 0, "reconcile_passes": 0,
+            "reconcile_errors": 0, "reserve_seconds": 0.0
+        }
+        redis_url = os.getenv("REDIS_URL")
+        if redis_url:
+            import redis.asyncio as aioredis
+
+            self.use_redis(aioredis.from_url(
+                redis_url, decode_responses=True, socket_connect_timeout=1, socket_timeout=1
+            ))
+
+    def use_redis(self, client):
+        """Keep the counters in this asyncio Redis client (decode_responses=True)"""
+        self.redis = client
+        self._reserve_script = client.register_script(RESERVE_SCRIPT)
+        self._load_script = client.register_script(LOAD_SCRIPT)
+        self._commit_script = client.register_script(COMMIT_SCRIPT)
+        self._release_script = client.register_script(RELEASE_SCRIPT)
+        self._free_script = client.register_script(FREE_SCRIPT)
+        self._peek_script = client.register_script(PEEK_SCRIPT)
+        self._ack_script = client.register_script(ACK_SCRIPT)
+
+    # Keys
+
+    @staticmethod
+    def _member(user_id: int, resource_type: str) -> str:
+        return f"{user_id}:{resource_type}"
+
+    @staticmethod
+    def _keys(user_id: int, resource_type: str) -> List[str]:
+        base = f"quota:{{{user_id}:{resource_type}}}"
+        return [base, f"{base}:expiry", f"{base}:amounts", f"{base}:settled", f"{base}:settled_expiry"]
+
+    def _redis_available(self) -> bool:
+        return self.redis is not None and time.monotonic() >= self._redis_retry_at
+
+    def _redis_failed(self, e: Exception):
+        logger.warning(f"Quota counters unavailable, using resource_quotas rows: {str(e)}")
+        self._redis_retry_at = time.monotonic() + 30
+        self.stats["database_fallbacks"] += 1
+
+    async def _reload_fallback_counters(self):
+        """Force counters the fallback changed to reload usage and open fallback reservations"""
+        members = list(self._fallback_counters)
+        pipe = self.redis.pipeline(transaction=False)
+        for member in members:
+            user_id, resource_type = member.split(":", 1)
+            pipe.hset(self._keys(int(user_id), resource_type)[0], "loaded_at", 0)
+        await pipe.execute()
+        self._fallback_counters.difference_update(members)
+
+    # Reservations
+
+    async def reserve(
+        self,
+        user_id: int,
+        resource_type: str,
+        amount: int = 1,
+        ttl: Optional[int] = None
+    ) -> Reservation:
+        """Hold `amount` units of quota until commit/release (or ttl seconds); raises QuotaExceededException"""
+        check_resource_type(resource_type)
+        if amount < 1:
+            raise ValidationException("amount must be at least 1", field="amount")
+        began = time.perf_counter()
+        try:
+            if self._redis_available():
+                try:
+                    if self._fallback_counters:
+                        await self._reload_fallback_counters()
+                    return await self._redis_reserve(user_id, resource_type, amount, ttl or self.reservation_ttl)
+                except QuotaExceededException:
+                    raise
+                except Exception as e:
+                    self._redis_failed(e)
+            return await self._database_reserve(user_id, resource_type, amount, ttl or self.reservation_ttl)
+        finally:
+            self.stats["reserve_seconds"] += time.perf_counter() - began
+
+    async def _redis_reserve(self, user_id: int, resource_type: str, amount: int, ttl: int) -> Reservation:
+        keys = self._keys(user_id, resource_type)
+        res_id = reservation_id("redis", user_id, resource_type, amount)
+        args = [res_id, amount, ttl, self.limit_ttl, self.state_ttl, self.tombstone_ttl]
+        status, used, reserved, limit = await self._reserve_script(keys=keys, args=args)
+        if status == -1:
+            await self._load(user_id, resource_type)
+            args[3] = -1
+            status, used, reserved, limit = await self._reserve_script(keys=keys, args=args)
+        if status == 0:
+            self.stats["rejected"] += 1
+            raise QuotaExceededException(resource_type, used + reserved + amount, limit, user_id)
+        if status != 1:
+            raise RuntimeError(f"Quota counter for {user_id}:{resource_type} did not load")
+        self.stats["reserved"] += 1
+        return Reservation(res_id, user_id, resource_type, amount, "redis", usage_dict(limit, used, reserved))
+
+    async def _load(self, user_id: int, resource_type: str):
+        """
+        (Re)load the limit, reconciled usage and open fallback reservations
+        from MySQL; no resource_quotas row means unlimited
+        """
+        # A burst of creates against a cold counter reads the row once
+        await self._loads.do(self._member(user_id, resource_type), lambda: self._load_once(user_id, resource_type))
+
+    async def _load_once(self, user_id: int, resource_type: str):
+        async with get_async_session() as session:
+            row = (await session.execute(
+                select(ResourceQuota.quota_limit, ResourceQuota.current_usage)
+                .where(ResourceQuota.user_id == user_id, ResourceQuota.resource_type == resource_type)
+            )).first()
+            held = await session.scalar(
+                select(func.coalesce(func.sum(QuotaReservation.amount), 0))
+                .where(
+                    QuotaReservation.user_id == user_id,
+                    QuotaReservation.resource_type == resource_type,
+                    QuotaReservation.expires_at > datetime.utcnow()
+                )
+            )
+        limit, used = (row.quota_limit, row.current_usage or 0) if row else (-1, 0)
+        await self._load_script(keys=self._keys(user_id, resource_type), args=[limit, used, held, self.state_ttl])
+        self.stats["limit_loads"] += 1
+
+    async def _database_reserve(self, user_id: int, resource_type: str, amount: int, ttl: int) -> Reservation:
+        """Fallback: record the reservation as a quota_reservations row under the resource_quotas row lock"""
+        res_id = reservation_id("database", user_id, resource_type, amount)
+        now = datetime.utcnow()
+        counter = (QuotaReservation.user_id == user_id, QuotaReservation.resource_type == resource_type)
+        async with get_async_session() as session:
+            quota = await session.scalar(
+                select(ResourceQuota)
+                .where(ResourceQuota.user_id == user_id, ResourceQuota.resource_type == resource_type)
+                .with_for_update()
+            )
+            if quota is None:
+                return Reservation(
+                    reservation_id("none", user_id, resource_type, amount), user_id, resource_type, amount,
+                    "none", usage_dict(-1, 0, 0)
+                )
+            self._fallback_counters.add(self._member(user_id, resource_type))
+            await session.execute(delete(QuotaReservation).where(*counter, QuotaReservation.expires_at <= now))
+            reserved = await session.scalar(
+                select(func.coalesce(func.sum(QuotaReservation.amount), 0)).where(*counter)
+            )
+            used = quota.current_usage or 0
+            granted = used + reserved + amount <= quota.quota_limit
+            if granted:
+                session.add(QuotaReservation(
+                    reservation_id=res_id, user_id=user_id, resource_type=resource_type, amount=amount,
+                    expires_at=now + timedelta(seconds=ttl)
+                ))
+        # Raised outside the session, which would wrap it in a DatabaseException
+        if not granted:
+            self.stats["rejected"] += 1
+            raise QuotaExceededException(resource_type, used + reserved + amount, quota.quota_limit, user_id)
+        self.stats["reserved"] += 1
+        return Reservation(
+            res_id, user_id, resource_type, amount, "database",
+            usage_dict(quota.quota_limit, used, reserved + amount)
+        )
+
+    async def _database_settle(self, res_id: str, user_id: int, resource_type: str, amount: int) -> Optional[int]:
+        """
+        Delete a fallback reservation and count `amount` of it as used; returns
+        the amount it held, or None (nothing counted) if it was already
+        committed, released, expired or never issued
+        """
+        async with get_async_session() as session:
+            reservation = await session.get(QuotaReservation, res_id, with_for_update=True)
+            if reservation is None:
+                return None
+            await session.delete(reservation)
+            self._fallback_counters.add(self._member(user_id, resource_type))
+            if amount:
+                quota = await session.scalar(
+                    select(ResourceQuota)
+                    .where(ResourceQuota.user_id == user_id, ResourceQuota.resource_type == resource_type)
+                    .with_for_update()
+                )
+                if quota is not None:
+                    quota.current_usage = (quota.current_usage or 0) + amount
+            return reservation.amount
+
+    async def commit(self, res_id: str, amount: Optional[int] = None) -> Dict[str, Any]:
+        """
+        The reserved resources were created: count `amount` of them (default:
+        all) as used and give back the rest of the reservation
+        """
+        backend, user_id, resource_type, reserved = parse_reservation_id(res_id)
+        amount = reserved if amount is None else amount
+        if not 0 <= amount <= reserved:
+            raise ValidationException(f"amount must be between 0 and {reserved}", field="amount")
+        result = {"reservation_id": res_id, "committed": amount, "status": "committed"}
+        if backend == "none":
+            return result
+        if backend == "database":
+            if await self._database_settle(res_id, user_id, resource_type, amount) is None:
+                self.stats["ignored_commits"] += 1
+                logger.warning(f"Reservation {res_id} is not outstanding; commit ignored")
+                return {**result, "committed": 0, "status": "not_outstanding"}
+            self.stats["committed"] += 1
+            return result
+
+        keys = self._keys(user_id, resource_type) + [DIRTY_KEY]
+        args = [res_id, amount, self._member(user_id, resource_type), self.state_ttl, self.tombstone_ttl]
+        try:
+            status, used, held, limit, counted = await self._commit_script(keys=keys, args=args)
+            if status == -1:
+                await self._load(user_id, resource_type)
+                status, used, held, limit, counted = await self._commit_script(keys=keys, args=args)
+        except Exception as e:
+            # The resources exist; count them in MySQL rather than lose them
+            self._redis_failed(e)
+            await self._database_adjust(user_id, resource_type, amount)
+            self.stats["committed"] += 1
+            return result
+        if status != 1:
+            # Repeated, expired, released or never issued: nothing more is counted
+            self.stats["ignored_commits"] += 1
+            logger.warning(f"Reservation {res_id} is {COMMIT_OUTCOMES[status]}; commit ignored")
+        else:
+            self.stats["committed"] += 1
+        return {**result, "committed": counted, "status": COMMIT_OUTCOMES[status], "usage": usage_dict(limit, used, held)}
+
+    async def release(self, res_id: str) -> Dict[str, Any]:
+        """The create failed: give the reservation back (expired/unknown ids are a no-op)"""
+        backend, user_id, resource_type, _ = parse_reservation_id(res_id)
+        released = 0
+        if backend == "database":
+            released = await self._database_settle(res_id, user_id, resource_type, 0) or 0
+        elif backend == "redis":
+            try:
+                released = await self._release_script(
+                    keys=self._keys(user_id, resource_type), args=[res_id, self.tombstone_ttl]
+                )
+            except Exception as e:
+                # Left alone, the reservation expires after its ttl
+                self._redis_failed(e)
+        if released:
+            self.stats["released"] += 1
+        return {"reservation_id": res_id, "released": released}
+
+    async def free(self, user_id: int, resource_type: str, amount: int = 1) -> Dict[str, Any]:
+        """Resources were deleted: lower committed usage"""
+        check_resource_type(resource_type)
+        if amount < 1:
+            raise ValidationException("amount must be at least 1", field="amount")
+        self.stats["freed"] += 1
+        if self._redis_available():
+            keys = self._keys(user_id, resource_type) + [DIRTY_KEY]
+            args = [amount, self._member(user_id, resource_type), self.state_ttl]
+            try:
+                used = await self._free_script(keys=keys, args=args)
+                if used == -1:
+                    await self._load(user_id, resource_type)
+                    used = await self._free_script(keys=keys, args=args)
+                return {"user_id": user_id, "resource_type": resource_type, "used": used}
+            except Exception as e:
+                self._redis_failed(e)
+        used = await self._database_adjust(user_id, resource_type, -amount)
+        return {"user_id": user_id, "resource_type": resource_type, "used": used}
+
+    async def _database_adjust(self, user_id: int, resource_type: str, delta: int) -> Optional[int]:
+        async with get_async_session() as session:
+            quota = await session.scalar(
+                select(ResourceQuota)
+                .where(ResourceQuota.user_id == user_id, ResourceQuota.resource_type == resource_type)
+                .with_for_update()
+            )
+            if quota is None:
+                return None
+            self._fallback_counters.add(self._member(user_id, resource_type))
+            quota.current_usage = max(0, (quota.current_usage or 0) + delta)
+            return quota.current_usage
+
+    async def usage(self, user_id: int) -> List[Dict[str, Any]]:
+        """Every quota of a user: limits from MySQL, live counts from Redis where loaded"""
+        async with get_async_session() as session:
+            rows = (await session.execute(
+                select(ResourceQuota.resource_type, ResourceQuota.quota_limit, ResourceQuota.current_usage)
+                .where(ResourceQuota.user_id == user_id)
+                .order_by(ResourceQuota.resource_type)
+            )).all()
+        result = []
+        for resource_type, limit, current_usage in rows:
+            live = []
+            if self._redis_available():
+                try:
+                    live = await self._peek_script(keys=self._keys(user_id, resource_type), args=[self.tombstone_ttl])
+                except Exception as e:
+                    self._redis_failed(e)
+            if live:
+                entry = {**usage_dict(limit, live[1], live[2]), "source": "redis"}
+            else:
+                entry = {**usage_dict(limit, current_usage or 0, 0), "source": "database"}
+            result.append({"resource_type": resource_type, **entry})
+        return result
+
+    # Reconciliation
+
+    async def start(self):
+        if self.enabled and self.redis is not None and self._task is None:
+            self._task = asyncio.create_task(self._run())
+            logger.info(f"Quota reconciler started (every {self.reconcile_interval}s)")
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await asyncio.to_thread(self.leader.release)
+        if self.redis is not None:
+            await self.redis.aclose()
+
+    async def _run(self):
+        while True:
+            try:
+                if await asyncio.to_thread(self.leader.acquire, self.reconcile_interval * 3):
+                    while await self.reconcile() >= self.reconcile_batch:
+                        pass
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.stats["reconcile_errors"] += 1
+                logger.error(f"Quota reconciliation failed: {str(e)}")
+            await asyncio.sleep(self.reconcile_interval * random.uniform(0.9, 1.1))
+
+    async def reconcile(self) -> int:
+        """
+        Write one batch of dirty counters to resource_quotas.current_usage;
+        returns how many were acknowledged (and so left the dirty set)
+        """
+        if not self._redis_available():
+            return 0
+        # Members stay in the set until acknowledged: a failed pass loses nothing
+        members = await self.redis.srandmember(DIRTY_KEY, self.reconcile_batch)
+        if not members:
+            return 0
+        counters = []
+        pipe = self.redis.pipeline(transaction=False)
+        for member in members:
+            user_id, resource_type = member.split(":", 1)
+            pipe.hmget(self._keys(int(user_id), resource_type)[0], "used", "base")
+            counters.append((int(user_id), resource_type, member))
+        states = await pipe.execute()
+
+        # Deltas rather than absolute values: usage the MySQL fallback counted meanwhile is kept
+        rows, acks = [], []
+        for (user_id, resource_type, member), (used, base) in zip(counters, states):
+            delta = int(used) - int(base) if used is not None and base is not None else 0
+            if delta:
+                rows.append({"b_user_id": user_id, "b_resource_type": resource_type, "b_delta": delta})
+            # A counter that expired from Redis has nothing to write; the ack just clears its mark
+            acks.append((user_id, resource_type, member, delta))
+        if rows:
+            table = ResourceQuota.__table__
+            current = func.coalesce(table.c.current_usage, 0) + bindparam("b_delta")
+            async with get_async_session() as session:
+                await session.execute(
+                    update(table)
+                    .where(table.c.user_id == bindparam("b_user_id"), table.c.resource_type == bindparam("b_resource_type"))
+                    .values(current_usage=case((current < 0, 0), else_=current)),
+                    rows
+                )
+
+        pipe = self.redis.pipeline(transaction=False)
+        for user_id, resource_type, member, delta in acks:
+            keys = [self._keys(user_id, resource_type)[0], DIRTY_KEY]
+            await self._ack_script(keys=keys, args=[delta, member], client=pipe)
+        acknowledged = sum(await pipe.execute())
+        self.stats["reconciled"] += len(rows)
+        self.stats["reconcile_passes"] += 1
+        return acknowledged
+
+    def get_stats(self) -> Dict[str, Any]:
+        reservations = self.stats["reserved"] + self.stats["rejected"]
+        return {
+            **{key: value for key, value in self.stats.items() if key != "reserve_seconds"},
+            "avg_reserve_us": round(self.stats["reserve_seconds"] / reservations * 1e6, 1) if reservations else None,
+            "backend": "redis" if self._redis_available() else "database",
+            "reconciler": self._task is not None and not self._task.done()
+        }
+
+# Global quota service instance
+quota_service = QuotaService()
@@ -0,0 +1,401 @@
+"""
+Data retention for the append-only tables
+
+Each table has a policy (keep N days, 0 = keep forever). Expired rows are
+deleted in small primary-key-ordered chunks, each its own short
+transaction, so InnoDB never holds locks on more than one chunk at a time.
+Between chunks the engine sleeps in proportion to how long the chunk took
+(RETENTION_DUTY_CYCLE) and, when replicas are configured, waits while any
+of them lags behind by more than RETENTION_MAX_REPLICA_LAG seconds.
+
+Tables listed in RETENTION_PARTITIONED_TABLES are expected to be RANGE
+partitioned by month with partitions named pYYYYMM plus a catch-all pmax
+(see mysql/init.sql). Whole expired months are dropped as partitions, the
+remainder is deleted in chunks, and the next months' partitions are split
+off pmax ahead of time.
+"""
+
+import asyncio
+import logging
+import os
+import random
+import re
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import create_engine, delete, func, select, text
+
+from models.database_models import AuditLog, Notification, ServerMetric, UsageRecord
+from services.database import db_manager, get_async_session, redis_manager
+from utils.leader_lock import LeaderLock
+
+logger = logging.getLogger(__name__)
+
+# table -> (model, timestamp column, default days to keep)
+# Audit and billing history are kept until RETENTION_<TABLE>_DAYS is set explicitly
+DEFAULT_POLICIES = {
+    "server_metrics": (ServerMetric, "recorded_at", 14),
+    "audit_logs": (AuditLog, "created_at", 0),
+    "notifications": (Notification, "created_at", 90),
+    "usage_records": (UsageRecord, "recorded_at", 0),
+}
+
+PARTITION_NAME = re.compile(r"^p(\d{4})(\d{2})$")
+
+@dataclass
+class RetentionPolicy:
+    table: str
+    model: Any
+    column: str
+    keep_days: int
+    partitioned: bool = False
+
+    @property
+    def enabled(self) -> bool:
+        return self.keep_days > 0
+
+def load_policies() -> Dict[str, RetentionPolicy]:
+    """Policies from RETENTION_<TABLE>_DAYS and RETENTION_PARTITIONED_TABLES"""
+    partitioned = {name.strip() for name in os.getenv("RETENTION_PARTITIONED_TABLES", "").split(",") if name.strip()}
+    return {
+        table: RetentionPolicy(
+            table=table,
+            model=model,
+            column=column,
+            keep_days=int(os.getenv(f"RETENTION_{table.upper()}_DAYS", str(days))),
+            partitioned=table in partitioned
+        )
+        for table, (model, column, days) in DEFAULT_POLICIES.items()
+    }
+
+@dataclass
+class TableProgress:
+    table: str
+    cutoff: datetime
+    dry_run: bool = False
+    status: str = "running"
+    deleted: int = 0
+    chunks: int = 0
+    partitions_dropped: List[str] = field(default_factory=list)
+    partitions_created: List[str] = field(default_factory=list)
+    last_id: Any = None
+    lag_wait_seconds: float = 0.0
+    started_at: float = field(default_factory=time.time)
+    finished_at: Optional[float] = None
+    error: Optional[str] = None
+
+    @property
+    def elapsed(self) -> float:
+        return (self.finished_at or time.time()) - self.started_at
+
+    def finish(self, status: str, error: Optional[str] = None):
+        self.status = status
+        self.error = error
+        self.finished_at = time.time()
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "table": self.table,
+            "cutoff": self.cutoff.isoformat(),
+            "dry_run": self.dry_run,
+            "status": self.status,
+            "deleted": self.deleted,
+            "chunks": self.chunks,
+            "rows_per_sec": round(self.deleted / self.elapsed, 1) if self.elapsed > 0 else None,
+            "partitions_dropped": self.partitions_dropped,
+            "partitions_created": self.partitions_created,
+            "last_id": self.last_id,
+            "lag_wait_seconds": round(self.lag_wait_seconds, 1),
+            "elapsed_seconds": round(self.elapsed, 1),
+            "started_at": datetime.utcfromtimestamp(self.started_at).isoformat(),
+            "finished_at": datetime.utcfromtimestamp(self.finished_at).isoformat() if self.finished_at else None,
+            "error": self.error
+        }
+
+class RetentionHalted(Exception):
+    """A purge stopped early (replica lag did not recover, or leadership was lost)"""
+
+    def __init__(self, status: str, message: str):
+        super().__init__(message)
+        self.status = status
+
+class RetentionEngine:
+    """Scheduled, throttled purging of expired rows"""
+
+    def __init__(self):
+        self.enabled = os.getenv("RETENTION_ENABLED", "false").lower() == "true"
+        self.interval = float(os.getenv("RETENTION_INTERVAL", "3600"))
+        self.policies = load_policies()
+        self.chunk_size = int(os.getenv("RETENTION_CHUNK_SIZE", "2000"))
+        self.min_sleep = float(os.getenv("RETENTION_CHUNK_SLEEP", "0.05"))
+        # Fraction of wall time spent deleting; 0.5 sleeps as long as each chunk took
+        self.duty_cycle = min(1.0, max(0.05, float(os.getenv("RETENTION_DUTY_CYCLE", "0.5"))))
+        self.max_replica_lag = float(os.getenv("RETENTION_MAX_REPLICA_LAG", "5"))
+        self.lag_check_chunks = int(os.getenv("RETENTION_LAG_CHECK_CHUNKS", "10"))
+        self.max_lag_wait = float(os.getenv("RETENTION_MAX_LAG_WAIT", "600"))
+        self.partitions_ahead = int(os.getenv("RETENTION_PARTITIONS_AHEAD", "3"))
+        self.replica_urls = [url.strip() for url in os.getenv("RETENTION_REPLICA_URLS", "").split(",") if url.strip()]
+        self._replica_engines = None
+        self.lock_ttl = 120
+        self.leader = LeaderLock("retention:leader", redis_manager)
+        self._task: Optional[asyncio.Task] = None
+        self._manual_task: Optional[asyncio.Task] = None
+        self._run_lock = asyncio.Lock()
+        self.progress: Dict[str, TableProgress] = {}
+        self.stats = {"runs": 0, "failed_runs": 0, "deleted": 0, "partitions_dropped": 0, "skipped_not_leader": 0}
+
+    # Lifecycle
+
+    async def start(self):
+        if self.enabled and self._task is None:
+            self._task = asyncio.create_task(self._run())
+            logger.info(f"Retention engine started (interval {self.interval}s)")
+
+    async def stop(self):
+        for task in (self._task, self._manual_task):
+            if task and not task.done():
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        self._task = self._manual_task = None
+        await asyncio.to_thread(self.leader.release)
+        if self._replica_engines:
+            for engine in self._replica_engines:
+                engine.dispose()
+            self._replica_engines = None
+
+    async def _run(self):
+        while True:
+            if await asyncio.to_thread(self.leader.acquire, self.lock_ttl):
+                try:
+                    await self.run_once()
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    logger.error(f"Retention run failed: {str(e)}")
+            else:
+                self.stats["skipped_not_leader"] += 1
+            await asyncio.sleep(self.interval * random.uniform(0.9, 1.1))
+
+    @property
+    def running(self) -> bool:
+        return self._run_lock.locked()
+
+    def trigger(self, tables: Optional[List[str]] = None, dry_run: bool = False) -> bool:
+        """Start a run in the background; False when one is already in progress"""
+        if self.running or (self._manual_task and not self._manual_task.done()):
+            return False
+        self._manual_task = asyncio.create_task(self.run_once(tables, dry_run))
+        return True
+
+    # Runs
+
+    async def run_once(self, tables: Optional[List[str]] = None, dry_run: bool = False) -> Dict[str, Dict[str, Any]]:
+        """Purge every enabled policy (or just `tables`), one table after another"""
+        async with self._run_lock:
+            results = {}
+            failed = False
+            for policy in self.policies.values():
+                if not policy.enabled or (tables and policy.table not in tables):
+                    continue
+                progress = TableProgress(
+                    table=policy.table,
+                    cutoff=datetime.utcnow() - timedelta(days=policy.keep_days),
+                    dry_run=dry_run
+                )
+                self.progress[policy.table] = progress
+                try:
+                    await self._purge(policy, progress)
+                    progress.finish("completed")
+                except asyncio.CancelledError:
+                    progress.finish("cancelled")
+                    raise
+                except RetentionHalted as e:
+                    progress.finish(e.status, str(e))
+                    logger.warning(f"Retention for {policy.table} halted: {str(e)}")
+                    if e.status == "lost_leadership":
+                        break
+                except Exception as e:
+                    failed = True
+                    progress.finish("failed", str(e))
+                    logger.error(f"Retention for {policy.table} failed: {str(e)}")
+                results[policy.table] = progress.to_dict()
+                if not dry_run:
+                    self.stats["deleted"] += progress.deleted
+                    self.stats["partitions_dropped"] += len(progress.partitions_dropped)
+                logger.info(
+                    f"Retention {policy.table}: {progress.status}, {progress.deleted} rows"
+                    f"{' (dry run)' if dry_run else ''} in {progress.elapsed:.1f}s"
+                )
+            self.stats["runs"] += 1
+            if failed:
+                self.stats["failed_runs"] += 1
+            return results
+
+    async def _purge(self, policy: RetentionPolicy, progress: TableProgress):
+        table = policy.model.__table__
+        pk = table.primary_key.columns[0]
+        column = table.c[policy.column]
+
+        if policy.partitioned:
+            if db_manager.engine.dialect.name == "mysql":
+                await self._maintain_partitions(policy, progress)
+            else:
+                logger.info(f"{policy.table}: partition drops need MySQL, deleting in chunks instead")
+
+        # Rows with larger keys are left alone even if they are old, so the walk never runs into fresh data
+        async with get_async_session() as session:
+            upper = await session.scalar(select(func.max(pk)).where(column < progress.cutoff))
+        if upper is None:
+            return
+
+        while True:
+            if progress.chunks % self.lag_check_chunks == 0:
+                await self._wait_for_replicas(progress)
+            if not await asyncio.to_thread(self.leader.acquire, self.lock_ttl):
+                raise RetentionHalted("lost_leadership", "another instance holds the retention lock")
+
+            started = time.perf_counter()
+            query = select(pk).where(column < progress.cutoff, pk <= upper).order_by(pk).limit(self.chunk_size)
+            if progress.last_id is not None:
+                query = query.where(pk > progress.last_id)
+            async with get_async_session() as session:
+                ids = (await session.scalars(query)).all()
+                if not ids:
+                    return
+                if not progress.dry_run:
+                    await session.execute(delete(table).where(pk.in_(ids)))
+
+            progress.last_id = ids[-1]
+            progress.deleted += len(ids)
+            progress.chunks += 1
+            if progress.chunks % 100 == 0:
+                logger.info(
+                    f"Retention {policy.table}: {progress.deleted} rows, "
+                    f"{progress.deleted / progress.elapsed:.0f} rows/s, at id {progress.last_id}"
+                )
+            took = time.perf_counter() - started
+            await asyncio.sleep(max(self.min_sleep, took * (1 - self.duty_cycle) / self.duty_cycle))
+
+    # Monthly partitions (MySQL)
+
+    async def _maintain_partitions(self, policy: RetentionPolicy, progress: TableProgress):
+        async with get_async_session() as session:
+            rows = (await session.execute(text(
+                "SELECT PARTITION_NAME, TABLE_ROWS FROM information_schema.PARTITIONS "
+                "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :table AND PARTITION_NAME IS NOT NULL "
+                "ORDER BY PARTITION_ORDINAL_POSITION"
+            ), {"table": policy.table})).all()
+        if not rows:
+            logger.warning(f"{policy.table} is configured as partitioned but has no partitions")
+            return
+
+        months = {}
+        for name, table_rows in rows:
+            match = PARTITION_NAME.match(name)
+            if match:
+                months[name] = (datetime(int(match.group(1)), int(match.group(2)), 1), table_rows or 0)
+
+        # A month partition holds rows before the first day of the next month
+        expired = [name for name, (month, _) in months.items() if _next_month(month) <= progress.cutoff]
+        if expired:
+            if progress.dry_run:
+                progress.deleted += sum(months[name][1] for name in expired)
+            else:
+                await self._alter(f"ALTER TABLE {policy.table} DROP PARTITION {', '.join(expired)}")
+            progress.partitions_dropped.extend(expired)
+
+        has_catch_all = any(name == "pmax" for name, _ in rows)
+        latest = max((month for month, _ in months.values()), default=None)
+        if not has_catch_all or progress.dry_run:
+            return
+        month = _next_month(latest) if latest else _month_start(datetime.utcnow())
+        horizon = _month_start(datetime.utcnow())
+        for _ in range(self.partitions_ahead):
+            horizon = _next_month(horizon)
+        new = []
+        while month <= horizon:
+            new.append((f"p{month:%Y%m}", _next_month(month)))
+            month = _next_month(month)
+        if new:
+            definitions = ", ".join(
+                f"PARTITION {name} VALUES LESS THAN (UNIX_TIMESTAMP('{bound:%Y-%m-%d}'))" for name, bound in new
+            )
+            await self._alter(
+                f"ALTER TABLE {policy.table} REORGANIZE PARTITION pmax INTO "
+                f"({definitions}, PARTITION pmax VALUES LESS THAN MAXVALUE)"
+            )
+            progress.partitions_created.extend(name for name, _ in new)
+
+    async def _alter(self, statement: str):
+        logger.info(f"Retention: {statement}")
+        async with get_async_session() as session:
+            await session.execute(text(statement))
+
+    # Replica lag
+
+    def _replica_lag(self) -> Optional[float]:
+        """Worst Seconds_Behind_Source over the configured replicas (inf when replication is stopped)"""
+        if self._replica_engines is None:
+            self._replica_engines = [create_engine(url, pool_size=1, max_overflow=0, pool_pre_ping=True) for url in self.replica_urls]
+        worst = None
+        for engine in self._replica_engines:
+            with engine.connect() as connection:
+                try:
+                    status = connection.execute(text("SHOW REPLICA STATUS")).mappings().first()
+                except Exception:
+                    # MySQL before 8.0.22
+                    status = connection.execute(text("SHOW SLAVE STATUS")).mappings().first()
+            if status is None:
+                continue
+            lag = status.get("Seconds_Behind_Source", status.get("Seconds_Behind_Master"))
+            lag = float("inf") if lag is None else float(lag)
+            worst = lag if worst is None else max(worst, lag)
+        return worst
+
+    async def _wait_for_replicas(self, progress: TableProgress):
+        if not self.replica_urls:
+            return
+        waited_since = None
+        while True:
+            try:
+                lag = await asyncio.to_thread(self._replica_lag)
+            except Exception as e:
+                logger.warning(f"Replica lag check failed: {str(e)}")
+                lag = float("inf")
+            if lag is None or lag <= self.max_replica_lag:
+                if waited_since is not None:
+                    progress.status = "running"
+                return
+            now = time.monotonic()
+            waited_since = waited_since or now
+            if now - waited_since > self.max_lag_wait:
+                raise RetentionHalted("paused_replica_lag", f"replica lag {lag}s for over {self.max_lag_wait:.0f}s")
+            progress.status = "waiting_for_replica"
+            await asyncio.sleep(min(5.0, self.max_lag_wait))
+            progress.lag_wait_seconds += time.monotonic() - now
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            "enabled": self.enabled,
+            "running": self.running,
+            "policies": {
+                table: {"keep_days": policy.keep_days, "partitioned": policy.partitioned}
+                for table, policy in self.policies.items()
+            },
+            "tables": {table: progress.to_dict() for table, progress in self.progress.items()}
+        }
+
+def _month_start(moment: datetime) -> datetime:
+    return datetime(moment.year, moment.month, 1)
+
+def _next_month(month: datetime) -> datetime:
+    return datetime(month.year + month.month // 12, month.month % 12 + 1, 1)
+
+# Global retention engine instance
+retention = RetentionEngine()
@@ -0,0 +1,117 @@
+"""
+Hetzner server metrics (CPU, disk, network) with a per-window cache
+
+Requested ranges are aligned to METRICS_CACHE_WINDOW seconds, so dashboards
+polling the same range share one upstream call and one cache entry per
+window. Raw series are cached parsed into parallel timestamp/value lists and
+downsampled per request.
+"""
+
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from services.catalog_cache import CatalogCache
+from services.database import stable_cache_key
+from services.hetzner_client import HetznerClient
+from utils.downsampling import downsample
+from utils.exceptions import ValidationException
+
+METRIC_TYPES = ("cpu", "disk", "network")
+
+def align_window(start: datetime, end: datetime, window: int) -> Tuple[datetime, datetime]:
+    """Floor start and ceil end to multiples of `window` seconds (UTC)"""
+    start_ts = int(start.timestamp()) // window * window
+    end_ts = -(-int(end.timestamp()) // window) * window
+    return datetime.fromtimestamp(start_ts, timezone.utc), datetime.fromtimestamp(end_ts, timezone.utc)
+
+def _as_utc(value: datetime) -> datetime:
+    # Naive timestamps from query strings are taken as UTC
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value
+
+def parse_time_series(time_series: Dict[str, Any]) -> Dict[str, Dict[str, List[float]]]:
+    """Hetzner [[unix_ts, "value"], ...] pairs -> {"timestamps": [...], "values": [...]} (NaN for gaps)"""
+    parsed = {}
+    for name, series in time_series.items():
+        pairs = series.get("values") or []
+        if not pairs:
+            parsed[name] = {"timestamps": [], "values": []}
+            continue
+        array = np.array(pairs, dtype=object)
+        values = array[:, 1].astype(np.float64)
+        # JSON has no NaN; gaps become null (and NaN again when downsampled)
+        parsed[name] = {
+            "timestamps": array[:, 0].astype(np.float64).tolist(),
+            "values": np.where(np.isnan(values), None, values).tolist()
+        }
+    return parsed
+
+class ServerMetricsService:
+    """Fetch, cache and downsample server metrics"""
+
+    def __init__(self, window: Optional[int] = None):
+        self.window = window or int(os.getenv("METRICS_CACHE_WINDOW", "60"))
+        # A window's data is final once the window is over; the open window is refetched after `window` seconds
+        self.cache = CatalogCache(ttl=self.window, stale_ttl=0, namespace="metrics")
+
+    async def get_raw(
+        self,
+        client: HetznerClient,
+        server_id: int,
+        types: List[str],
+        start: datetime,
+        end: datetime,
+        step: Optional[int] = None
+    ) -> Dict[str, Any]:
+        start, end = align_window(start, end, self.window)
+        types = sorted(set(types))
+        key = stable_cache_key("server_metrics", server_id, types, start.isoformat(), end.isoformat(), step)
+
+        async def load() -> Dict[str, Any]:
+            response = await client.get_server_metrics(server_id, types, start.isoformat(), end.isoformat(), step)
+            metrics = response.get("metrics", {})
+            return {
+                "start": metrics.get("start", start.isoformat()),
+                "end": metrics.get("end", end.isoformat()),
+                "step": metrics.get("step", step),
+                "time_series": parse_time_series(metrics.get("time_series", {}))
+            }
+
+        return await self.cache.get_or_load(key, load)
+
+    async def get_metrics(
+        self,
+        client: HetznerClient,
+        server_id: int,
+        types: List[str],
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        step: Optional[int] = None,
+        points: int = 500,
+        method: str = "lttb"
+    ) -> Dict[str, Any]:
+        """Series downsampled to at most `points` points each"""
+        end = _as_utc(end) if end else datetime.now(timezone.utc)
+        start = _as_utc(start) if start else end - timedelta(hours=1)
+        if start >= end:
+            raise ValidationException("start must be before end", field="start", value=start.isoformat())
+        raw = await self.get_raw(client, server_id, types, start, end, step)
+        series = {}
+        raw_points = {}
+        for name, data in raw["time_series"].items():
+            series[name] = downsample(data["timestamps"], data["values"], points, method)
+            raw_points[name] = len(data["timestamps"])
+        return {
+            "server_id": server_id,
+            "start": raw["start"],
+            "end": raw["end"],
+            "step": raw["step"],
+            "method": method,
+            "series": series,
+            "raw_points": raw_points
+        }
+
+# Global metrics service instance
+server_metrics = ServerMetricsService()
@@ -0,0 +1,363 @@
+"""
+Background mirror of Hetzner servers into the servers table
+
+Each pass streams every server page from Hetzner, compares each server
+against a fingerprint of its mirrored row, and writes only the differences
+in batches: inserts for new servers, updates for changed ones, and soft
+deletes for servers that disappeared. Fingerprints are kept in memory
+between passes, so unchanged servers cost no database work.
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import random
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import insert, select, update
+from sqlalchemy.exc import IntegrityError
+
+from models.database_models import Server
+from services.database import get_async_session, redis_manager
+from services.hetzner_client import HetznerClient, get_http_client
+from utils.leader_lock import LeaderLock
+
+logger = logging.getLogger(__name__)
+
+# Columns owned by the sync worker; anything else on the row is left alone
+SYNCED_COLUMNS = (
+    "name", "status", "server_type", "datacenter", "ipv4_address",
+    "ipv6_address", "labels", "backup_enabled", "locked"
+)
+
+# servers.status is an ENUM (mysql/init.sql); Hetzner statuses it lacks map onto the nearest value
+STATUS_TO_MIRROR = {"off": "stopped", "deleting": "stopping"}
+MIRROR_STATUSES = {
+    "initializing", "starting", "running", "stopping", "stopped", "rebooting", "rebuilding", "migrating", "unknown"
+}
+STATUS_FROM_MIRROR = {"stopped": "off"}
+
+# Written by whichever instance ran the last pass, so every worker can judge freshness
+SYNCED_AT_KEY = "server_sync:last_synced_at"
+
+def mirror_status(status: Optional[str]) -> str:
+    status = STATUS_TO_MIRROR.get(status, status)
+    return status if status in MIRROR_STATUSES else "unknown"
+
+def map_server(server: Dict[str, Any]) -> Dict[str, Any]:
+    """Hetzner server object -> servers table columns"""
+    public_net = server.get("public_net") or {}
+    ipv4 = (public_net.get("ipv4") or {}).get("ip")
+    ipv6 = (public_net.get("ipv6") or {}).get("ip")
+    return {
+        "name": server["name"],
+        "status": mirror_status(server.get("status")),
+        "server_type": (server.get("server_type") or {}).get("name"),
+        "datacenter": (server.get("datacenter") or {}).get("name"),
+        "ipv4_address": ipv4,
+        "ipv6_address": ipv6.split("/")[0] if ipv6 else None,
+        "labels": server.get("labels") or {},
+        "backup_enabled": bool(server.get("backup_window")),
+        "locked": bool(server.get("locked"))
+    }
+
+def parse_created(value: Optional[str]) -> Optional[datetime]:
+    """Hetzner ISO-8601 timestamp -> naive UTC datetime for the DateTime columns"""
+    try:
+        return datetime.fromisoformat(value).astimezone(timezone.utc).replace(tzinfo=None)
+    except (TypeError, ValueError):
+        return None
+
+BOOLEAN_COLUMNS = ("backup_enabled", "locked")
+
+def fingerprint(values: Dict[str, Any]) -> str:
+    """Stable digest of the synced columns (MySQL returns booleans as 0/1, so normalise them)"""
+    normalized = [
+        bool(values.get(column)) if column in BOOLEAN_COLUMNS else values.get(column) or None
+        for column in SYNCED_COLUMNS
+    ]
+    payload = json.dumps(normalized, sort_keys=True, default=str)
+    return hashlib.sha1(payload.encode()).hexdigest()
+
+def mirror_to_hetzner(row: Server) -> Dict[str, Any]:
+    """Mirrored row -> the subset of the Hetzner server shape the API returns"""
+    return {
+        "id": row.hetzner_id,
+        "name": row.name,
+        "status": STATUS_FROM_MIRROR.get(row.status, row.status),
+        "created": row.created_at.isoformat() if row.created_at else None,
+        "public_net": {
+            "ipv4": {"ip": row.ipv4_address},
+            "ipv6": {"ip": row.ipv6_address}
+        },
+        "server_type": {"name": row.server_type},
+        "datacenter": {"name": row.datacenter},
+        "labels": row.labels or {},
+        "backup_enabled": row.backup_enabled,
+        "locked": row.locked
+    }
+
+class ServerSyncWorker:
+    """Polls Hetzner and applies the diff to the servers table"""
+
+    def __init__(self):
+        self.enabled = os.getenv("SERVER_SYNC_ENABLED", "false").lower() == "true"
+        self.interval = float(os.getenv("SERVER_SYNC_INTERVAL", "30"))
+        self.batch_size = int(os.getenv("SERVER_SYNC_BATCH_SIZE", "500"))
+        self.full_reload_every = int(os.getenv("SERVER_SYNC_FULL_RELOAD_EVERY", "20"))
+        self.max_staleness = float(os.getenv("SERVER_SYNC_MAX_STALENESS", str(self.interval * 3)))
+        self.default_user_id = int(os.getenv("SERVER_SYNC_DEFAULT_USER_ID", "1"))
+        # Label on the Hetzner server that names the owning user
+        self.owner_label = os.getenv("SERVER_SYNC_OWNER_LABEL", "user_id")
+        self.leader = LeaderLock("server_sync:leader", redis_manager)
+
+        # hetzner_id -> (servers.id, fingerprint); None until loaded from the database
+        self._known: Optional[Dict[int, Tuple[int, str]]] = None
+        self._task: Optional[asyncio.Task] = None
+        self._wake = asyncio.Event()
+        self._pass_lock = asyncio.Lock()
+        self.last_synced_at: Optional[float] = None
+        self.last_error: Optional[str] = None
+        self.stats = {
+            "passes": 0, "skipped_not_leader": 0, "failed_passes": 0,
+            "inserted": 0, "updated": 0, "deleted": 0, "unchanged": 0,
+            "last_duration_ms": 0.0
+        }
+
+    # Lifecycle
+
+    async def start(self):
+        if self.enabled and self._task is None:
+            self._task = asyncio.create_task(self._run())
+            logger.info(f"Server sync worker started (interval {self.interval}s)")
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+            await asyncio.to_thread(self.leader.release)
+
+    def wake(self):
+        """Run the next pass now (e.g. after a create or delete through this API)"""
+        self._wake.set()
+
+    async def _run(self):
+        while True:
+            # One worker per deployment runs passes; without Redis every worker does
+            if await asyncio.to_thread(self.leader.acquire, self.interval * 2):
+                try:
+                    await self.sync_once()
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    logger.error(f"Server sync pass failed: {str(e)}")
+            else:
+                self.stats["skipped_not_leader"] += 1
+
+            # Jitter keeps replicas from polling in lockstep
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.interval * random.uniform(0.9, 1.1))
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+
+    # Sync pass
+
+    async def sync_once(self) -> Dict[str, int]:
+        """Run one full diff-and-apply pass"""
+        async with self._pass_lock:
+            start = time.perf_counter()
+            try:
+                result = await self._sync()
+            except Exception as e:
+                self.stats["failed_passes"] += 1
+                self.last_error = str(e)
+                # Our view of the table may be out of date after a partial write
+                self._known = None
+                raise
+            self.stats["passes"] += 1
+            self.stats["last_duration_ms"] = round((time.perf_counter() - start) * 1000, 1)
+            for key, value in result.items():
+                self.stats[key] += value
+            self.last_synced_at = time.time()
+            self.last_error = None
+            await asyncio.to_thread(
+                redis_manager.set, SYNCED_AT_KEY, self.last_synced_at, int(self.max_staleness) + 60
+            )
+            if any(result[key] for key in ("inserted", "updated", "deleted")):
+                logger.info(f"Server sync applied {result}")
+            return result
+
+    async def _sync(self) -> Dict[str, int]:
+        if self._known is None or self.stats["passes"] % self.full_reload_every == 0:
+            self._known = await self._load_known()
+        known = self._known
+
+        inserts: List[Dict[str, Any]] = []
+        updates: List[Dict[str, Any]] = []
+        seen = set()
+        result = {"inserted": 0, "updated": 0, "deleted": 0, "unchanged": 0}
+
+        client = HetznerClient(get_http_client())
+        async for server in client.iter_items("/servers", "servers"):
+            hetzner_id = server["id"]
+            seen.add(hetzner_id)
+            values = map_server(server)
+            current = known.get(hetzner_id)
+            if current is None:
+                inserts.append(self._new_row(server, values))
+            elif current[1] != fingerprint(values):
+                updates.append({**values, "id": current[0], "hetzner_id": hetzner_id, "deleted_at": None})
+            else:
+                result["unchanged"] += 1
+
+            if len(inserts) >= self.batch_size:
+                result["inserted"] += await self._apply_inserts(inserts)
+                inserts = []
+            if len(updates) >= self.batch_size:
+                result["updated"] += await self._apply_updates(updates)
+                updates = []
+
+        if inserts:
+            result["inserted"] += await self._apply_inserts(inserts)
+        if updates:
+            result["updated"] += await self._apply_updates(updates)
+
+        # Only a complete listing proves a server is gone
+        gone = [hetzner_id for hetzner_id, (_, fp) in known.items() if hetzner_id not in seen and fp != "deleted"]
+        for i in range(0, len(gone), self.batch_size):
+            result["deleted"] += await self._apply_deletes(gone[i:i + self.batch_size])
+        return result
+
+    def _new_row(self, server: Dict[str, Any], values: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        return {
+            **(values or map_server(server)),
+            "hetzner_id": server["id"],
+            "user_id": self._owner(server),
+            "created_at": parse_created(server.get("created")) or datetime.utcnow()
+        }
+
+    def _owner(self, server: Dict[str, Any]) -> int:
+        try:
+            return int((server.get("labels") or {})[self.owner_label])
+        except (KeyError, TypeError, ValueError):
+            return self.default_user_id
+
+    async def _load_known(self) -> Dict[int, Tuple[int, str]]:
+        columns = [getattr(Server, column) for column in SYNCED_COLUMNS]
+        known = {}
+        async with get_async_session() as session:
+            result = await session.stream(
+                select(Server.id, Server.hetzner_id, Server.deleted_at, *columns)
+                .where(Server.hetzner_id.isnot(None))
+                .execution_options(yield_per=self.batch_size)
+            )
+            async for row in result:
+                values = row._mapping
+                known[row.hetzner_id] = (
+                    row.id,
+                    "deleted" if row.deleted_at else fingerprint(values)
+                )
+        return known
+
+    async def _apply_inserts(self, rows: List[Dict[str, Any]]) -> int:
+        async with get_async_session() as session:
+            await session.execute(insert(Server), rows)
+            result = await session.execute(
+                select(Server.id, Server.hetzner_id).where(Server.hetzner_id.in_([row["hetzner_id"] for row in rows]))
+            )
+            ids = dict((hetzner_id, server_id) for server_id, hetzner_id in result.all())
+        for row in rows:
+            self._known[row["hetzner_id"]] = (ids[row["hetzner_id"]], fingerprint(row))
+        return len(rows)
+
+    async def _apply_updates(self, rows: List[Dict[str, Any]]) -> int:
+        # ORM bulk UPDATE by primary key: one executemany per batch
+        async with get_async_session() as session:
+            await session.execute(update(Server), rows)
+        for row in rows:
+            self._known[row["hetzner_id"]] = (row["id"], fingerprint(row))
+        return len(rows)
+
+    async def _apply_deletes(self, hetzner_ids: List[int]) -> int:
+        async with get_async_session() as session:
+            await session.execute(
+                update(Server)
+                .where(Server.hetzner_id.in_(hetzner_ids))
+                .values(deleted_at=datetime.utcnow())
+                .execution_options(synchronize_session=False)
+            )
+        for hetzner_id in hetzner_ids:
+            self._known[hetzner_id] = (self._known[hetzner_id][0], "deleted")
+        return len(hetzner_ids)
+
+    async def local_id(self, hetzner_id: int) -> Optional[int]:
+        """servers.id of a mirrored Hetzner server, if it has a row"""
+        if self._known and hetzner_id in self._known:
+            return self._known[hetzner_id][0]
+        async with get_async_session() as session:
+            return await session.scalar(select(Server.id).where(Server.hetzner_id == hetzner_id))
+
+    async def ensure_mirrored(self, server: Dict[str, Any]) -> int:
+        """Local servers.id for a Hetzner server, inserting its mirror row if the sync has not yet"""
+        hetzner_id = server["id"]
+        server_id = await self.local_id(hetzner_id)
+        if server_id is not None:
+            return server_id
+        
+        row = self._new_row(server)
+        try:
+            async with get_async_session() as session:
+                server_id = (await session.execute(insert(Server).values(**row))).inserted_primary_key[0]
+        except Exception as e:
+            # A concurrent sync pass inserted it first
+            if not isinstance(e, IntegrityError) and not isinstance(e.__context__, IntegrityError):
+                raise
+            async with get_async_session() as session:
+                server_id = await session.scalar(select(Server.id).where(Server.hetzner_id == hetzner_id))
+        if self._known is not None:
+            self._known[hetzner_id] = (server_id, fingerprint(row))
+        return server_id
+
+    # Reads
+
+    async def synced_at(self) -> Optional[float]:
+        """Time of the last completed pass on any instance (only the leader syncs)"""
+        shared = await asyncio.to_thread(redis_manager.get, SYNCED_AT_KEY)
+        candidates = [value for value in (self.last_synced_at, shared) if value is not None]
+        return max(candidates) if candidates else None
+
+    def is_fresh(self, synced_at: Optional[float]) -> bool:
+        return synced_at is not None and time.time() - synced_at <= self.max_staleness
+
+    async def list_servers(self) -> List[Dict[str, Any]]:
+        """Mirrored servers in the Hetzner response shape"""
+        async with get_async_session() as session:
+            result = await session.scalars(
+                select(Server)
+                .where(Server.hetzner_id.isnot(None), Server.deleted_at.is_(None))
+                .order_by(Server.hetzner_id)
+            )
+            return [mirror_to_hetzner(row) for row in result]
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            "enabled": self.enabled,
+            "running": self._task is not None and not self._task.done(),
+            "mirrored": len(self._known) if self._known is not None else None,
+            "last_synced_at": datetime.utcfromtimestamp(self.last_synced_at).isoformat() if self.last_synced_at else None,
+            "fresh": self.is_fresh(self.last_synced_at),
+            "last_error": self.last_error
+        }
+
+# Global worker instance
+server_sync = ServerSyncWorker()
@@ -0,0 +1,420 @@
+"""
+Usage metering: server state history -> hourly UsageRecord rows
+
+A background job snapshots every server's billable state (status,
+server_type, datacenter, monthly_cost) and appends a server_state_changes
+row whenever it differs from the last one recorded. Metering turns that
+history into one "server_hour" usage record per server per started hour in
+which the server was in a billed state, priced per (server_type, location).
+
+Metering a period is vectorized: state segments are expanded to
+(server, hour) pairs with NumPy, prices are looked up for the distinct
+(type, location) pairs only, and records are written with multi-row
+INSERTs. Each day of the period is replaced in one transaction (delete the
+day's server_hour records, insert the recomputed ones), so re-running a
+period never double-bills.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import random
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import delete, func, insert, or_, select, update
+
+from models.database_models import Server, ServerStateChange, UsageMeteringRun, UsageRecord
+from services.database import get_async_session, redis_manager
+from utils.exceptions import ValidationException
+from utils.leader_lock import LeaderLock
+
+logger = logging.getLogger(__name__)
+
+HOUR = 3600
+USAGE_TYPE = "server_hour"
+
+def naive_utc(value: datetime) -> datetime:
+    return value.astimezone(timezone.utc).replace(tzinfo=None) if value.tzinfo else value
+
+def hour_floor(moment: datetime) -> datetime:
+    return moment.replace(minute=0, second=0, microsecond=0)
+
+def to_epoch(values) -> np.ndarray:
+    return np.array(values, dtype="datetime64[s]").astype(np.int64)
+
+def location_of(datacenter: Optional[str]) -> Optional[str]:
+    """fsn1-dc14 -> fsn1"""
+    return datacenter.split("-")[0] if datacenter else None
+
+class PriceTable:
+    """
+    Hourly prices keyed by (server_type, location); a (server_type, None)
+    entry is the fallback for any location
+    """
+
+    def __init__(self, prices: Dict[Tuple[str, Optional[str]], float]):
+        self.prices = prices
+
+    @classmethod
+    def from_env(cls) -> "PriceTable":
+        """METERING_HOURLY_PRICES='{"cx11": 0.0063, "cx21@fsn1": 0.0095}'"""
+        raw = json.loads(os.getenv("METERING_HOURLY_PRICES", "{}") or "{}")
+        prices = {}
+        for name, price in raw.items():
+            server_type, _, location = name.partition("@")
+            prices[(server_type, location or None)] = float(price)
+        return cls(prices)
+
+    def price(self, server_type: str, location: Optional[str]) -> float:
+        found = self.prices.get((server_type, location))
+        if found is None:
+            found = self.prices.get((server_type, None))
+        return np.nan if found is None else found
+
+    def hourly(self, server_types: np.ndarray, locations: np.ndarray) -> np.ndarray:
+        """Vectorized lookup: one dict probe per distinct pair, then a gather (NaN when unpriced)"""
+        if len(server_types) == 0:
+            return np.empty(0)
+        type_names, type_codes = np.unique(server_types.astype(str), return_inverse=True)
+        location_names, location_codes = np.unique(locations.astype(str), return_inverse=True)
+        matrix = np.array([
+            [self.price(server_type, None if location == "None" else location) for location in location_names]
+            for server_type in type_names
+        ], dtype=np.float64)
+        return matrix[type_codes, location_codes]
+
+def expand_hours(seg_start: np.ndarray, seg_end: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Segments [start, end) in epoch seconds -> (segment index, hour start) for
+    every hour each segment touches (billing per started hour)
+    """
+    first = seg_start // HOUR
+    last = -(-seg_end // HOUR)  # ceil
+    lengths = np.maximum(last - first, 0)
+    segment = np.repeat(np.arange(len(lengths)), lengths)
+    offsets = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    return segment, (first[segment] + offsets) * HOUR
+
+class UsageMeteringEngine:
+    """State snapshots, scheduled hourly metering and manual re-runs"""
+
+    def __init__(self):
+        self.enabled = os.getenv("METERING_ENABLED", "true").lower() == "true"
+        self.snapshot_interval = float(os.getenv("METERING_SNAPSHOT_INTERVAL", "60"))
+        # Hours are metered this long after they end, so the last snapshots are in
+        self.grace = int(os.getenv("METERING_GRACE_SECONDS", "300"))
+        self.batch_size = int(os.getenv("METERING_BATCH_SIZE", "5000"))
+        self.unbilled_statuses = {
+            status.strip() for status in os.getenv("METERING_UNBILLED_STATUSES", "deleted").split(",") if status.strip()
+        }
+        self.hours_per_month = float(os.getenv("METERING_HOURS_PER_MONTH", "730"))
+        self.max_period_days = int(os.getenv("METERING_MAX_PERIOD_DAYS", "93"))
+        self.price_source: Callable[[], Awaitable[PriceTable]] = self._env_prices
+        self.leader = LeaderLock("usage_metering:leader", redis_manager)
+        self._task: Optional[asyncio.Task] = None
+        self._manual_task: Optional[asyncio.Task] = None
+        self._meter_lock = asyncio.Lock()
+        self._last_snapshot: Optional[datetime] = None
+        self.last_run: Optional[Dict[str, Any]] = None
+        self.stats = {
+            "snapshots": 0, "changes_recorded": 0, "runs": 0, "failed_runs": 0,
+            "records_written": 0, "unpriced_hours": 0, "skipped_not_leader": 0
+        }
+
+    async def _env_prices(self) -> PriceTable:
+        return PriceTable.from_env()
+
+    # Lifecycle
+
+    async def start(self):
+        if self.enabled and self._task is None:
+            self._task = asyncio.create_task(self._run())
+            logger.info(f"Usage metering started (snapshot every {self.snapshot_interval}s)")
+
+    async def stop(self):
+        for task in (self._task, self._manual_task):
+            if task and not task.done():
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        self._task = self._manual_task = None
+        await asyncio.to_thread(self.leader.release)
+
+    async def _run(self):
+        while True:
+            if await asyncio.to_thread(self.leader.acquire, self.snapshot_interval * 2):
+                try:
+                    await self.snapshot()
+                    await self.meter_pending()
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    logger.error(f"Usage metering pass failed: {str(e)}")
+            else:
+                self.stats["skipped_not_leader"] += 1
+            await asyncio.sleep(self.snapshot_interval * random.uniform(0.9, 1.1))
+
+    # Snapshots
+
+    async def snapshot(self, now: Optional[datetime] = None) -> int:
+        """Record a state change for every server whose billable state differs from its last recorded one"""
+        now = now or datetime.utcnow()
+        latest = (
+            select(func.max(ServerStateChange.id))
+            .group_by(ServerStateChange.server_id)
+            .scalar_subquery()
+        )
+        servers = select(
+            Server.id, Server.status, Server.server_type, Server.datacenter,
+            Server.monthly_cost, Server.created_at, Server.deleted_at
+        )
+        if self._last_snapshot is not None:
+            # Servers deleted before the previous snapshot were recorded then
+            since = self._last_snapshot - timedelta(seconds=self.snapshot_interval)
+            servers = servers.where(or_(Server.deleted_at.is_(None), Server.deleted_at >= since))
+        async with get_async_session() as session:
+            last = {
+                row.server_id: (row.status, row.server_type, row.datacenter, row.monthly_cost)
+                for row in (await session.execute(
+                    select(
+                        ServerStateChange.server_id, ServerStateChange.status, ServerStateChange.server_type,
+                        ServerStateChange.datacenter, ServerStateChange.monthly_cost
+                    ).where(ServerStateChange.id.in_(latest))
+                )).all()
+            }
+            # History starts with the first snapshot; nothing is billed from before it
+            history_start = await session.scalar(select(func.min(ServerStateChange.changed_at))) or now
+            rows = (await session.execute(servers)).all()
+
+        changes = []
+        for row in rows:
+            deleted = row.deleted_at is not None
+            state = ("deleted" if deleted else row.status or "unknown", row.server_type, row.datacenter, row.monthly_cost)
+            previous = last.get(row.id)
+            if previous == state:
+                continue
+            if deleted:
+                changed_at = row.deleted_at
+            elif previous is None:
+                # First sighting: in this state since it was created (or since history began)
+                changed_at = max(row.created_at or now, history_start)
+            else:
+                changed_at = now
+            changes.append(self._change(row.id, state, changed_at))
+
+        if changes:
+            async with get_async_session() as session:
+                for offset in range(0, len(changes), self.batch_size):
+                    await session.execute(insert(ServerStateChange.__table__), changes[offset:offset + self.batch_size])
+        self._last_snapshot = now
+        self.stats["snapshots"] += 1
+        self.stats["changes_recorded"] += len(changes)
+        return len(changes)
+
+    @staticmethod
+    def _change(server_id: int, state: tuple, changed_at: datetime) -> Dict[str, Any]:
+        status, server_type, datacenter, monthly_cost = state
+        return {
+            "server_id": server_id, "status": status, "server_type": server_type,
+            "datacenter": datacenter, "monthly_cost": monthly_cost, "changed_at": changed_at
+        }
+
+    # Metering
+
+    async def watermark(self) -> Optional[datetime]:
+        """End of the last completed period, else the hour of the first recorded state"""
+        async with get_async_session() as session:
+            end = await session.scalar(
+                select(func.max(UsageMeteringRun.period_end)).where(UsageMeteringRun.status == "completed")
+            )
+            if end is None:
+                first = await session.scalar(select(func.min(ServerStateChange.changed_at)))
+                return hour_floor(first) if first else None
+        return end
+
+    async def meter_pending(self, now: Optional[datetime] = None) -> Optional[Dict[str, Any]]:
+        """Meter every complete hour since the watermark"""
+        end = hour_floor((now or datetime.utcnow()) - timedelta(seconds=self.grace))
+        start = await self.watermark()
+        if start is None or start >= end:
+            return None
+        # Catch up a long backlog one maximal period per pass
+        return await self.meter(start, min(end, start + timedelta(days=self.max_period_days)))
+
+    def trigger(self, start: datetime, end: datetime) -> bool:
+        """Re-meter a period in the background; False while another run is in progress"""
+        self._validate_period(start, end)
+        if self._meter_lock.locked() or (self._manual_task and not self._manual_task.done()):
+            return False
+        self._manual_task = asyncio.create_task(self.meter(start, end))
+        return True
+
+    def _validate_period(self, start: datetime, end: datetime):
+        if start != hour_floor(start) or end != hour_floor(end):
+            raise ValidationException("Metering periods start and end on whole hours", field="start")
+        if start >= end:
+            raise ValidationException("start must be before end", field="start")
+        if end - start > timedelta(days=self.max_period_days):
+            raise ValidationException(f"Metering periods are limited to {self.max_period_days} days", field="end")
+
+    async def meter(self, start: datetime, end: datetime) -> Dict[str, Any]:
+        """(Re)compute server_hour usage for [start, end), one day per transaction"""
+        self._validate_period(start, end)
+        async with self._meter_lock:
+            began = time.perf_counter()
+            async with get_async_session() as session:
+                run = UsageMeteringRun(period_start=start, period_end=end, status="running", started_at=datetime.utcnow())
+                session.add(run)
+                await session.flush()
+                run_id = run.id
+
+            records, total_cost = 0, 0.0
+            try:
+                prices = await self.price_source()
+                chunk_start = start
+                while chunk_start < end:
+                    chunk_end = min(end, chunk_start + timedelta(days=1))
+                    rows = await self._usage_rows(chunk_start, chunk_end, prices)
+                    await self._replace(chunk_start, chunk_end, rows)
+                    records += len(rows)
+                    total_cost += sum(row["total_cost"] for row in rows)
+                    chunk_start = chunk_end
+                status, error = "completed", None
+            except Exception as e:
+                status, error = "failed", str(e)
+                self.stats["failed_runs"] += 1
+                logger.error(f"Usage metering {start}..{end} failed: {error}")
+
+            async with get_async_session() as session:
+                await session.execute(update(UsageMeteringRun).where(UsageMeteringRun.id == run_id).values(
+                    status=status, records=records, total_cost=round(total_cost, 6),
+                    error=error, finished_at=datetime.utcnow()
+                ))
+            self.stats["runs"] += 1
+            self.stats["records_written"] += records
+            self.last_run = {
+                "id": run_id, "period_start": start.isoformat(), "period_end": end.isoformat(),
+                "status": status, "records": records, "total_cost": round(total_cost, 6),
+                "elapsed_seconds": round(time.perf_counter() - began, 2), "error": error
+            }
+            logger.info(f"Usage metering {start}..{end}: {status}, {records} records")
+            return self.last_run
+
+    async def _load_segments(self, start: datetime, end: datetime):
+        """State changes inside the period plus each server's state at its start"""
+        columns = (
+            ServerStateChange.id, ServerStateChange.server_id, ServerStateChange.status, ServerStateChange.server_type,
+            ServerStateChange.datacenter, ServerStateChange.monthly_cost, ServerStateChange.changed_at
+        )
+        before = (
+            select(func.max(ServerStateChange.id))
+            .where(ServerStateChange.changed_at < start)
+            .group_by(ServerStateChange.server_id)
+            .scalar_subquery()
+        )
+        async with get_async_session() as session:
+            rows = (await session.execute(select(*columns).where(ServerStateChange.id.in_(before)))).all()
+            rows += (await session.execute(select(*columns).where(
+                ServerStateChange.changed_at >= start, ServerStateChange.changed_at < end
+            ))).all()
+            owners = {}
+            server_ids = {row.server_id for row in rows}
+            if server_ids:
+                owners = dict((await session.execute(
+                    select(Server.id, Server.user_id).where(Server.id.in_(server_ids))
+                )).all())
+        return rows, owners
+
+    async def _usage_rows(self, start: datetime, end: datetime, prices: PriceTable) -> List[Dict[str, Any]]:
+        rows, owners = await self._load_segments(start, end)
+        if not rows:
+            return []
+        start_epoch, end_epoch = int(to_epoch([start])[0]), int(to_epoch([end])[0])
+
+        ids, sid, status, server_type, datacenter, monthly_cost, changed_at = zip(*rows)
+        sid = np.array(sid, dtype=np.int64)
+        changed = np.maximum(to_epoch(list(changed_at)), start_epoch)
+        order = np.lexsort((np.array(ids), changed, sid))
+        sid, changed = sid[order], changed[order]
+        status = np.array(status, dtype=object)[order]
+        server_type = np.array(server_type, dtype=object)[order]
+        location = np.array([location_of(name) for name in datacenter], dtype=object)[order]
+        monthly = np.array([np.nan if cost is None else cost for cost in monthly_cost], dtype=np.float64)[order]
+
+        # Each state lasts until the server's next change (or the end of the period)
+        seg_end = np.r_[changed[1:], end_epoch]
+        seg_end[np.r_[sid[1:] != sid[:-1], True]] = end_epoch
+        billed = ~np.isin(status, list(self.unbilled_statuses)) & (seg_end > changed)
+        index = np.flatnonzero(billed)
+
+        hourly = prices.hourly(server_type[index], location[index])
+        # A price stored on the server itself wins over the table
+        own = monthly[index] / self.hours_per_month
+        hourly = np.where(np.isnan(own), hourly, own)
+
+        segment, hours = expand_hours(changed[index], seg_end[index])
+        segment_price = hourly[segment]
+        hour_sid = sid[index][segment]
+        # Two states within one hour (a resize, say) bill the hour once, at the higher price
+        pick = np.lexsort((-np.nan_to_num(segment_price, nan=-1.0), hours, hour_sid))
+        first = np.r_[True, (hour_sid[pick][1:] != hour_sid[pick][:-1]) | (hours[pick][1:] != hours[pick][:-1])]
+        pick = pick[first]
+        hour_sid, hours, segment = hour_sid[pick], hours[pick], segment[pick]
+        unit_price = segment_price[pick]
+
+        unpriced = np.isnan(unit_price)
+        if unpriced.any():
+            self.stats["unpriced_hours"] += int(unpriced.sum())
+            missing = sorted({str(name) for name in server_type[index][segment][unpriced]})
+            logger.warning(f"No hourly price for server type(s) {', '.join(missing)}; billing those hours at 0")
+            unit_price = np.where(unpriced, 0.0, unit_price)
+
+        periods = np.datetime_as_string(hours.astype("datetime64[s]"), unit="M")
+        return [
+            {
+                "user_id": owners[int(server_id)],
+                "resource_type": "server",
+                "resource_id": int(server_id),
+                "usage_type": USAGE_TYPE,
+                "quantity": 1.0,
+                "unit": "hour",
+                "unit_price": float(price),
+                "total_cost": float(price),
+                "recorded_at": datetime.utcfromtimestamp(int(hour)),
+                "billing_period": str(period),
+            }
+            for server_id, hour, price, period in zip(hour_sid, hours, unit_price, periods)
+            if int(server_id) in owners
+        ]
+
+    async def _replace(self, start: datetime, end: datetime, rows: List[Dict[str, Any]]):
+        """Swap the period's server_hour records for `rows` in one transaction"""
+        table = UsageRecord.__table__
+        async with get_async_session() as session:
+            await session.execute(delete(table).where(
+                table.c.resource_type == "server",
+                table.c.usage_type == USAGE_TYPE,
+                table.c.recorded_at >= start,
+                table.c.recorded_at < end
+            ))
+            for offset in range(0, len(rows), self.batch_size):
+                await session.execute(insert(table), rows[offset:offset + self.batch_size])
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            "enabled": self.enabled,
+            "running": self._task is not None and not self._task.done(),
+            "run_in_progress": self._meter_lock.locked(),
+            "last_snapshot": self._last_snapshot.isoformat() if self._last_snapshot else None,
+            "last_run": self.last_run
+        }
+
+# Global metering engine instance
+usage_metering = UsageMeteringEngine()
@@ -0,0 +1,58 @@
+"""
+Quota reservation scripts against an in-memory Redis
+
+Needs fakeredis with Lua support (pip install "fakeredis[lua]"); the
+counter is loaded directly, so no database is involved.
+"""
+
+import asyncio
+
+import pytest
+
+fakeredis = pytest.importorskip("fakeredis")
+pytest.importorskip("lupa")
+
+from services.quotas import QuotaService
+
+COUNTER = "quota:{1:servers}"
+
+def make_service(monkeypatch) -> QuotaService:
+    monkeypatch.delenv("REDIS_URL", raising=False)
+    service = QuotaService()
+    service.use_redis(fakeredis.aioredis.FakeRedis(decode_responses=True))
+    return service
+
+async def load(service: QuotaService, limit: int = 3):
+    """Limit 3, nothing used or held: what _load would write for a fresh resource_quotas row"""
+    await service._load_script(keys=service._keys(1, "servers"), args=[limit, 0, 0, service.state_ttl])
+
+def test_commit_twice_counts_once(monkeypatch):
+    service = make_service(monkeypatch)
+
+    async def scenario():
+        await load(service)
+        reservation = await service.reserve(1, "servers", 1)
+        first = await service.commit(reservation.id)
+        second = await service.commit(reservation.id)
+        return first, second, await service.redis.hget(COUNTER, "used")
+
+    first, second, used = asyncio.run(scenario())
+    assert first["status"] == "committed" and first["committed"] == 1
+    assert second["status"] == "already_committed" and second["committed"] == 1
+    assert used == "1"
+
+def test_unknown_or_released_commit_counts_nothing(monkeypatch):
+    service = make_service(monkeypatch)
+
+    async def scenario():
+        await load(service)
+        made_up = await service.commit("r.1.servers.2.abcdefabcdef")
+        reservation = await service.reserve(1, "servers", 3)
+        await service.release(reservation.id)
+        released = await service.commit(reservation.id)
+        return made_up, released, await service.redis.hget(COUNTER, "used")
+
+    made_up, released, used = asyncio.run(scenario())
+    assert made_up["status"] == "unknown" and made_up["committed"] == 0
+    assert released["status"] == "released" and released["committed"] == 0
+    assert used == "0"
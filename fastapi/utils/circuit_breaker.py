@@ -0,0 +1,106 @@
+"""
+Per-endpoint circuit breakers for upstream calls
+closed -> open after repeated failures, open -> half_open after a cooldown,
+half_open -> closed on a successful probe (or back to open on failure)
+"""
+
+import os
+import re
+import time
+import logging
+from typing import Dict, Any, Optional
+
+from utils.exceptions import CircuitOpenException
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker"""
+    
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30.0, half_open_max_calls: int = 1):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.half_open_max_calls = half_open_max_calls
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.half_open_calls = 0
+        self.stats = {"successes": 0, "failures": 0, "rejected": 0, "opened": 0}
+    
+    def _transition(self, state: str):
+        if state != self.state:
+            logger.warning(f"Circuit breaker {self.name}: {self.state} -> {state}")
+            self.state = state
+    
+    def before_call(self):
+        """Raise CircuitOpenException if the call must fail fast"""
+        if self.state == OPEN:
+            remaining = self.reset_timeout - (time.monotonic() - self.opened_at)
+            if remaining > 0:
+                self.stats["rejected"] += 1
+                raise CircuitOpenException(self.name, retry_after=remaining)
+            self._transition(HALF_OPEN)
+            self.half_open_calls = 0
+        
+        if self.state == HALF_OPEN:
+            if self.half_open_calls >= self.half_open_max_calls:
+                self.stats["rejected"] += 1
+                raise CircuitOpenException(self.name, retry_after=1)
+            self.half_open_calls += 1
+    
+    def record_success(self):
+        self.stats["successes"] += 1
+        self.failures = 0
+        self._transition(CLOSED)
+    
+    def release(self):
+        """Return a half-open probe slot without recording an outcome"""
+        if self.state == HALF_OPEN and self.half_open_calls > 0:
+            self.half_open_calls -= 1
+    
+    def record_failure(self):
+        self.stats["failures"] += 1
+        self.failures += 1
+        if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+            self.stats["opened"] += 1
+            self._transition(OPEN)
+    
+    def get_state(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.failures,
+            **self.stats
+        }
+
+class CircuitBreakerRegistry:
+    """One breaker per logical endpoint (resource IDs collapsed to {id})"""
+    
+    def __init__(self, failure_threshold: Optional[int] = None, reset_timeout: Optional[float] = None):
+        self.failure_threshold = failure_threshold or int(os.getenv("CIRCUIT_BREAKER_FAILURES", "5"))
+        self.reset_timeout = reset_timeout or float(os.getenv("CIRCUIT_BREAKER_RESET_TIMEOUT", "30"))
+        self._breakers: Dict[str, CircuitBreaker] = {}
+    
+    @staticmethod
+    def endpoint_key(method: str, endpoint: str) -> str:
+        path = re.sub(r"/\d+", "/{id}", endpoint)
+        return f"{method} {path}"
+    
+    def get(self, method: str, endpoint: str) -> CircuitBreaker:
+        key = self.endpoint_key(method, endpoint)
+        breaker = self._breakers.get(key)
+        if breaker is None:
+            breaker = CircuitBreaker(key, self.failure_threshold, self.reset_timeout)
+            self._breakers[key] = breaker
+        return breaker
+    
+    def get_stats(self) -> Dict[str, Any]:
+        return {key: breaker.get_state() for key, breaker in self._breakers.items()}
+    
+    def any_open(self) -> bool:
+        return any(breaker.state == OPEN for breaker in self._breakers.values())
@@ -0,0 +1,222 @@
+"""
+Response compression with Accept-Encoding negotiation, and request body
+decompression for compressed uploads
+
+gzip is always available; zstd and brotli are used when their packages are
+installed. Bodies below a size threshold are sent as-is. Responses that
+carry an ETag (cached catalog data, hashed GET bodies) keep their compressed
+variants in a bounded LRU keyed by ETag and encoding, so hot payloads are
+compressed once. Streaming responses (no Content-Length) are not compressed:
+NDJSON/SSE consumers need each chunk as soon as it is written.
+"""
+
+import gzip
+import io
+import logging
+import zlib
+from collections import OrderedDict
+from typing import Callable, Dict, Optional, Tuple
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+logger = logging.getLogger(__name__)
+
+COMPRESSORS: Dict[str, Callable[[bytes], bytes]] = {
+    "gzip": lambda body: gzip.compress(body, compresslevel=6, mtime=0)
+}
+
+def _inflate(body: bytes, limit: int, wbits: int) -> bytes:
+    return zlib.decompressobj(wbits).decompress(body, limit + 1)
+
+# Request bodies: every decoder stops after limit + 1 bytes so oversized input is detected without inflating it all
+DECOMPRESSORS: Dict[str, Callable[[bytes, int], bytes]] = {
+    "gzip": lambda body, limit: _inflate(body, limit, 16 + zlib.MAX_WBITS),
+    "deflate": lambda body, limit: _inflate(body, limit, zlib.MAX_WBITS),
+}
+
+try:
+    import zstandard
+    _zstd = zstandard.ZstdCompressor(level=3)
+    COMPRESSORS["zstd"] = _zstd.compress
+    DECOMPRESSORS["zstd"] = lambda body, limit: zstandard.ZstdDecompressor().stream_reader(io.BytesIO(body)).read(limit + 1)
+except ImportError:
+    pass
+
+try:
+    import brotli
+    COMPRESSORS["br"] = lambda body: brotli.compress(body, quality=5)
+
+    def _unbrotli(body: bytes, limit: int) -> bytes:
+        decompressor = brotli.Decompressor()
+        chunks = [decompressor.process(body, output_buffer_limit=limit + 1)]
+        size = len(chunks[0])
+        # The rest of the input is buffered; drain it only while still under the limit
+        while size <= limit and not decompressor.is_finished():
+            chunk = decompressor.process(b"", output_buffer_limit=limit + 1 - size)
+            if not chunk:
+                raise brotli.error("Truncated brotli stream")
+            chunks.append(chunk)
+            size += len(chunk)
+        return b"".join(chunks)
+
+    DECOMPRESSORS["br"] = _unbrotli
+except ImportError:
+    pass
+
+# Server preference when the client weighs encodings equally
+PREFERENCE = ("zstd", "br", "gzip")
+
+COMPRESSIBLE_TYPES = ("application/json", "application/msgpack", "application/x-ndjson", "text/")
+
+class BodyTooLarge(ValueError):
+    """Decoded request body is larger than the caller's limit"""
+
+def decompress(body: bytes, encoding: Optional[str], limit: int) -> bytes:
+    """
+    Decode a request body by its Content-Encoding; raises ValueError for an
+    unsupported encoding or a corrupt body, and BodyTooLarge for more than
+    `limit` decoded bytes
+    """
+    encoding = (encoding or "identity").strip().lower()
+    if encoding == "identity":
+        data = body
+    elif encoding in DECOMPRESSORS:
+        try:
+            data = DECOMPRESSORS[encoding](body, limit)
+        except Exception as e:
+            raise ValueError(f"Invalid {encoding} body: {e}")
+    else:
+        raise ValueError(f"Unsupported Content-Encoding: {encoding}")
+    if len(data) > limit:
+        raise BodyTooLarge(f"Decoded body exceeds {limit} bytes")
+    return data
+
+def choose_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """Best available encoding from an Accept-Encoding header (q-values respected), or None"""
+    if not accept_encoding:
+        return None
+    weights: Dict[str, float] = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        weights[name.strip().lower()] = q
+    wildcard = weights.get("*", 0.0)
+    best, best_q = None, 0.0
+    for encoding in PREFERENCE:
+        if encoding not in COMPRESSORS:
+            continue
+        q = weights.get(encoding, wildcard)
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+class VariantCache:
+    """Byte-bounded LRU of compressed bodies keyed by (ETag, encoding)"""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._items: "OrderedDict[Tuple[str, str], bytes]" = OrderedDict()
+        self.stats = {"hits": 0, "misses": 0}
+
+    def get(self, key: Tuple[str, str]) -> Optional[bytes]:
+        body = self._items.get(key)
+        if body is None:
+            self.stats["misses"] += 1
+            return None
+        self._items.move_to_end(key)
+        self.stats["hits"] += 1
+        return body
+
+    def put(self, key: Tuple[str, str], body: bytes):
+        if len(body) > self.max_bytes:
+            return
+        previous = self._items.pop(key, None)
+        if previous is not None:
+            self.size -= len(previous)
+        self._items[key] = body
+        self.size += len(body)
+        while self.size > self.max_bytes:
+            _, evicted = self._items.popitem(last=False)
+            self.size -= len(evicted)
+
+    def get_stats(self) -> Dict[str, int]:
+        return {**self.stats, "entries": len(self._items), "bytes": self.size}
+
+class CompressionMiddleware:
+    """Compress buffered responses of at least `minimum_size` bytes"""
+
+    def __init__(self, app: ASGIApp, minimum_size: int = 1024, cache_max_bytes: int = 32 * 1024 * 1024):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.variants = VariantCache(cache_max_bytes)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or scope["method"] == "HEAD":
+            await self.app(scope, receive, send)
+            return
+
+        encoding = choose_encoding(Headers(scope=scope).get("accept-encoding"))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start: Optional[Message] = None
+        passthrough = False
+        chunks = []
+
+        async def send_wrapper(message: Message):
+            nonlocal start, passthrough
+            if message["type"] == "http.response.start":
+                headers = Headers(raw=message["headers"])
+                length = headers.get("content-length")
+                content_type = headers.get("content-type", "")
+                if (
+                    length is None
+                    or int(length) < self.minimum_size
+                    or "content-encoding" in headers
+                    or not content_type.startswith(COMPRESSIBLE_TYPES)
+                ):
+                    passthrough = True
+                    await send(message)
+                else:
+                    start = message
+                return
+
+            if passthrough or message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            chunks.append(message.get("body", b""))
+            if message.get("more_body", False):
+                return
+
+            headers = MutableHeaders(raw=start["headers"])
+            body = self._compress(b"".join(chunks), encoding, headers.get("etag"))
+            headers["Content-Encoding"] = encoding
+            headers["Content-Length"] = str(len(body))
+            headers.add_vary_header("Accept-Encoding")
+            if headers.get("etag") and not headers["etag"].startswith("W/"):
+                # Same content, different bytes: a weak tag still matches If-None-Match
+                headers["ETag"] = f"W/{headers['etag']}"
+            await send(start)
+            await send({"type": "http.response.body", "body": body})
+
+        await self.app(scope, receive, send_wrapper)
+
+    def _compress(self, body: bytes, encoding: str, etag: Optional[str]) -> bytes:
+        if not etag:
+            return COMPRESSORS[encoding](body)
+        key = (etag, encoding)
+        compressed = self.variants.get(key)
+        if compressed is None:
+            compressed = COMPRESSORS[encoding](body)
+            self.variants.put(key, compressed)
+        return compressed
@@ -0,0 +1,83 @@
+"""
+Vectorized time-series downsampling
+
+Series are (timestamps, values) float arrays sorted by time. Bucketed
+aggregates split the time range into equal-width buckets and reduce each
+with np.*.reduceat; LTTB (Largest-Triangle-Three-Buckets) keeps the points
+that preserve the visual shape of the series.
+"""
+
+from typing import Dict, Tuple
+
+import numpy as np
+
+AGGREGATES = ("avg", "min", "max", "minmax")
+METHODS = AGGREGATES + ("lttb",)
+
+def to_arrays(timestamps, values) -> Tuple[np.ndarray, np.ndarray]:
+    """Float arrays with NaN samples (gaps) removed"""
+    ts = np.asarray(timestamps, dtype=np.float64)
+    vs = np.asarray(values, dtype=np.float64)  # None -> NaN
+    keep = ~np.isnan(vs)
+    if not keep.all():
+        ts, vs = ts[keep], vs[keep]
+    return ts, vs
+
+def bucket_aggregate(ts: np.ndarray, vs: np.ndarray, points: int) -> Dict[str, np.ndarray]:
+    """
+    Reduce to at most `points` equal-width time buckets; every non-empty bucket
+    yields its start time plus min, max and avg
+    """
+    if len(ts) <= points:
+        return {"timestamps": ts, "min": vs, "max": vs, "avg": vs}
+    edges = np.linspace(ts[0], ts[-1], points + 1)
+    bucket = np.clip(np.searchsorted(edges, ts, side="right") - 1, 0, points - 1)
+    # Start index of every non-empty bucket (ts is sorted, so buckets are contiguous)
+    starts = np.flatnonzero(np.r_[True, bucket[1:] != bucket[:-1]])
+    counts = np.diff(np.r_[starts, len(vs)])
+    return {
+        "timestamps": edges[bucket[starts]],
+        "min": np.minimum.reduceat(vs, starts),
+        "max": np.maximum.reduceat(vs, starts),
+        "avg": np.add.reduceat(vs, starts) / counts,
+    }
+
+def lttb(ts: np.ndarray, vs: np.ndarray, points: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Largest-Triangle-Three-Buckets. Each bucket depends on the point picked in
+    the previous one, so buckets are walked in order, but the triangle areas
+    within a bucket are computed in one vector operation.
+    """
+    n = len(ts)
+    if points >= n or points < 3:
+        return ts, vs
+    # Interior buckets over points 1..n-2; the first and last points are always kept
+    bounds = np.linspace(1, n - 1, points - 1).astype(np.int64)
+    selected = np.empty(points, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    a = 0
+    for i in range(points - 2):
+        lo, hi = bounds[i], max(bounds[i + 1], bounds[i] + 1)
+        if i + 2 < len(bounds):
+            next_lo, next_hi = bounds[i + 1], max(bounds[i + 2], bounds[i + 1] + 1)
+            cx, cy = ts[next_lo:next_hi].mean(), vs[next_lo:next_hi].mean()
+        else:
+            cx, cy = ts[-1], vs[-1]
+        area = np.abs(
+            (ts[a] - cx) * (vs[lo:hi] - vs[a])
+            - (ts[a] - ts[lo:hi]) * (cy - vs[a])
+        )
+        a = lo + int(np.argmax(area))
+        selected[i + 1] = a
+    return ts[selected], vs[selected]
+
+def downsample(timestamps, values, points: int, method: str = "lttb") -> Dict[str, list]:
+    """Downsample one series to JSON-ready lists"""
+    ts, vs = to_arrays(timestamps, values)
+    if method == "lttb":
+        ts, vs = lttb(ts, vs, points)
+        return {"timestamps": ts.tolist(), "values": vs.tolist()}
+    buckets = bucket_aggregate(ts, vs, points)
+    if method == "minmax":
+        return {key: array.tolist() for key, array in buckets.items()}
+    return {"timestamps": buckets["timestamps"].tolist(), "values": buckets[method].tolist()}
@@ -152,4 +152,181 @@ class ValidationException(BaseAPIException):
             status_code=422,
             details=details,
             error_code="VALIDATION_ERROR"
+        )
+
+class DatabaseException(BaseAPIException):
+    """Exception for database operation errors"""
+    
+    def __init__(
+        self, 
+        message: str, 
+        operation: Optional[str] = None, 
+        table: Optional[str] = None,
+        details: Optional[Dict[str, Any]] = None
+    ):
+        super().__init__(
+            message=message,
+            status_code=500,
+            details=details,
+            error_code="DATABASE_ERROR"
+        )
+        self.operation = operation
+        self.table = table
+        
+        if operation:
+            self.details["operation"] = operation
+        if table:
+            self.details["table"] = table
+
+class AuthenticationException(BaseAPIException):
+    """Exception for authentication related errors"""
+    
+    def __init__(
+        self, 
+        message: str = "Authentication failed", 
+        details: Optional[Dict[str, Any]] = None
+    ):
+        super().__init__(
+            message=message,
+            status_code=401,
+            details=details,
+            error_code="AUTH_FAILED"
+        )
+
+class AuthorizationException(BaseAPIException):
+    """Exception for authorization/permission related errors"""
+    
+    def __init__(
+        self, 
+        message: str = "Insufficient permissions", 
+        required_permission: Optional[str] = None,
+        details: Optional[Dict[str, Any]] = None
+    ):
+        details = details or {}
+        if required_permission:
+            details["required_permission"] = required_permission
+            
+        super().__init__(
+            message=message,
+            status_code=403,
+            details=details,
+            error_code="INSUFFICIENT_PERMISSIONS"
+        )
+class QuotaExceededException(BaseAPIException):
+    """Exception for resource quota exceeded errors"""
+    
+    def __init__(
+        self, 
+        resource_type: str, 
+        current_usage: int, 
+        quota_limit: int,
+        user_id: Optional[int] = None
+    ):
+        message = f"Quota exceeded for {resource_type}: {current_usage}/{quota_limit}"
+        details = {
+            "resource_type": resource_type,
+            "current_usage": current_usage,
+            "quota_limit": quota_limit
+        }
+        
+        if user_id:
+            details["user_id"] = user_id
+            
+        super().__init__(
+            message=message,
+            status_code=429,
+            details=details,
+            error_code="QUOTA_EXCEEDED"
+        )
+
+class ResourceNotFoundException(BaseAPIException):
+    """Exception for resource not found errors"""
+    
+    def __init__(
+        self, 
+        resource_type: str, 
+        resource_id: Optional[str] = None,
+        details: Optional[Dict[str, Any]] = None
+    ):
+        message = f"{resource_type} not found"
+        if resource_id:
+            message += f" (ID: {resource_id})"
+            
+        details = details or {}
+        details["resource_type"] = resource_type
+        if resource_id:
+            details["resource_id"] = resource_id
+            
+        super().__init__(
+            message=message,
+            status_code=404,
+            details=details,
+            error_code="RESOURCE_NOT_FOUND"
+        )
+
+class ConflictException(BaseAPIException):
+    """Exception for resource conflict errors"""
+    
+    def __init__(
+        self, 
+        message: str, 
+        resource_type: Optional[str] = None,
+        conflict_reason: Optional[str] = None,
+        details: Optional[Dict[str, Any]] = None
+    ):
+        details = details or {}
+        if resource_type:
+            details["resource_type"] = resource_type
+        if conflict_reason:
+            details["conflict_reason"] = conflict_reason
+            
+        super().__init__(
+            message=message,
+            status_code=409,
+            details=details,
+            error_code="RESOURCE_CONFLICT"
+        )
+
+class RateLimitException(BaseAPIException):
+    """Exception for rate limiting errors"""
+    
+    def __init__(
+        self, 
+        message: str = "Rate limit exceeded", 
+        retry_after: Optional[int] = None,
+        limit_type: Optional[str] = None,
+        details: Optional[Dict[str, Any]] = None
+    ):
+        details = details or {}
+        if retry_after:
+            details["retry_after"] = retry_after
+        if limit_type:
+            details["limit_type"] = limit_type
+            
+        super().__init__(
+            message=message,
+            status_code=429,
+            details=details,
+            error_code="RATE_LIMIT_EXCEEDED"
+        )
+
+class CircuitOpenException(BaseAPIException):
+    """Exception raised while a circuit breaker is failing fast"""
+    
+    def __init__(
+        self, 
+        endpoint: str, 
+        retry_after: Optional[float] = None,
+        details: Optional[Dict[str, Any]] = None
+    ):
+        details = details or {}
+        details["endpoint"] = endpoint
+        if retry_after:
+            details["retry_after"] = max(1, int(retry_after))
+            
+        super().__init__(
+            message=f"Upstream temporarily unavailable (circuit open): {endpoint}",
+            status_code=503,
+            details=details,
+            error_code="CIRCUIT_OPEN"
         )
\ No newline at end of file
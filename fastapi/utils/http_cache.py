@@ -0,0 +1,112 @@
+"""
+HTTP conditional requests (ETag / If-None-Match)
+
+Cached representations carry a precomputed ETag, so routes can answer 304
+without encoding anything; ETagMiddleware covers every other JSON GET by
+hashing the buffered body once.
+"""
+
+import hashlib
+import json
+from typing import Any, Dict, Optional
+
+from fastapi import Request
+from fastapi.responses import Response
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from utils.serialization import FastResponse, negotiate, representation_etag
+
+def body_etag(body: bytes) -> str:
+    """Strong ETag for an encoded body"""
+    return f'"{hashlib.sha256(body).hexdigest()[:32]}"'
+
+def content_etag(value: Any) -> str:
+    """Strong ETag for a JSON-native value (canonical encoding, so key order does not matter)"""
+    return body_etag(json.dumps(value, sort_keys=True, separators=(",", ":"), default=str).encode())
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match uses weak comparison: W/ prefixes are ignored"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    bare = etag[2:] if etag.startswith("W/") else etag
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == bare:
+            return True
+    return False
+
+def not_modified(etag: str, headers: Optional[Dict[str, str]] = None) -> Response:
+    return Response(status_code=304, headers={**(headers or {}), "ETag": etag})
+
+def conditional_response(request: Request, content: Any, etag: str) -> Response:
+    """304 when the client already holds this representation, otherwise the encoded body with its ETag"""
+    media_type = negotiate(request)
+    etag = representation_etag(etag, media_type)
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return not_modified(etag, {"Vary": "Accept"})
+    return FastResponse(content, headers={"ETag": etag}, media_type=media_type)
+
+class ETagMiddleware:
+    """
+    Add ETags to buffered GET responses under a path prefix and turn matching
+    If-None-Match requests into 304s. Streaming responses (no Content-Length)
+    and large bodies pass through untouched; an ETag already set by the route
+    is reused instead of hashing the body.
+    """
+
+    def __init__(self, app: ASGIApp, path_prefix: str = "/", max_body_size: int = 16 * 1024 * 1024):
+        self.app = app
+        self.path_prefix = path_prefix
+        self.max_body_size = max_body_size
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if (
+            scope["type"] != "http"
+            or scope["method"] not in ("GET", "HEAD")
+            or not scope["path"].startswith(self.path_prefix)
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        if_none_match = Headers(scope=scope).get("if-none-match")
+        start: Optional[Message] = None
+        passthrough = False
+        chunks = []
+
+        async def send_wrapper(message: Message):
+            nonlocal start, passthrough
+            if message["type"] == "http.response.start":
+                headers = Headers(raw=message["headers"])
+                length = headers.get("content-length")
+                if message["status"] != 200 or length is None or int(length) > self.max_body_size:
+                    passthrough = True
+                    await send(message)
+                else:
+                    start = message
+                return
+
+            if passthrough or message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            chunks.append(message.get("body", b""))
+            if message.get("more_body", False):
+                return
+
+            body = b"".join(chunks)
+            headers = MutableHeaders(raw=start["headers"])
+            etag = headers.get("etag") or body_etag(body)
+            headers["ETag"] = etag
+            if etag_matches(if_none_match, etag):
+                del headers["content-length"]
+                start["status"] = 304
+                body = b""
+            await send(start)
+            await send({"type": "http.response.body", "body": body})
+
+        await self.app(scope, receive, send_wrapper)
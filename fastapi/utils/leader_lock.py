@@ -0,0 +1,45 @@
+"""
+Redis leader lock for background jobs that must run once per deployment
+
+SET NX EX with a per-instance token; the holder renews it on every pass.
+Without Redis (or when Redis errors) every instance acts as leader, which
+is what a single-process deployment needs anyway.
+"""
+
+import logging
+import uuid
+from typing import Any
+
+logger = logging.getLogger(__name__)
+
+class LeaderLock:
+    """Blocking calls; run acquire/release through asyncio.to_thread"""
+
+    def __init__(self, key: str, redis_manager: Any):
+        self.key = key
+        self.redis_manager = redis_manager
+        self.instance_id = uuid.uuid4().hex
+
+    def acquire(self, ttl: float) -> bool:
+        client = self.redis_manager.redis_client
+        if not client:
+            return True
+        ttl = max(1, int(ttl))
+        try:
+            if client.set(self.key, self.instance_id, nx=True, ex=ttl):
+                return True
+            if client.get(self.key) == self.instance_id:
+                client.expire(self.key, ttl)
+                return True
+            return False
+        except Exception as e:
+            logger.warning(f"Leader lock {self.key} unavailable: {str(e)}")
+            return True
+
+    def release(self):
+        client = self.redis_manager.redis_client
+        try:
+            if client and client.get(self.key) == self.instance_id:
+                client.delete(self.key)
+        except Exception:
+            pass
@@ -0,0 +1,46 @@
+"""
+Sparse fieldsets for list responses
+
+`?fields=id,name,status,public_net.ipv4.ip` keeps only the named attributes
+(dot paths reach into nested objects, lists are projected element-wise).
+The field list is parsed once into a tree that is then applied to every item.
+"""
+
+from typing import Any, Dict, List, Optional
+
+# Keep objects addressable even when the caller forgets to ask for it
+ALWAYS_INCLUDED = ("id",)
+
+FieldTree = Dict[str, Optional["FieldTree"]]
+
+def parse_fields(fields: Optional[str]) -> Optional[FieldTree]:
+    """'id,public_net.ipv4.ip' -> {"id": None, "public_net": {"ipv4": {"ip": None}}}; None selects everything"""
+    if not fields or not fields.strip():
+        return None
+    tree: FieldTree = {name: None for name in ALWAYS_INCLUDED}
+    for path in fields.split(","):
+        parts = [part for part in path.strip().split(".") if part]
+        node = tree
+        for index, part in enumerate(parts):
+            if index == len(parts) - 1:
+                node[part] = None
+                break
+            if part in node and node[part] is None:
+                # The whole object is already selected
+                break
+            node = node.setdefault(part, {})
+    return tree
+
+def project(value: Any, tree: Optional[FieldTree]) -> Any:
+    if tree is None:
+        return value
+    if isinstance(value, list):
+        return [project(item, tree) for item in value]
+    if not isinstance(value, dict):
+        return value
+    return {key: project(value[key], subtree) for key, subtree in tree.items() if key in value}
+
+def project_items(items: List[Dict[str, Any]], tree: Optional[FieldTree]) -> List[Dict[str, Any]]:
+    if tree is None:
+        return items
+    return [project(item, tree) for item in items]
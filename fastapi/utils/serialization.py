@@ -0,0 +1,85 @@
+"""
+Fast response encoding and content negotiation
+
+Route payloads are already JSON-native dicts (parsed Hetzner JSON wrapped in
+{"success", "data", "meta"}), so they are encoded directly with orjson
+instead of going through jsonable_encoder and the stdlib json module.
+Internal callers can ask for MessagePack with `Accept: application/msgpack`.
+"""
+
+from typing import Any, Dict, Optional
+
+import msgpack
+import orjson
+from fastapi import Request
+from fastapi.responses import Response
+
+JSON_MEDIA_TYPE = "application/json"
+MSGPACK_MEDIA_TYPE = "application/msgpack"
+MSGPACK_MEDIA_TYPES = (MSGPACK_MEDIA_TYPE, "application/x-msgpack", "application/vnd.msgpack")
+
+def _default(value: Any) -> str:
+    # Decimals and other stragglers from database rows
+    return str(value)
+
+def encode_json(content: Any) -> bytes:
+    return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS)
+
+def encode_msgpack(content: Any) -> bytes:
+    return msgpack.packb(content, default=_default, datetime=False, use_bin_type=True)
+
+ENCODERS = {JSON_MEDIA_TYPE: encode_json, MSGPACK_MEDIA_TYPE: encode_msgpack}
+
+def negotiate(request: Optional[Request]) -> str:
+    """MessagePack when the Accept header asks for it (and prefers it over JSON), JSON otherwise"""
+    accept = request.headers.get("accept", "") if request is not None else ""
+    if "msgpack" not in accept:
+        return JSON_MEDIA_TYPE
+    best, best_q = JSON_MEDIA_TYPE, -1.0
+    for part in accept.split(","):
+        media_type, _, params = part.strip().partition(";")
+        media_type = media_type.strip().lower()
+        q = 1.0
+        for param in params.split(";"):
+            name, _, value = param.strip().partition("=")
+            if name == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if media_type in MSGPACK_MEDIA_TYPES:
+            media_type = MSGPACK_MEDIA_TYPE
+        elif media_type not in (JSON_MEDIA_TYPE, "*/*", "application/*"):
+            continue
+        else:
+            media_type = JSON_MEDIA_TYPE
+        if q > best_q:
+            best, best_q = media_type, q
+    return best
+
+def representation_etag(etag: str, media_type: str) -> str:
+    """ETags are per representation: the MessagePack body gets its own tag"""
+    if media_type == JSON_MEDIA_TYPE:
+        return etag
+    return f'{etag[:-1]}-mp"'
+
+class FastResponse(Response):
+    """Response for JSON-native content, encoded in the negotiated format"""
+
+    media_type = JSON_MEDIA_TYPE
+
+    def __init__(
+        self,
+        content: Any,
+        status_code: int = 200,
+        headers: Optional[Dict[str, str]] = None,
+        media_type: str = JSON_MEDIA_TYPE
+    ):
+        super().__init__(content, status_code, {**(headers or {}), "Vary": "Accept"}, media_type)
+
+    def render(self, content: Any) -> bytes:
+        return ENCODERS[self.media_type](content)
+
+def api_response(request: Optional[Request], content: Any, status_code: int = 200, headers: Optional[Dict[str, str]] = None) -> FastResponse:
+    """Encode a route payload without jsonable_encoder, as JSON or MessagePack per Accept"""
+    return FastResponse(content, status_code, headers, negotiate(request))
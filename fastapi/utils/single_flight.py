@@ -0,0 +1,48 @@
+"""
+Single-flight request coalescing
+Concurrent callers asking for the same key share one in-flight call and its outcome
+"""
+
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+class SingleFlight:
+    """Deduplicate concurrent calls by key"""
+    
+    def __init__(self):
+        self._calls: Dict[Hashable, asyncio.Task] = {}
+        self.stats = {"executed": 0, "coalesced": 0}
+    
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Run fn once for all concurrent callers of key
+        The call runs in its own task, so one caller being cancelled does not
+        cancel it for the others; errors are re-raised to every caller
+        """
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._calls[key] = task
+            task.add_done_callback(lambda t: self._forget(key, t))
+            self.stats["executed"] += 1
+        else:
+            self.stats["coalesced"] += 1
+        return await asyncio.shield(task)
+    
+    def _forget(self, key: Hashable, task: asyncio.Task):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        if not task.cancelled():
+            # Retrieve the exception so it is not reported as unhandled when every caller went away
+            task.exception()
+    
+    def in_flight(self) -> int:
+        return len(self._calls)
+    
+    def get_stats(self) -> Dict[str, Any]:
+        total = self.stats["executed"] + self.stats["coalesced"]
+        return {
+            **self.stats,
+            "in_flight": self.in_flight(),
+            "coalesced_ratio": round(self.stats["coalesced"] / total, 4) if total else 0.0
+        }
\ No newline at end of file
@@ -0,0 +1,100 @@
+"""
+Streaming helpers for large list responses
+Emits items as NDJSON or as an incrementally written JSON array,
+and progress updates as Server-Sent Events
+"""
+
+import logging
+from typing import AsyncIterator, Dict, Any, List, Optional
+
+from fastapi.responses import StreamingResponse
+
+from utils.exceptions import BaseAPIException
+from utils.serialization import encode_json
+
+logger = logging.getLogger(__name__)
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+SSE_MEDIA_TYPE = "text/event-stream"
+STREAM_FORMATS = ("ndjson", "json")
+
+def _encode(value: Any) -> str:
+    return encode_json(value).decode()
+
+async def _ndjson_body(first: List[Dict[str, Any]], pages: AsyncIterator[List[Dict[str, Any]]]) -> AsyncIterator[str]:
+    page = first
+    try:
+        while True:
+            if page:
+                yield "".join(_encode(item) + "\n" for item in page)
+            page = await pages.__anext__()
+    except StopAsyncIteration:
+        return
+    except BaseAPIException as e:
+        # Headers are already sent, report the failure as a trailing record
+        logger.error(f"Stream aborted: {e.message}")
+        yield _encode({"error": e.to_dict()}) + "\n"
+
+async def _json_array_body(first: List[Dict[str, Any]], pages: AsyncIterator[List[Dict[str, Any]]]) -> AsyncIterator[str]:
+    # "success" is written last so a failure halfway through can still be reported
+    yield '{"data":['
+    page = first
+    count = 0
+    try:
+        while True:
+            if page:
+                prefix = "," if count else ""
+                yield prefix + ",".join(_encode(item) for item in page)
+                count += len(page)
+            page = await pages.__anext__()
+    except StopAsyncIteration:
+        yield f'],"meta":{{"total_entries":{count}}},"success":true}}'
+    except BaseAPIException as e:
+        logger.error(f"Stream aborted: {e.message}")
+        yield f'],"meta":{{"total_entries":{count}}},"success":false,"error":{_encode(e.to_dict())}}}'
+
+async def stream_pages(pages: AsyncIterator[List[Dict[str, Any]]], fmt: str = "ndjson") -> StreamingResponse:
+    """
+    Build a streaming response from an async iterator of pages
+    The first page is awaited eagerly so upstream errors still map to a proper status code
+    """
+    try:
+        first = await pages.__anext__()
+    except StopAsyncIteration:
+        first = []
+
+    if fmt == "ndjson":
+        return StreamingResponse(_ndjson_body(first, pages), media_type=NDJSON_MEDIA_TYPE)
+    return StreamingResponse(_json_array_body(first, pages), media_type="application/json")
+
+def sse_event(data: Any, event: Optional[str] = None, event_id: Optional[int] = None) -> str:
+    """Format one Server-Sent Event"""
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    if event:
+        lines.append(f"event: {event}")
+    lines.append(f"data: {_encode(data)}")
+    return "\n".join(lines) + "\n\n"
+
+async def _sse_body(batches: AsyncIterator[List[Dict[str, Any]]], event: str) -> AsyncIterator[str]:
+    try:
+        async for batch in batches:
+            if batch:
+                for item in batch:
+                    yield sse_event(item, event, item.get("version"))
+            else:
+                # Comment line: keeps proxies from closing an idle stream
+                yield ": keep-alive\n\n"
+        yield sse_event({"done": True}, "end")
+    except BaseAPIException as e:
+        logger.error(f"Event stream aborted: {e.message}")
+        yield sse_event(e.to_dict(), "error")
+
+def sse_response(batches: AsyncIterator[List[Dict[str, Any]]], event: str = "message") -> StreamingResponse:
+    """Stream batches of items as Server-Sent Events (an empty batch is sent as a heartbeat)"""
+    return StreamingResponse(
+        _sse_body(batches, event),
+        media_type=SSE_MEDIA_TYPE,
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
@@ -2,6 +2,8 @@
 
 namespace App\Services;
 
+use Illuminate\Http\Client\ConnectionException;
+use Illuminate\Http\Client\Response;
 use Illuminate\Support\Facades\Http;
 use Illuminate\Support\Facades\Log;
 use Illuminate\Support\Facades\Cache;
@@ -27,12 +29,21 @@ public function __construct()
      */
     private function makeRequest(string $method, string $endpoint, array $data = []): array
     {
-        $response = Http::withHeaders([
+        return $this->send($method, $endpoint, $data)->json();
+    }
+
+    /**
+     * Send a request and throw on failure
+     */
+    private function send(string $method, string $endpoint, array $data = [], array $headers = []): Response
+    {
+        $response = Http::withHeaders(array_merge([
             'X-Internal-Key' => $this->internalApiKey,
             'Content-Type' => 'application/json'
-        ])
+        ], $headers))
         ->timeout($this->timeout)
-        ->retry($this->retries, 1000)
+        // FastAPI already retries idempotent upstream calls; only retry here when the request never reached it
+        ->retry($this->retries, 1000, fn ($exception) => $exception instanceof ConnectionException, false)
         ->$method("{$this->baseUrl}/{$endpoint}", $data);
 
         if ($response->failed()) {
@@ -50,7 +61,34 @@ private function makeRequest(string $method, string $endpoint, array $data = [])
             );
         }
 
-        return $response->json();
+        return $response;
+    }
+
+    /**
+     * Cached GET: served locally for $ttl seconds, then revalidated with
+     * If-None-Match so an unchanged payload comes back as an empty 304
+     */
+    private function cachedGet(string $cacheKey, int $ttl, string $endpoint): array
+    {
+        $cached = Cache::get($cacheKey);
+        $cached = is_array($cached) && isset($cached['fresh_until']) ? $cached : null;
+        if ($cached && $cached['fresh_until'] > time()) {
+            return $cached['body'];
+        }
+
+        $headers = $cached && $cached['etag'] ? ['If-None-Match' => $cached['etag']] : [];
+        $response = $this->send('GET', $endpoint, [], $headers);
+        if ($response->status() === 304 && $cached) {
+            $body = $cached['body'];
+            $etag = $cached['etag'];
+        } else {
+            $body = $response->json();
+            $etag = $response->header('ETag') ?: null;
+        }
+
+        // Kept well past $ttl so the ETag is still around to revalidate against
+        Cache::put($cacheKey, ['etag' => $etag, 'body' => $body, 'fresh_until' => time() + $ttl], $ttl * 10);
+        return $body;
     }
 
     /**
@@ -58,9 +96,7 @@ private function makeRequest(string $method, string $endpoint, array $data = [])
      */
     public function listServers(): array
     {
-        return Cache::remember('servers.all', 60, function () {
-            return $this->makeRequest('GET', 'servers');
-        });
+        return $this->cachedGet('servers.all', 60, 'servers');
     }
 
     /**
@@ -68,9 +104,7 @@ public function listServers(): array
      */
     public function getServer(int $serverId): array
     {
-        return Cache::remember("server.{$serverId}", 30, function () use ($serverId) {
-            return $this->makeRequest('GET', "servers/{$serverId}");
-        });
+        return $this->cachedGet("server.{$serverId}", 30, "servers/{$serverId}");
     }
 
     /**
@@ -118,9 +152,10 @@ public function deleteServer(int $serverId): array
     /**
      * Get server metrics
      */
-    public function getServerMetrics(int $serverId): array
+    public function getServerMetrics(int $serverId, array $query = []): array
     {
-        return $this->makeRequest('GET', "servers/{$serverId}/metrics");
+        // $query: type (cpu, disk or network; all by default), start, end, step, points, downsample
+        return $this->makeRequest('GET', "servers/{$serverId}/metrics", $query);
     }
 
     /**
@@ -71,6 +71,7 @@ CREATE TABLE IF NOT EXISTS servers (
     ipv4_address VARCHAR(45),
     ipv6_address VARCHAR(255),
     labels JSON,
+    backup_enabled BOOLEAN DEFAULT FALSE,
     locked BOOLEAN DEFAULT FALSE,
     monthly_cost DECIMAL(10,2), -- Required by FastAPI model
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
@@ -211,6 +212,73 @@ CREATE TABLE IF NOT EXISTS server_metrics (
     INDEX idx_recorded_at (recorded_at)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
 
+-- Monthly partitions for server_metrics (optional, for large installs). The FastAPI
+-- retention engine drops expired months and adds upcoming ones when the table is
+-- listed in RETENTION_PARTITIONED_TABLES. MySQL does not allow foreign keys on
+-- partitioned tables and needs the partition column in the primary key:
+--
+-- ALTER TABLE server_metrics DROP FOREIGN KEY server_metrics_ibfk_1;
+-- ALTER TABLE server_metrics DROP PRIMARY KEY, ADD PRIMARY KEY (id, recorded_at);
+-- ALTER TABLE server_metrics PARTITION BY RANGE (UNIX_TIMESTAMP(recorded_at)) (
+--     PARTITION p202601 VALUES LESS THAN (UNIX_TIMESTAMP('2026-02-01')),
+--     PARTITION pmax VALUES LESS THAN MAXVALUE
+-- );
+
+-- Server metric rollups, maintained by the FastAPI rollup job (1 minute buckets)
+CREATE TABLE IF NOT EXISTS server_metrics_1m (
+    server_id BIGINT UNSIGNED NOT NULL,
+    metric_type VARCHAR(50) NOT NULL,
+    bucket_start TIMESTAMP NOT NULL,
+    sample_count INT UNSIGNED NOT NULL,
+    min_value DOUBLE NOT NULL,
+    max_value DOUBLE NOT NULL,
+    sum_value DOUBLE NOT NULL,
+    avg_value DOUBLE NOT NULL,
+    p95_value DOUBLE NOT NULL,
+    PRIMARY KEY (server_id, metric_type, bucket_start),
+    FOREIGN KEY (server_id) REFERENCES servers(id) ON DELETE CASCADE,
+    INDEX idx_bucket_start (bucket_start)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+-- Server metric rollups (1 hour buckets)
+CREATE TABLE IF NOT EXISTS server_metrics_1h (
+    server_id BIGINT UNSIGNED NOT NULL,
+    metric_type VARCHAR(50) NOT NULL,
+    bucket_start TIMESTAMP NOT NULL,
+    sample_count INT UNSIGNED NOT NULL,
+    min_value DOUBLE NOT NULL,
+    max_value DOUBLE NOT NULL,
+    sum_value DOUBLE NOT NULL,
+    avg_value DOUBLE NOT NULL,
+    p95_value DOUBLE NOT NULL,
+    PRIMARY KEY (server_id, metric_type, bucket_start),
+    FOREIGN KEY (server_id) REFERENCES servers(id) ON DELETE CASCADE,
+    INDEX idx_bucket_start (bucket_start)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+-- Server metric rollups (1 day buckets)
+CREATE TABLE IF NOT EXISTS server_metrics_1d (
+    server_id BIGINT UNSIGNED NOT NULL,
+    metric_type VARCHAR(50) NOT NULL,
+    bucket_start TIMESTAMP NOT NULL,
+    sample_count INT UNSIGNED NOT NULL,
+    min_value DOUBLE NOT NULL,
+    max_value DOUBLE NOT NULL,
+    sum_value DOUBLE NOT NULL,
+    avg_value DOUBLE NOT NULL,
+    p95_value DOUBLE NOT NULL,
+    PRIMARY KEY (server_id, metric_type, bucket_start),
+    FOREIGN KEY (server_id) REFERENCES servers(id) ON DELETE CASCADE,
+    INDEX idx_bucket_start (bucket_start)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+-- Rollup progress: every bucket starting before the watermark is complete
+CREATE TABLE IF NOT EXISTS metric_rollup_state (
+    tier VARCHAR(8) PRIMARY KEY,
+    watermark TIMESTAMP NOT NULL,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
 -- Server Actions/Operations Tracking
 CREATE TABLE IF NOT EXISTS server_actions (
     id BIGINT UNSIGNED AUTO_INCREMENT PRIMARY KEY,
@@ -265,6 +333,18 @@ CREATE TABLE IF NOT EXISTS resource_quotas (
     INDEX idx_resource_type (resource_type)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
 
+-- Reservations taken while the Redis quota counters are unavailable; unexpired
+-- rows count against the limit until they are committed or released
+CREATE TABLE IF NOT EXISTS quota_reservations (
+    reservation_id VARCHAR(100) PRIMARY KEY,
+    user_id BIGINT UNSIGNED NOT NULL,
+    resource_type VARCHAR(50) NOT NULL,
+    amount INT NOT NULL,
+    expires_at TIMESTAMP NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    INDEX idx_quota_reservations_counter (user_id, resource_type, expires_at)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
 -- =====================================================
 -- BILLING TABLES (SIMPLIFIED)
 -- =====================================================
@@ -291,6 +371,22 @@ CREATE TABLE IF NOT EXISTS invoices (
     INDEX idx_status (status)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
 
+-- Invoice generation runs (one per billing period; progress doubles as the resume checkpoint)
+CREATE TABLE IF NOT EXISTS invoice_runs (
+    id BIGINT UNSIGNED AUTO_INCREMENT PRIMARY KEY,
+    billing_period VARCHAR(7) UNIQUE NOT NULL, -- Format: YYYY-MM
+    status VARCHAR(20) NOT NULL DEFAULT 'running',
+    users_total INT UNSIGNED DEFAULT 0,
+    users_done INT UNSIGNED DEFAULT 0,
+    invoices_created INT UNSIGNED DEFAULT 0,
+    line_items_created INT UNSIGNED DEFAULT 0,
+    total_amount DECIMAL(12,2) DEFAULT 0,
+    error TEXT,
+    started_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    finished_at TIMESTAMP NULL,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
 -- Invoice Line Items
 CREATE TABLE IF NOT EXISTS invoice_line_items (
     id BIGINT UNSIGNED AUTO_INCREMENT PRIMARY KEY,
@@ -326,6 +422,34 @@ CREATE TABLE IF NOT EXISTS usage_records (
     INDEX idx_recorded_at (recorded_at)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
 
+-- Server state history for usage metering (status/type/price snapshots)
+CREATE TABLE IF NOT EXISTS server_state_changes (
+    id BIGINT UNSIGNED AUTO_INCREMENT PRIMARY KEY,
+    server_id BIGINT UNSIGNED NOT NULL,
+    status VARCHAR(50) NOT NULL,
+    server_type VARCHAR(50) NOT NULL,
+    datacenter VARCHAR(50),
+    monthly_cost DECIMAL(10,4),
+    changed_at TIMESTAMP NOT NULL,
+    FOREIGN KEY (server_id) REFERENCES servers(id) ON DELETE CASCADE,
+    INDEX idx_state_change_server_time (server_id, changed_at),
+    INDEX idx_state_change_time (changed_at)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+-- Usage metering runs; the latest completed period_end is the metering watermark
+CREATE TABLE IF NOT EXISTS usage_metering_runs (
+    id BIGINT UNSIGNED AUTO_INCREMENT PRIMARY KEY,
+    period_start TIMESTAMP NOT NULL,
+    period_end TIMESTAMP NOT NULL,
+    status VARCHAR(20) NOT NULL DEFAULT 'running',
+    records INT UNSIGNED DEFAULT 0,
+    total_cost DECIMAL(12,6) DEFAULT 0,
+    error TEXT,
+    started_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    finished_at TIMESTAMP NULL,
+    INDEX idx_period_end (period_end)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
 -- =====================================================
 -- SYSTEM TABLES FOR LARAVEL
 -- =====================================================